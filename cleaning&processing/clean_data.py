@@ -1,19 +1,60 @@
+# Cleans the raw timelines into results/clean/<i>.jsonl.gz and encodes users and posts as integers.
+#
+#   python clean_data.py [-b BASE] [-o OUT]          serial
+#   python clean_data.py [-b BASE] [-o OUT] -j 32    parallel, same output as the serial run
+#   --parquet also writes the posts as a Parquet store partitioned by day, OUT + '_parquet' (post_store.py);
+#   without it, an old store of OUT is removed, so readers never mix two runs
+#
+# Parallel mode runs in three phases:
+#   1. each worker cleans its own shard (a raw file, or a range of blocks of a
+#      block-compressed one, see blockgz.py) with shard-local ID dictionaries (ids in
+#      order of first appearance in the shard), writing it to OUT/_shards;
+#   2. the shard key lists are merged in file order into the global maps, which gives
+#      the same IDs as the serial run (a key gets its ID where it first appears);
+#   3. each worker rewrites its shards with the global IDs (numpy lookup tables); the
+#      shards of a split file are then concatenated into its final file.
+
 import gzip
 import os
 import json
 import sys
 import datetime
+import shutil
+from multiprocessing import Pool
 from tqdm import tqdm
 import re
 from collections import defaultdict
 
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data_collection'))
+import blockgz
+import post_store
+import records
+from did_registry import load_users
+from interning import UriStore
+
 # --- CONFIGURATION ---
 BASE_DEFAULT = '../data_collection/data'
 OUT_DEFAULT = 'results/clean'
-USER_MAP_FILE = 'results/enc_users.txt'
+USER_REGISTRY = 'results/enc_users'   # did_registry.py; imported from results/enc_users.txt the first time
 LANG_MAP_FILE = 'results/language_mapping.json'
+URI_STORE = 'results/enc_uris'   # binary post ID map (interning.py); 'python interning.py export' gives the old enc_uris.txt
 # ---------------------
 
+matcher = re.compile(r'(?!\b)@[\w.-]+\w+')
+MENTION_TYPE = 'app.bsky.richtext.facet#mention'
+
+# raw line -> record with only the fields read below (records.py)
+decode_raw = records.decoder(records.RAW)
+
+NULL_FIELDS = ['post_id', 'user_id', 'instance', 'date', 'text', 'langs', 'like_count', 'reply_count',
+               'repost_count', 'reply_to', 'replied_author', 'thread_root', 'thread_root_author',
+               'repost_from', 'reposted_author', 'quotes', 'quoted_author', 'labels']
+# Fields holding user IDs and post IDs: remapped by the merge phase of the parallel mode
+USER_FIELDS = ['user_id', 'replied_author', 'thread_root_author', 'reposted_author', 'quoted_author']
+POST_FIELDS = ['post_id', 'reply_to', 'thread_root', 'repost_from', 'quotes']
+
 def load_langmap():
     if not os.path.exists(LANG_MAP_FILE):
         print(f"WARNING: {LANG_MAP_FILE} not found. Languages will not be mapped.")
@@ -32,22 +73,6 @@ def load_langmap():
         print(f"Error loading lang map: {e}")
         return defaultdict(lambda: None)
 
-def load_enc_users():
-    res = dict()
-    # Se il file non c'è, non importa! Restituiamo un dizionario vuoto
-    # e lo riempiremo man mano che troviamo nuovi utenti.
-    if not os.path.exists(USER_MAP_FILE):
-        print(f"⚠️ {USER_MAP_FILE} not found. Building new map from scratch...")
-        return res
-
-    with open(USER_MAP_FILE, encoding='utf-8') as f:
-        while line := f.readline():
-            parts = line.rstrip().split()
-            if len(parts) >= 2:
-                i, k = parts[0], parts[1]
-                res[k] = int(i)
-    return res
-
 def gzip_iterator(BASE):
     if not os.path.exists(BASE):
         print(f"Error: {BASE} does not exist.")
@@ -84,282 +109,490 @@ def extract_did_from_uri(uri):
     except: pass
     return None
 
+
+class Encoder:
+    """key -> integer in order of first appearance (the user and post maps).
+
+    start is a dict, or a UriStore / DidRegistry, which intern in one call.
+    """
+
+    def __init__(self, start=None):
+        self.map = start if start is not None else dict()
+        self._intern = getattr(self.map, 'intern', None)
+
+    def __call__(self, key):
+        if self._intern is not None:
+            return self._intern(key)
+        if key not in self.map:
+            self.map[key] = len(self.map)
+        return self.map[key]
+
+
+def mention_keys(text):
+    """Mentions of a text found by the regex, in order: (matched string, mentioned handle)."""
+    return [(m, m[1:]) for m in matcher.findall(text)]
+
+
+def mention_facets(record, text):
+    """Mentions from the record facets: ((byte start, byte end), DID) in text order.
+
+    Works with the API/firehose names (byteStart, $type) and with atproto model dumps
+    (byte_start, py_type). Returns None if the facets are missing or do not fit the text.
+    """
+    facets = record.get('facets')
+    if facets is None:
+        return None
+    res = []
+    for facet in facets:
+        index = facet.get('index') or {}
+        start = index.get('byteStart', index.get('byte_start'))
+        end = index.get('byteEnd', index.get('byte_end'))
+        for feature in facet.get('features') or []:
+            if feature.get('$type', feature.get('py_type')) == MENTION_TYPE and feature.get('did'):
+                res.append(((start, end), feature['did']))
+    res.sort(key=lambda x: x[0][0] if isinstance(x[0][0], int) else -1)
+
+    data = text.encode('utf-8')
+    prev = 0
+    for (start, end), _ in res:
+        if not (isinstance(start, int) and isinstance(end, int) and prev <= start < end <= len(data)):
+            return None
+        try:
+            data[start:end].decode('utf-8')
+        except UnicodeDecodeError:  # offsets in the middle of a character
+            return None
+        prev = end
+    return res
+
+
+def record_mentions(record, text):
+    """Mentions of a post: from its facets (keyed by DID), or from the regex (keyed by handle) without facets."""
+    res = mention_facets(record, text)
+    if res is None:
+        return mention_keys(text)
+    return res
+
+
+def rewrite_mentions(text, mentions):
+    """Replaces each mention with '@<user ID>'.
+
+    mentions holds (byte span, user ID) for facet mentions, spliced in a single pass,
+    and (matched string, user ID) for regex mentions, replaced one after the other.
+    """
+    if not mentions:
+        return text
+    if not isinstance(mentions[0][0], str):
+        data = text.encode('utf-8')
+        parts, prev = [], 0
+        for (start, end), uid in mentions:
+            parts.append(data[prev:start])
+            parts.append(f"@{uid}".encode('utf-8'))
+            prev = end
+        parts.append(data[prev:])
+        return b''.join(parts).decode('utf-8')
+    for m, uid in mentions:
+        text = re.sub(pattern=m, repl=f"@{uid}", string=text)
+    return text
+
+
+def new_counts():
+    return dict({'total_lines': 0, 'bad_lines': 0, 'kept_lines': 0}, **{f: 0 for f in NULL_FIELDS})
+
+
+def clean_line(line, language_map, user_enc, uri_enc, counts):
+    """Cleans one raw line. Returns (clean object, mentions) or None if the line is dropped.
+
+    user_enc / uri_enc turn DIDs and URIs into IDs; they are called in the same order as
+    always, so a fresh Encoder gives IDs in order of first appearance. The text is
+    returned as it is: mentions holds (facet byte span or matched string, user ID)
+    for rewrite_mentions.
+    """
+    counts['total_lines'] += 1
+
+    post_id, user_id, instance = None, None, None
+    date, text, langs = None, None, None
+    like_count, reply_count, repost_count = None, None, None
+    reply_to, replied_author = None, None
+    thread_root, thread_root_author = None, None
+    repost_from, reposted_author = None, None
+    quotes, quoted_author = None, None
+    labels = None
+    mentions = []
+
+    try:
+        d = decode_raw(line)
+    except Exception:
+        counts['bad_lines'] += 1
+        return None
+
+    if 'record' in d: post_data = d 
+    elif 'post' in d: post_data = d['post']
+    else: 
+        counts['bad_lines'] += 1
+        return None
+
+    record = post_data.get('record', {})
+    t = record.get('createdAt', record.get('created_at'))
+
+    if t is None or not valid_time(t):
+        return None
+    counts['kept_lines'] += 1
+
+    # USER
+    handle = post_data.get('author', {}).get('did')
+    if not handle: handle = d.get('user')
+
+    if handle:
+        user_id = user_enc(handle)
+        if '.' in handle:
+            instance = '.'.join(handle.split('.')[1:])
+
+    # POST ID
+    uri = post_data.get('uri')
+    if uri:
+        post_id = uri_enc(uri + str(handle))
+
+    # DATE
+    t = t.replace('Z', '+00:00')
+    date = int(datetime.datetime.fromisoformat(t).strftime('%Y%m%d%H%M'))
+
+    # TEXT
+    text = record.get('text', '')
+    if text:
+        mentions = [(m, user_enc(key)) for m, key in record_mentions(record, text)]
+    else:
+        text = None 
+
+    # LANGS
+    raw_langs = record.get('langs', [])
+    if raw_langs:
+        if isinstance(raw_langs, list):
+            langs = [language_map[l.lower()] or l for l in raw_langs]
+        else:
+            langs = [language_map[raw_langs.lower()] or raw_langs]
+
+    # METRICS
+    like_count = post_data.get('like_count', 0)
+    reply_count = post_data.get('reply_count', 0)
+    repost_count = post_data.get('repost_count', 0)
+
+    # --- INTERACTIONS ---
+    reply_ref = d.get('reply') or record.get('reply')
+    if reply_ref:
+        # Reply
+        parent = reply_ref.get('parent')
+        if parent:
+            p_uri = parent.get('uri')
+            if p_uri:
+                reply_to = uri_enc(p_uri)
+
+                # ESTRAZIONE DID DA URI (New Logic)
+                p_auth = extract_did_from_uri(p_uri)
+                if not p_auth: 
+                    p_auth = parent.get('author', {}).get('did') # Try normal way
+
+                if p_auth:
+                    replied_author = user_enc(p_auth)
+
+        # Root
+        root = reply_ref.get('root')
+        if root:
+            r_uri = root.get('uri')
+            if r_uri:
+                thread_root = uri_enc(r_uri)
+
+                # ESTRAZIONE DID DA URI
+                r_auth = extract_did_from_uri(r_uri)
+                if not r_auth:
+                    r_auth = root.get('author', {}).get('did')
+
+                if r_auth:
+                    thread_root_author = user_enc(r_auth)
+
+    # Repost
+    post_author_did = post_data.get('author', {}).get('did')
+    current_user_did = d.get('user')
+    if current_user_did and post_author_did and current_user_did != post_author_did:
+        reposted_author = user_enc(post_author_did)
+        if uri: repost_from = post_id
+
+    # Quote
+    embed = post_data.get('embed') 
+    if embed and 'record' in embed:
+        quoted = embed['record']
+        if 'record' in quoted: quoted = quoted['record']
+
+        if quoted and 'uri' in quoted:
+            try:
+                q_uri = quoted.get('uri')
+                # ESTRAZIONE DID DA URI
+                q_auth = extract_did_from_uri(q_uri)
+                if not q_auth: q_auth = quoted.get('author', {}).get('did')
+
+                if q_uri:
+                    quotes = uri_enc(q_uri)
+                if q_auth:
+                    quoted_author = user_enc(q_auth)
+            except KeyError: pass
+
+    # Labels
+    lbs = post_data.get('labels')
+    if lbs is not None:
+        try:
+            if isinstance(lbs, list) and len(lbs) > 0 and isinstance(lbs[0], dict):
+                labels = [l.get('val') for l in lbs]
+            else: labels = lbs
+        except: labels = lbs
+
+    # Construct Object
+    clean_obj = {
+        'post_id': post_id,
+        'user_id': user_id,
+        'instance': instance,
+        'date': date,
+        'text': text,
+        'langs': langs,
+        'like_count': like_count,
+        'reply_count': reply_count,
+        'repost_count': repost_count,
+        'reply_to': reply_to,
+        'replied_author': replied_author,
+        'thread_root': thread_root,
+        'thread_root_author': thread_root_author,
+        'repost_from': repost_from,
+        'reposted_author': reposted_author,
+        'quotes': quotes,
+        'quoted_author': quoted_author,
+        'labels': labels
+    }
+
+    # --- EXPLICIT NULL COUNTING ---
+    for f in NULL_FIELDS:
+        if clean_obj[f] is None: counts[f] += 1
+
+    return clean_obj, mentions
+
+
+def clean_serial(files, OUT, language_map, user_map, ids, counts, parquet=False):
+    user_enc, uri_enc = Encoder(user_map), Encoder(ids)
+    sink = post_store.StagingWriter(os.path.join(OUT, '_parquet')) if parquet else None
+    for i, path in enumerate(files):
+        out_path = os.path.join(OUT, f"{i}.jsonl.gz")
+
+        # block-compressed chunks are decompressed by a few threads ahead of the cleaning
+        with gzip.open(out_path, 'wb') as f_out:
+            for line in tqdm(blockgz.iter_lines(path), desc=f"File {i}"):
+                res = clean_line(line, language_map, user_enc, uri_enc, counts)
+                if res is None:
+                    continue
+                clean_obj, mentions = res
+                if clean_obj['text']:
+                    clean_obj['text'] = rewrite_mentions(clean_obj['text'], mentions)
+                f_out.write((json.dumps(clean_obj) + '\n').encode('utf-8'))
+                if sink:
+                    sink.add(clean_obj)
+    if sink:
+        sink.close()
+
+
+#### PARALLEL MODE
+
+_language_map = None
+
+
+def _init_worker():
+    global _language_map
+    _language_map = load_langmap()
+
+
+def _shard_paths(shard_dir, i):
+    base = os.path.join(shard_dir, str(i))
+    return base + '.rows.jsonl.gz', base + '.ids.npz', base + '.keys.json', base + '.lut.npz'
+
+
+def _split_files(files, n_jobs):
+    """Shards (path, block range) in file order: large block-compressed files are cut so every worker gets work."""
+    sizes = [os.path.getsize(path) for path in files]
+    target = max(1, sum(sizes) // (n_jobs * 4))
+    shards, owner = [], []
+    for n, (path, size) in enumerate(zip(files, sizes)):
+        for rng in blockgz.split(path, max(1, round(size / target))):
+            shards.append((path, rng))
+            owner.append(n)
+    return shards, owner
+
+
+def _clean_shard(args):
+    """Phase 1: cleans one shard (a raw file or a block range of it) with local IDs. Returns its counters."""
+    i, path, rng, shard_dir = args
+    rows_path, ids_path, keys_path, _ = _shard_paths(shard_dir, i)
+    user_enc, uri_enc = Encoder(), Encoder()
+    counts = new_counts()
+    columns = {f: [] for f in USER_FIELDS + POST_FIELDS}
+
+    with gzip.open(rows_path, 'wb', compresslevel=1) as f_rows:
+        for line in blockgz.iter_lines(path, rng, threads=1):
+            res = clean_line(line, _language_map, user_enc, uri_enc, counts)
+            if res is None:
+                continue
+            clean_obj, mentions = res
+            for f in columns:
+                v = clean_obj.pop(f)
+                columns[f].append(-1 if v is None else v)
+            clean_obj['mentions'] = mentions
+            f_rows.write((json.dumps(clean_obj) + '\n').encode('utf-8'))
+
+    np.savez(ids_path, **{f: np.array(v, dtype=np.int64) for f, v in columns.items()})
+    # dicts keep insertion order: the keys are listed in order of first appearance
+    with open(keys_path, 'w', encoding='utf-8') as f:
+        json.dump({'users': list(user_enc.map), 'uris': list(uri_enc.map)}, f)
+    return counts
+
+
+def _assign_global(n_shards, shard_dir, user_map, ids):
+    """Phase 2: global IDs in shard order, and for each shard the local -> global lookup tables."""
+    user_enc, uri_enc = Encoder(user_map), Encoder(ids)
+    for i in tqdm(range(n_shards), desc="Merging IDs"):
+        _, _, keys_path, lut_path = _shard_paths(shard_dir, i)
+        with open(keys_path, encoding='utf-8') as f:
+            keys = json.load(f)
+        users = np.fromiter((user_enc(k) for k in keys['users']), dtype=np.int64, count=len(keys['users']))
+        uris = np.fromiter((uri_enc(k) for k in keys['uris']), dtype=np.int64, count=len(keys['uris']))
+        np.savez(lut_path, users=users, uris=uris)
+
+
+def _lookup(column, lut):
+    """Local IDs -> global IDs, with -1 (None) kept."""
+    res = np.full(len(column), -1, dtype=np.int64)
+    mask = column >= 0
+    res[mask] = lut[column[mask]]
+    return [None if v < 0 else v for v in res.tolist()]
+
+
+def _rewrite_shard(args):
+    """Phase 3: writes a shard with the global IDs to out_path."""
+    i, shard_dir, out_path, OUT, parquet = args
+    sink = post_store.StagingWriter(os.path.join(OUT, '_parquet'), prefix=i) if parquet else None
+    rows_path, ids_path, _, lut_path = _shard_paths(shard_dir, i)
+    lut = np.load(lut_path)
+    users, uris = lut['users'], lut['uris']
+    with np.load(ids_path) as cols:
+        columns = {f: _lookup(cols[f], users) for f in USER_FIELDS}
+        columns.update({f: _lookup(cols[f], uris) for f in POST_FIELDS})
+
+    with gzip.open(rows_path, 'rb') as f_rows, gzip.open(out_path, 'wb') as f_out:
+        for n, line in enumerate(f_rows):
+            row = json.loads(line)
+            mentions = row.pop('mentions')
+            if row['text']:
+                row['text'] = rewrite_mentions(row['text'], [(m, int(users[uid])) for m, uid in mentions])
+            clean_obj = {f: (columns[f][n] if f in columns else row[f]) for f in NULL_FIELDS}
+            f_out.write((json.dumps(clean_obj) + '\n').encode('utf-8'))
+            if sink:
+                sink.add(clean_obj)
+    if sink:
+        sink.close()
+    for p in (rows_path, ids_path, lut_path):
+        os.remove(p)
+    return i
+
+
+def clean_parallel(files, OUT, user_map, ids, counts, n_jobs, parquet=False):
+    shard_dir = os.path.join(OUT, '_shards')
+    os.makedirs(shard_dir, exist_ok=True)
+    shards, owner = _split_files(files, n_jobs)
+    split = {n for n in owner if owner.count(n) > 1}
+    out_paths = [os.path.join(shard_dir, f'{i}.out.jsonl.gz') if n in split else os.path.join(OUT, f"{n}.jsonl.gz")
+                 for i, n in enumerate(owner)]
+    if split:
+        print(f'{len(files)} files in {len(shards)} shards')
+    with Pool(n_jobs, initializer=_init_worker) as pool:
+        tasks = [(i, path, rng, shard_dir) for i, (path, rng) in enumerate(shards)]
+        for shard_counts in tqdm(pool.imap(_clean_shard, tasks), total=len(tasks), desc="Cleaning shards"):
+            for k, v in shard_counts.items():
+                counts[k] += v
+
+        _assign_global(len(shards), shard_dir, user_map, ids)
+
+        tasks = [(i, shard_dir, out_paths[i], OUT, parquet) for i in range(len(shards))]
+        for _ in tqdm(pool.imap_unordered(_rewrite_shard, tasks), total=len(tasks), desc="Writing files"):
+            pass
+
+    # gzip members can be concatenated: the parts of a split file are joined in order
+    for n in sorted(split):
+        with open(os.path.join(OUT, f"{n}.jsonl.gz"), 'wb') as f_out:
+            for i in (i for i, o in enumerate(owner) if o == n):
+                with open(out_paths[i], 'rb') as f_in:
+                    shutil.copyfileobj(f_in, f_out)
+    shutil.rmtree(shard_dir)
+
+
 if __name__ == '__main__':
     
     start = datetime.datetime.now()
     
     BASE = BASE_DEFAULT
     OUT = OUT_DEFAULT
+    N_JOBS = 1
+    PARQUET = False
     
     for i in range(len(sys.argv)):
         if sys.argv[i] == '-b': BASE = sys.argv[i+1]
         if sys.argv[i] == '-o': OUT = sys.argv[i+1]
+        if sys.argv[i] == '-j': N_JOBS = int(sys.argv[i+1])
+        if sys.argv[i] == '--parquet': PARQUET = True
+
+    if PARQUET and post_store.pa is None:
+        print("Error: --parquet needs pyarrow (pip install pyarrow).")
+        sys.exit(1)
     
     language_map = load_langmap()
-    user_map = load_enc_users()
-    ids = dict()
-    matcher = re.compile(r'(?!\b)@[\w.-]+\w+')
+    user_map = load_users(USER_REGISTRY)
+    # Post IDs: URIs are most of the memory, so they go to a compact store that spills to disk
+    ids = UriStore(URI_STORE)
 
     if not os.path.exists(OUT):
         os.makedirs(OUT)
         print('Created new folder:', OUT)
         
-    print(f'Processing files in {BASE} and saving to {OUT}')
+    print(f'Processing files in {BASE} and saving to {OUT}' + (f' with {N_JOBS} processes' if N_JOBS > 1 else ''))
 
     # --- VERBOSE COUNTERS ---
-    bad_lines = 0
-    total_lines = 0
-    kept_lines = 0
-    null_post_id = 0
-    null_user_id = 0
-    null_instance = 0
-    null_date = 0
-    null_text = 0
-    null_langs = 0
-    null_like_count = 0
-    null_reply_count = 0
-    null_repost_count = 0
-    null_reply_to = 0
-    null_replied_author = 0
-    null_thread_root = 0
-    null_thread_root_author = 0
-    null_repost_from = 0
-    null_reposted_author = 0
-    null_quotes = 0
-    null_quoted_author = 0
-    null_labels = 0
-
-    for i, path in enumerate(gzip_iterator(BASE)):
-        out_filename = f"{i}.jsonl.gz"
-        out_path = os.path.join(OUT, out_filename)
-        
-        with gzip.open(path, 'rb') as f_in:
-            with gzip.open(out_path, 'wb') as f_out: 
-                for line in tqdm(f_in, desc=f"File {i}"):
-                    total_lines += 1
-                    
-                    post_id, user_id, instance = None, None, None
-                    date, text, langs = None, None, None
-                    like_count, reply_count, repost_count = None, None, None
-                    reply_to, replied_author = None, None
-                    thread_root, thread_root_author = None, None
-                    repost_from, reposted_author = None, None
-                    quotes, quoted_author = None, None
-                    labels = None
-
-                    try:
-                        d = json.loads(line.decode('utf-8'))
-                    except Exception:
-                        bad_lines += 1
-                        continue
-                    
-                    if 'record' in d: post_data = d 
-                    elif 'post' in d: post_data = d['post']
-                    else: 
-                        bad_lines += 1
-                        continue
-
-                    record = post_data.get('record', {})
-                    t = record.get('createdAt', record.get('created_at'))
-                    
-                    if t is not None and valid_time(t):
-                        kept_lines += 1
-
-                        # USER
-                        handle = post_data.get('author', {}).get('did')
-                        if not handle: handle = d.get('user')
-
-                        if handle:
-                            if handle not in user_map:
-                                user_map[handle] = len(user_map)
-                            user_id = user_map[handle]
-                            if '.' in handle:
-                                instance = '.'.join(handle.split('.')[1:])
-                        
-                        # POST ID
-                        uri = post_data.get('uri')
-                        if uri:
-                            uri_key = uri + str(handle)
-                            if uri_key not in ids:
-                                ids[uri_key] = len(ids)
-                            post_id = ids[uri_key]
-                        
-                        # DATE
-                        t = t.replace('Z', '+00:00')
-                        date = int(datetime.datetime.fromisoformat(t).strftime('%Y%m%d%H%M'))
-
-                        # TEXT
-                        text = record.get('text', '')
-                        if text:
-                            for m in matcher.findall(text):
-                                m_clean = m[1:] 
-                                if m_clean not in user_map:
-                                    user_map[m_clean] = len(user_map)
-                                text = re.sub(pattern=m, repl=f"@{user_map[m_clean]}", string=text)
-                        else:
-                            text = None 
-
-                        # LANGS
-                        raw_langs = record.get('langs', [])
-                        if raw_langs:
-                            if isinstance(raw_langs, list):
-                                langs = [language_map[l.lower()] or l for l in raw_langs]
-                            else:
-                                langs = [language_map[raw_langs.lower()] or raw_langs]
-                        
-                        # METRICS
-                        like_count = post_data.get('like_count', 0)
-                        reply_count = post_data.get('reply_count', 0)
-                        repost_count = post_data.get('repost_count', 0)
-
-                        # --- INTERACTIONS ---
-                        reply_ref = d.get('reply') or record.get('reply')
-                        if reply_ref:
-                            # Reply
-                            parent = reply_ref.get('parent')
-                            if parent:
-                                p_uri = parent.get('uri')
-                                if p_uri:
-                                    if p_uri not in ids: ids[p_uri] = len(ids)
-                                    reply_to = ids[p_uri]
-                                    
-                                    # ESTRAZIONE DID DA URI (New Logic)
-                                    p_auth = extract_did_from_uri(p_uri)
-                                    if not p_auth: 
-                                        p_auth = parent.get('author', {}).get('did') # Try normal way
-
-                                    if p_auth:
-                                        if p_auth not in user_map: user_map[p_auth] = len(user_map)
-                                        replied_author = user_map[p_auth]
-                            
-                            # Root
-                            root = reply_ref.get('root')
-                            if root:
-                                r_uri = root.get('uri')
-                                if r_uri:
-                                    if r_uri not in ids: ids[r_uri] = len(ids)
-                                    thread_root = ids[r_uri]
-                                    
-                                    # ESTRAZIONE DID DA URI
-                                    r_auth = extract_did_from_uri(r_uri)
-                                    if not r_auth:
-                                        r_auth = root.get('author', {}).get('did')
-
-                                    if r_auth:
-                                        if r_auth not in user_map: user_map[r_auth] = len(user_map)
-                                        thread_root_author = user_map[r_auth]
-
-                        # Repost
-                        post_author_did = post_data.get('author', {}).get('did')
-                        current_user_did = d.get('user')
-                        if current_user_did and post_author_did and current_user_did != post_author_did:
-                            if post_author_did not in user_map: user_map[post_author_did] = len(user_map)
-                            reposted_author = user_map[post_author_did]
-                            if uri: repost_from = post_id
-                        
-                        # Quote
-                        embed = post_data.get('embed') 
-                        if embed and 'record' in embed:
-                            quoted = embed['record']
-                            if 'record' in quoted: quoted = quoted['record']
-                            
-                            if quoted and 'uri' in quoted:
-                                try:
-                                    q_uri = quoted.get('uri')
-                                    # ESTRAZIONE DID DA URI
-                                    q_auth = extract_did_from_uri(q_uri)
-                                    if not q_auth: q_auth = quoted.get('author', {}).get('did')
-                                    
-                                    if q_uri:
-                                        if q_uri not in ids: ids[q_uri] = len(ids)
-                                        quotes = ids[q_uri]
-                                    if q_auth:
-                                        if q_auth not in user_map: user_map[q_auth] = len(user_map)
-                                        quoted_author = user_map[q_auth]
-                                except KeyError: pass
-                                
-                        # Labels
-                        lbs = post_data.get('labels')
-                        if lbs is not None:
-                            try:
-                                if isinstance(lbs, list) and len(lbs) > 0 and isinstance(lbs[0], dict):
-                                    labels = [l.get('val') for l in lbs]
-                                else: labels = lbs
-                            except: labels = lbs
-
-                        # --- EXPLICIT NULL COUNTING ---
-                        if post_id is None: null_post_id += 1
-                        if user_id is None: null_user_id += 1
-                        if instance is None: null_instance += 1
-                        if date is None: null_date += 1
-                        if text is None: null_text += 1
-                        if langs is None: null_langs += 1
-                        if like_count is None: null_like_count += 1
-                        if reply_count is None: null_reply_count += 1
-                        if repost_count is None: null_repost_count += 1
-                        if reply_to is None: null_reply_to += 1
-                        if replied_author is None: null_replied_author += 1
-                        if thread_root is None: null_thread_root += 1
-                        if thread_root_author is None: null_thread_root_author += 1
-                        if repost_from is None: null_repost_from += 1
-                        if reposted_author is None: null_reposted_author += 1
-                        if quotes is None: null_quotes += 1
-                        if quoted_author is None: null_quoted_author += 1
-                        if labels is None: null_labels += 1
-                                
-                        # Construct Object
-                        clean_obj = {
-                            'post_id': post_id,
-                            'user_id': user_id,
-                            'instance': instance,
-                            'date': date,
-                            'text': text,
-                            'langs': langs,
-                            'like_count': like_count,
-                            'reply_count': reply_count,
-                            'repost_count': repost_count,
-                            'reply_to': reply_to,
-                            'replied_author': replied_author,
-                            'thread_root': thread_root,
-                            'thread_root_author': thread_root_author,
-                            'repost_from': repost_from,
-                            'reposted_author': reposted_author,
-                            'quotes': quotes,
-                            'quoted_author': quoted_author,
-                            'labels': labels
-                        }
-                        
-                        f_out.write((json.dumps(clean_obj) + '\n').encode('utf-8'))
+    counts = new_counts()
+
+    files = list(gzip_iterator(BASE))
+    PARQUET_OUT = post_store.parquet_dir(OUT)
+    # OUT is valid again only when this run ends and stamps it
+    if os.path.exists(os.path.join(OUT, post_store.STAMP_FILE)):
+        os.remove(os.path.join(OUT, post_store.STAMP_FILE))
+    if not PARQUET and os.path.exists(PARQUET_OUT):
+        print(f'Removing {PARQUET_OUT}, written by an earlier run (use --parquet to rebuild it)')
+        shutil.rmtree(PARQUET_OUT)
+    if PARQUET and os.path.exists(os.path.join(OUT, '_parquet')):
+        shutil.rmtree(os.path.join(OUT, '_parquet'))   # left by an interrupted run
+    if N_JOBS > 1:
+        clean_parallel(files, OUT, user_map, ids, counts, N_JOBS, PARQUET)
+    else:
+        clean_serial(files, OUT, language_map, user_map, ids, counts, PARQUET)
+    if PARQUET:
+        print(f"Partitioning the Parquet store by day into {PARQUET_OUT}...")
+        post_store.finish(os.path.join(OUT, '_parquet'), PARQUET_OUT)
+        post_store.write_stamp(PARQUET_OUT, start.isoformat())
+    post_store.write_stamp(OUT, start.isoformat())
 
     # Save maps
     print("\nSaving maps...")
-    with open(USER_MAP_FILE, 'w', encoding='utf-8') as f:  # <--- MODIFICA QUI
-        for u, i in user_map.items(): f.write(f'{i} {u}\n')
-    with open('results/enc_uris.txt', 'w', encoding='utf-8') as f:
-        for u, i in ids.items(): f.write(f'{i} {u}\n')
+    user_map.save()
+    user_map.close()
+    ids.save()
+    ids.close()
 
     # --- VERBOSE REPORT ---
     print(f'\ndone in {datetime.datetime.now() - start}')
-    print(f'total lines: {total_lines}')
-    print(f'bad lines: {bad_lines}')
-    print(f'kept lines: {kept_lines}')
+    print(f'total lines: {counts["total_lines"]}')
+    print(f'bad lines: {counts["bad_lines"]}')
+    print(f'kept lines: {counts["kept_lines"]}')
+    print()
+    for f in NULL_FIELDS:
+        print(f'null {f}: {counts[f]}')
     print()
-    print(f'null post_id: {null_post_id}')
-    print(f'null user_id: {null_user_id}')
-    print(f'null instance: {null_instance}')
-    print(f'null date: {null_date}')
-    print(f'null text: {null_text}')
-    print(f'null langs: {null_langs}')
-    print(f'null like_count: {null_like_count}')
-    print(f'null reply_count: {null_reply_count}')
-    print(f'null repost_count: {null_repost_count}')
-    print(f'null reply_to: {null_reply_to}')
-    print(f'null replied_author: {null_replied_author}')
-    print(f'null thread_root: {null_thread_root}')
-    print(f'null thread_root_author: {null_thread_root_author}')
-    print(f'null repost_from: {null_repost_from}')
-    print(f'null reposted_author: {null_reposted_author}')
-    print(f'null quotes: {null_quotes}')
-    print(f'null quoted_author: {null_quoted_author}')
-    print(f'null labels: {null_labels}')
-    print()
\ No newline at end of file
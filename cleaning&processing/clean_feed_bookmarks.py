@@ -1,14 +1,16 @@
 import gzip
 import os
-import json
 import sys
 import datetime
 from tqdm import tqdm
 
+import records
+from did_registry import load_users
+
 # --- CONFIGURAZIONE ---
 BASE_DEFAULT = '../data_collection/data'
 OUT_DEFAULT = 'results/clean_feed_bookmarks.csv.gz'
-USER_MAP_FILE = 'results/enc_users.txt'
+USER_REGISTRY = 'results/enc_users'   # did_registry.py; imported from results/enc_users.txt the first time
 FEED_MAP_FILE = 'results/enc_feeds.txt'
 # ---------------------
 
@@ -40,8 +42,9 @@ if __name__ == '__main__':
         if sys.argv[i] == '-b': BASE = sys.argv[i+1]
         if sys.argv[i] == '-o': OUT = sys.argv[i+1]
 
+    decode = records.decoder(records.FEED)
     print("Loading maps...")
-    user_map = load_map(USER_MAP_FILE)
+    user_map = load_users(USER_REGISTRY)
     feed_map = load_map(FEED_MAP_FILE)
     
     count = 0
@@ -54,7 +57,7 @@ if __name__ == '__main__':
             with gzip.open(path, 'rt', encoding='utf-8') as f:
                 for line in tqdm(f, desc=f"Reading {os.path.basename(path)}"):
                     try:
-                        d = json.loads(line)
+                        d = decode(line)
                     except: continue
 
                     # Logica originale semplice: Cerca uri generatori
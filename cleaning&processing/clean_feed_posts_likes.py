@@ -1,14 +1,16 @@
 import gzip
 import os
-import json
 import sys
 import datetime
 from tqdm import tqdm
 
+import records
+from did_registry import load_users
+
 # --- CONFIGURATION ---
 BASE_DEFAULT = '../data_collection/data'
 OUT_DEFAULT = 'results/clean_feed_likes.csv.gz'
-USER_MAP_FILE = 'results/enc_users.txt'
+USER_REGISTRY = 'results/enc_users'   # did_registry.py; imported from results/enc_users.txt the first time
 FEED_MAP_FILE = 'results/enc_feeds.txt'
 # ---------------------
 
@@ -48,8 +50,9 @@ if __name__ == '__main__':
         if sys.argv[i] == '-b': BASE = sys.argv[i+1]
         if sys.argv[i] == '-o': OUT = sys.argv[i+1]
 
+    decode = records.decoder(records.FEED)
     print("Loading maps...")
-    user_map = load_map(USER_MAP_FILE)
+    user_map = load_users(USER_REGISTRY)
     feed_map = load_map(FEED_MAP_FILE)
     
     # --- VERBOSE COUNTERS ---
@@ -71,7 +74,7 @@ if __name__ == '__main__':
             with gzip.open(path, 'rt', encoding='utf-8') as f:
                 for line in tqdm(f, desc=f"Reading {os.path.basename(path)}"):
                     total_lines += 1
-                    try: d = json.loads(line)
+                    try: d = decode(line)
                     except: 
                         bad_lines += 1
                         continue
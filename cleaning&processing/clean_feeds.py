@@ -5,10 +5,13 @@ import sys
 import datetime
 from tqdm import tqdm
 
+import records
+from did_registry import load_users
+
 # --- CONFIGURATION (Adapted for Windows/Folders) ---
 BASE_DEFAULT = '../data_collection/data'
 OUT_DEFAULT = 'results/clean_feeds.jsonl.gz'
-USER_MAP_FILE = 'results/enc_users.txt'
+USER_REGISTRY = 'results/enc_users'   # did_registry.py; imported from results/enc_users.txt the first time
 LANG_MAP_FILE = 'results/language_mapping.json'
 # ---------------------------------------------------
 
@@ -23,21 +26,6 @@ def load_langmap():
             return json.loads(content)
     except: return dict()
 
-def load_enc_users():
-    res = dict()
-    if not os.path.exists(USER_MAP_FILE):
-        print(f"Error: {USER_MAP_FILE} not found.")
-        return res 
-
-    # MODIFICATION: encoding utf-8
-    with open(USER_MAP_FILE, encoding='utf-8') as f:
-        while line := f.readline():
-            parts = line.rstrip().split()
-            if len(parts) >= 2:
-                i, k = parts[0], parts[1]
-                res[k] = int(i)
-    return res
-
 def gzip_iterator(BASE):
     if not os.path.exists(BASE): return
     files = sorted(os.listdir(BASE))
@@ -78,9 +66,10 @@ if __name__ == '__main__':
         if sys.argv[i] == '-b': BASE = sys.argv[i+1]
         if sys.argv[i] == '-o': OUT = sys.argv[i+1]
 
+    decode = records.decoder(records.FEED)
     print("Loading maps...")
     language_map = load_langmap()
-    user_map = load_enc_users()
+    user_map = load_users(USER_REGISTRY)
     
     # Local map for Feeds (URI -> ID)
     feed_ids = dict()
@@ -111,7 +100,7 @@ if __name__ == '__main__':
                 for line in tqdm(f, desc=f"Reading {os.path.basename(path)}"):
                     total_lines += 1
                     try:
-                        d = json.loads(line)
+                        d = decode(line)
                     except:
                         bad_lines += 1
                         continue
@@ -160,9 +149,7 @@ if __name__ == '__main__':
                     # Mapping
                     creator_id = None
                     if creator_did:
-                        if creator_did not in user_map:
-                            user_map[creator_did] = len(user_map)
-                        creator_id = user_map[creator_did]
+                        creator_id = user_map.intern(creator_did)
                     
                     feed_num_id = None
                     if uri:
@@ -186,9 +173,10 @@ if __name__ == '__main__':
 
     # Save Maps (Crucial for next steps)
     print("Saving updated maps...")
-    with open('results/enc_users_updated.txt', 'w', encoding='utf-8') as f:
-        for u, i in user_map.items(): f.write(f'{i} {u}\n')
-        
+    # New creators get the next free IDs in the shared registry (existing IDs do not change)
+    user_map.save()
+    user_map.close()
+
     with open('results/enc_feeds.txt', 'w', encoding='utf-8') as f:
         for u, i in feed_ids.items(): f.write(f'{i} {u}\n')
 
@@ -0,0 +1,203 @@
+# Binary DID <-> integer ID registry, shared by every stage that used to parse results/enc_users.txt.
+#
+# DID -> ID is a sorted array of 64-bit DID hashes with the ID of each one (binary search),
+# ID -> DID the offsets + blob layout of interning.py. Opening a registry maps a few files,
+# however many users it holds. DIDs met for the first time get the next free IDs and are
+# merged into the sorted arrays by save(), so an ID never changes once given: every stage
+# (clean_data.py, clean_feeds.py, encode_users.py, ...) numbers users the same way.
+#
+#   <folder>/blob.bin      the DIDs in ID order, back to back
+#   <folder>/offsets.npy   int64, offsets[i]:offsets[i+1] is the DID with ID i
+#   <folder>/hashes.npy    uint64 DID hashes, sorted
+#   <folder>/ids.npy       int64 ID of each hash
+#   <folder>/meta.json     {"count": ...}
+#
+# load_users('results/enc_users') imports results/enc_users.txt the first time, keeping its IDs.
+#
+# Usage:
+#   python did_registry.py import results/enc_users.txt results/enc_users
+#   python did_registry.py export results/enc_users results/enc_users.txt   (the old 'ID DID' text file)
+#   python did_registry.py stats results/enc_users
+
+import json
+import os
+import shutil
+import sys
+
+import numpy as np
+
+from interning import MEMORY_BUDGET, StringBlob, _Arrays, hash64
+
+# --- CONFIGURATION ---
+USER_REGISTRY = 'results/enc_users'
+# ---------------------
+
+
+def _save_npy(path, arr):
+    # write aside and rename: the old file may still be memory-mapped by this process
+    tmp = path + '.tmp.npy'
+    np.save(tmp, arr)
+    os.replace(tmp, path)
+
+
+class DidRegistry:
+    """DID -> dense integer ID and back.
+
+    Supports the dict operations the cleaning scripts use (in, [], get, len, items), plus
+    intern(did), which returns the ID of did giving it the next free one if it is new.
+    Not safe for two processes appending at the same time.
+    """
+
+    def __init__(self, folder, budget=MEMORY_BUDGET):
+        """New empty registry, saved to folder (replaced if it exists)."""
+        if os.path.exists(folder):
+            shutil.rmtree(folder)
+        self.folder = folder
+        self.blob = StringBlob(folder, budget, _Arrays(folder, budget))
+        self.hashes = np.zeros(0, dtype=np.uint64)
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.added = dict()   # DIDs not merged into the sorted arrays yet
+
+    @classmethod
+    def open(cls, folder, budget=MEMORY_BUDGET):
+        """Reopens a saved registry (memory-mapped)."""
+        self = cls.__new__(cls)
+        self.folder = folder
+        with open(os.path.join(folder, 'meta.json')) as f:
+            meta = json.load(f)
+        self.blob = StringBlob.open(folder, meta['count'], budget, _Arrays(folder, budget))
+        self.hashes = np.load(os.path.join(folder, 'hashes.npy'), mmap_mode='r').view(np.ndarray)
+        self.ids = np.load(os.path.join(folder, 'ids.npy'), mmap_mode='r').view(np.ndarray)
+        self.added = dict()
+        return self
+
+    @classmethod
+    def from_text(cls, path, folder, budget=MEMORY_BUDGET):
+        """Registry of the 'ID DID' lines of an enc_users.txt file, with the same IDs. Saved to folder."""
+        pairs = []
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2:
+                    pairs.append((int(parts[0]), parts[1]))
+        pairs.sort()
+        if any(i != n for n, (i, _) in enumerate(pairs)):
+            raise ValueError(f'{path}: the IDs are not 0..{len(pairs) - 1}, one per DID')
+
+        self = cls(folder, budget)
+        data = [did.encode('utf-8') for _, did in pairs]
+        del pairs
+        for d in data:
+            self.blob.append(d)
+        hashes = np.fromiter((hash64(d) for d in data), dtype=np.uint64, count=len(data))
+        order = np.argsort(hashes, kind='stable')
+        self.hashes, self.ids = hashes[order], order.astype(np.int64)
+        self.save()
+        return self
+
+    def __len__(self):
+        return len(self.blob)
+
+    def _lookup(self, data):
+        h = hash64(data)
+        hashes = self.hashes
+        j = int(hashes.searchsorted(np.uint64(h)))
+        # 64-bit hashes practically never collide, but equal ones are told apart by the DID
+        while j < len(hashes) and hashes.item(j) == h:
+            i = self.ids.item(j)
+            if self.blob.get(i) == data:
+                return i
+            j += 1
+        return None
+
+    def get(self, did, default=None):
+        i = self.added.get(did)
+        if i is None:
+            i = self._lookup(did.encode('utf-8'))
+        return default if i is None else i
+
+    def __contains__(self, did):
+        return self.get(did) is not None
+
+    def __getitem__(self, did):
+        i = self.get(did)
+        if i is None:
+            raise KeyError(did)
+        return i
+
+    def __setitem__(self, did, value):
+        # IDs are positional: only 'registry[did] = len(registry)' is meaningful
+        if value != len(self):
+            raise ValueError('DidRegistry assigns IDs in order: the new ID must be len(registry)')
+        self.intern(did)
+
+    def intern(self, did):
+        i = self.get(did)
+        if i is None:
+            i = self.blob.append(did.encode('utf-8'))
+            self.added[did] = i
+        return i
+
+    def key(self, i):
+        """The DID with ID i."""
+        return bytes(self.blob.get(i)).decode('utf-8')
+
+    def items(self):
+        for i in range(len(self)):
+            yield self.key(i), i
+
+    def save(self):
+        """Merges the new DIDs into the sorted arrays and writes the registry to its folder."""
+        if self.added:
+            new_h = np.fromiter((hash64(d.encode('utf-8')) for d in self.added), dtype=np.uint64, count=len(self.added))
+            new_i = np.fromiter(self.added.values(), dtype=np.int64, count=len(self.added))
+            order = np.argsort(new_h, kind='stable')
+            pos = np.searchsorted(self.hashes, new_h[order])
+            self.hashes = np.insert(self.hashes, pos, new_h[order])
+            self.ids = np.insert(self.ids, pos, new_i[order])
+            self.added = dict()
+
+        os.makedirs(self.folder, exist_ok=True)
+        self.blob.flush()
+        open(self.blob.path, 'ab').close()
+        _save_npy(os.path.join(self.folder, 'offsets.npy'), self.blob.offsets[:len(self) + 1])
+        _save_npy(os.path.join(self.folder, 'hashes.npy'), self.hashes)
+        _save_npy(os.path.join(self.folder, 'ids.npy'), self.ids)
+        with open(os.path.join(self.folder, 'meta.json'), 'w') as f:
+            json.dump({'count': len(self)}, f)
+
+    def close(self):
+        self.blob.close()
+
+
+def load_users(folder=USER_REGISTRY):
+    """The user registry in folder; the first time it is imported from folder + '.txt' (enc_users.txt) if that exists."""
+    if os.path.exists(os.path.join(folder, 'meta.json')):
+        return DidRegistry.open(folder)
+    text = folder + '.txt'
+    if os.path.exists(text):
+        print(f'Importing {text} into {folder}...')
+        return DidRegistry.from_text(text, folder)
+    print(f'{folder} not found. Building a new user registry...')
+    return DidRegistry(folder)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] not in ('import', 'export', 'stats'):
+        print('Usage: python did_registry.py import TEXT REGISTRY | export REGISTRY OUT.txt | stats REGISTRY')
+        sys.exit(1)
+
+    if sys.argv[1] == 'import':
+        reg = DidRegistry.from_text(sys.argv[2], sys.argv[3])
+        print(f'{len(reg)} users imported into {sys.argv[3]}')
+    else:
+        reg = DidRegistry.open(sys.argv[2])
+        if sys.argv[1] == 'export':
+            with open(sys.argv[3], 'w', encoding='utf-8') as f:
+                for did, i in reg.items():
+                    f.write(f'{i} {did}\n')
+            print(f'{len(reg)} users written to {sys.argv[3]}')
+        else:
+            size = sum(os.path.getsize(os.path.join(sys.argv[2], n)) for n in os.listdir(sys.argv[2]))
+            print(f'{len(reg)} users, {size / 2**20:.1f} MB on disk')
+    reg.close()
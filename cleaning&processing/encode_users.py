@@ -1,7 +1,8 @@
 import sys, os
 from tqdm import tqdm
 import gzip
-from collections import defaultdict
+
+from did_registry import load_users
 
 if __name__ == '__main__':
         
@@ -15,7 +16,8 @@ if __name__ == '__main__':
         os.makedirs(OUT_DIR)
         
     OUT = os.path.join(OUT_DIR, 'enc_edgelist.csv')
-    MAP_FILE = os.path.join(OUT_DIR, 'enc_users.txt')
+    # Shared with clean_data.py & co.: users keep the IDs they already have, new ones are appended
+    REGISTRY = os.path.join(OUT_DIR, 'enc_users')
 
     # Allow overriding via command line arguments
     for i in range(len(sys.argv)):
@@ -29,7 +31,8 @@ if __name__ == '__main__':
         print(f"Error: Input file '{BASE}' not found in current directory.")
         sys.exit(1)
 
-    enc = defaultdict(int)
+    enc = load_users(REGISTRY)
+    known = len(enc)
 
     print(f"Processing {BASE}...")
 
@@ -42,12 +45,7 @@ if __name__ == '__main__':
                 line = line.decode('utf-8').rstrip().split(',')
                 if line and len(line) == 2:
                     u, v = line
-
-                    if u not in enc:
-                        enc[u] = len(enc)
-                    if v not in enc:
-                        enc[v] = len(enc)
-                    outf.write(f'{enc[u]},{enc[v]}\n')
+                    outf.write(f'{enc.intern(u)},{enc.intern(v)}\n')
             
     print(f'Wrote {len(enc)} users to {OUT}')
     
@@ -60,8 +58,7 @@ if __name__ == '__main__':
         print("Warning: Could not run system sort (normal on Windows). Skipping.")
 
     # Save the user mapping (The Rosetta Stone)
-    with open(MAP_FILE, 'w', encoding='utf-8') as f:
-        for u, i in enc.items():
-            f.write(f'{i} {u}\n')
+    enc.save()
+    enc.close()
             
-    print(f'Wrote {len(enc)} users to {MAP_FILE}')
\ No newline at end of file
+    print(f'Wrote {len(enc)} users to {REGISTRY} ({len(enc) - known} new)')
\ No newline at end of file
@@ -4,6 +4,8 @@ import json
 import sys
 from tqdm import tqdm
 
+import records
+
 # --- CONFIGURATION ---
 # Path to raw data
 BASE_DIR = '../data_collection/data'
@@ -35,6 +37,7 @@ if __name__ == '__main__':
         os.makedirs('results')
 
     # 1. SCAN DATA
+    decode = records.decoder(records.RAW)
     file_count = 0
     for path in gzip_iterator(BASE_DIR):
         file_count += 1
@@ -42,7 +45,7 @@ if __name__ == '__main__':
             # Use tqdm to show progress
             for line in tqdm(f, desc=f"Scanning file {os.path.basename(path)}"):
                 try:
-                    d = json.loads(line.decode('utf-8'))
+                    d = decode(line)
                     
                     # Extract language list from record
                     record = d.get('post', {}).get('record', {})
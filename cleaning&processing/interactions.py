@@ -1,11 +1,12 @@
 import gzip
 import os
-import json
 import sys
 import datetime
 from tqdm import tqdm
 from datetime import datetime
 
+import records
+
 # --- CONFIGURATION ---
 BASE_DEFAULT = 'results/clean'
 OUT_DEFAULT = 'results/interactions.csv.gz'
@@ -45,6 +46,8 @@ if __name__ == '__main__':
     if not os.path.exists(out_dir):
         os.makedirs(out_dir)
 
+    # only the fields used below are decoded
+    decode = records.decoder(records.clean_schema(['user_id', 'replied_author', 'thread_root_author', 'reposted_author', 'quoted_author', 'date']))
     badlines = 0
     print(f'Reading cleaned files from: {BASE}')
     print(f'Saving interactions to: {OUT}')
@@ -55,7 +58,7 @@ if __name__ == '__main__':
             with gzip.open(path, 'rb') as f:
                 for line in tqdm(f, desc=f"Reading {os.path.basename(path)}"):
                     try:
-                        post = json.loads(line.decode('utf-8').strip())
+                        post = decode(line)
                     except Exception:
                         badlines += 1
                         continue
@@ -0,0 +1,292 @@
+# Compact string -> integer interning for clean_data.py's post ID map.
+#
+# A dict keyed by AT-URI strings costs ~150 bytes per post; here each string costs its
+# UTF-8 bytes in an append-only blob, 8 bytes of offset, and 16 bytes per slot of an
+# open-addressing hash table (64-bit hash + ID) kept at most half full. IDs are dense and
+# given in order of first appearance, exactly as with the dict.
+#
+# Arrays larger than a quarter of the memory budget are allocated as memory-mapped files
+# in the store folder, and the blob is flushed to its file past the same size, so RAM use
+# stays around the budget whatever the corpus size. A saved store reopens via mmap:
+#
+#   <folder>/blob.bin      the strings, back to back
+#   <folder>/offsets.npy   int64, offsets[i]:offsets[i+1] is the string with ID i
+#   <folder>/keys.npy      uint64 hash table (0 = empty slot)
+#   <folder>/vals.npy      int64 ID of each slot
+#   <folder>/meta.json     {"count": ..., "capacity": ...}
+#
+# Usage:
+#   python interning.py export results/enc_uris results/enc_uris.txt   (the old 'ID URI' text file)
+#   python interning.py stats results/enc_uris
+
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import sys
+
+import numpy as np
+
+# --- CONFIGURATION ---
+MEMORY_BUDGET = 4 * 1024**3   # bytes of RAM for tables, offsets and blob buffer
+INITIAL_CAPACITY = 1 << 16
+# ---------------------
+
+EMPTY = -1
+
+
+def hash64(data):
+    """64-bit hash of a byte string (never 0, which marks the empty slots)."""
+    h = int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+    return h or 1
+
+
+class _Arrays:
+    """Allocates numpy arrays in RAM, or as memory-mapped files in `folder` when they are large."""
+
+    def __init__(self, folder, budget):
+        self.folder = folder
+        self.limit = budget // 4
+        self.n = 0
+
+    def new(self, name, length, dtype, fill):
+        nbytes = length * np.dtype(dtype).itemsize
+        if self.folder is None or nbytes <= self.limit:
+            return np.full(length, fill, dtype=dtype)
+        os.makedirs(self.folder, exist_ok=True)
+        self.n += 1
+        path = os.path.join(self.folder, f'{name}.spill{self.n}')
+        arr = np.memmap(path, dtype=dtype, mode='w+', shape=(length,))
+        arr[:] = fill
+        # the file stays valid while the array is referenced; the name can go now
+        os.remove(path)
+        # plain ndarray view of the map: indexing a np.memmap is several times slower
+        return arr.view(np.ndarray)
+
+
+class StringBlob:
+    """Append-only store of byte strings: index -> bytes."""
+
+    def __init__(self, folder=None, budget=MEMORY_BUDGET, arrays=None):
+        self.folder = folder
+        self.arrays = arrays or _Arrays(folder, budget)
+        self.flush_at = budget // 4
+        self.path = os.path.join(folder, 'blob.bin') if folder else None
+        self.count = 0
+        self.offsets = self.arrays.new('offsets', INITIAL_CAPACITY, np.int64, 0)
+        self.flushed = 0          # bytes already in the file
+        self.tail = bytearray()   # bytes not flushed yet
+        self._mm = None
+
+    @classmethod
+    def open(cls, folder, count, budget=MEMORY_BUDGET, arrays=None):
+        blob = cls(folder, budget, arrays)
+        blob.count = count
+        blob.offsets = np.load(os.path.join(folder, 'offsets.npy'), mmap_mode='c').view(np.ndarray)
+        blob.flushed = int(blob.offsets[count])
+        # strings appended after the last save are not in the offsets: drop them
+        if os.path.getsize(blob.path) > blob.flushed:
+            os.truncate(blob.path, blob.flushed)
+        blob._remap()
+        return blob
+
+    def _remap(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self.flushed:
+            with open(self.path, 'rb') as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return self.count
+
+    def append(self, data):
+        """Adds a byte string and returns its index."""
+        if self.count + 1 >= len(self.offsets):
+            bigger = self.arrays.new('offsets', 2 * len(self.offsets), np.int64, 0)
+            bigger[:len(self.offsets)] = self.offsets
+            self.offsets = bigger
+        start = self.flushed + len(self.tail)
+        self.tail += data
+        self.offsets[self.count + 1] = start + len(data)
+        self.count += 1
+        if len(self.tail) >= self.flush_at and self.path:
+            self.flush()
+        return self.count - 1
+
+    def get(self, i):
+        start, end = self.offsets.item(i), self.offsets.item(i + 1)
+        if start >= self.flushed:
+            return bytes(self.tail[start - self.flushed:end - self.flushed])
+        return self._mm[start:end]
+
+    def flush(self):
+        if not self.tail or not self.path:
+            return
+        os.makedirs(self.folder, exist_ok=True)
+        with open(self.path, 'ab') as f:
+            f.write(self.tail)
+        self.flushed += len(self.tail)
+        self.tail = bytearray()
+        self._remap()
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+
+class UriStore:
+    """String -> dense integer ID, in order of first appearance (a compact dict for URIs).
+
+    Supports the dict operations clean_data's Encoder uses (in, [], len, items), plus
+    intern(key), which returns the ID of key adding it if needed in a single probe.
+    """
+
+    def __init__(self, folder=None, budget=MEMORY_BUDGET):
+        """New empty store; folder (if given) holds the spilled arrays and the saved store."""
+        self.folder = folder
+        self.budget = budget
+        self.arrays = _Arrays(folder, budget)
+        if folder and os.path.exists(folder):
+            shutil.rmtree(folder)
+        self.blob = StringBlob(folder, budget, self.arrays)
+        self._alloc_table(INITIAL_CAPACITY)
+
+    @classmethod
+    def open(cls, folder, budget=MEMORY_BUDGET):
+        """Reopens a saved store (memory-mapped, copy-on-write: changes need save())."""
+        self = cls.__new__(cls)
+        self.folder = folder
+        self.budget = budget
+        self.arrays = _Arrays(folder, budget)
+        with open(os.path.join(folder, 'meta.json')) as f:
+            meta = json.load(f)
+        self.blob = StringBlob.open(folder, meta['count'], budget, self.arrays)
+        self.keys = np.load(os.path.join(folder, 'keys.npy'), mmap_mode='c')
+        self.vals = np.load(os.path.join(folder, 'vals.npy'), mmap_mode='c')
+        self.mask = len(self.keys) - 1
+        return self
+
+    def _alloc_table(self, capacity):
+        self.keys = self.arrays.new('keys', capacity, np.uint64, 0)
+        self.vals = self.arrays.new('vals', capacity, np.int64, EMPTY)
+        self.mask = capacity - 1
+
+    def __len__(self):
+        return len(self.blob)
+
+    def _find(self, data, h):
+        """(slot, ID) of data, or (first empty slot of its probe sequence, EMPTY)."""
+        keys, vals, mask = self.keys, self.vals, self.mask
+        slot = h & mask
+        while True:
+            v = int(vals[slot])
+            if v == EMPTY:
+                return slot, EMPTY
+            if int(keys[slot]) == h and self.blob.get(v) == data:
+                return slot, v
+            slot = (slot + 1) & mask
+
+    def intern(self, key):
+        data = key.encode('utf-8')
+        h = hash64(data)
+        slot, v = self._find(data, h)
+        if v != EMPTY:
+            return v
+        v = self.blob.append(data)
+        self.keys[slot] = h
+        self.vals[slot] = v
+        if 2 * len(self) > len(self.keys):
+            self._grow()
+        return v
+
+    def get(self, key, default=None):
+        data = key.encode('utf-8')
+        _, v = self._find(data, hash64(data))
+        return default if v == EMPTY else v
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+        v = self.get(key)
+        if v is None:
+            raise KeyError(key)
+        return v
+
+    def __setitem__(self, key, value):
+        # IDs are positional: only 'store[key] = len(store)' is meaningful
+        if value != len(self):
+            raise ValueError('UriStore assigns IDs in order: the new ID must be len(store)')
+        self.intern(key)
+
+    def key(self, i):
+        """The string with ID i."""
+        return bytes(self.blob.get(i)).decode('utf-8')
+
+    def items(self):
+        for i in range(len(self)):
+            yield self.key(i), i
+
+    def _grow(self):
+        """Doubles the table, placing all the entries again with vectorized linear probing."""
+        used = self.vals != EMPTY
+        hashes = np.asarray(self.keys[used])
+        ids = np.asarray(self.vals[used])
+        self._alloc_table(2 * len(self.keys))
+        keys, vals, mask = self.keys, self.vals, np.uint64(self.mask)
+
+        pos = (hashes & mask).astype(np.int64)
+        pending = np.arange(len(hashes))
+        while len(pending):
+            slots = pos[pending]
+            # one winner per free slot in each round; the others move one slot on
+            _, first = np.unique(slots, return_index=True)
+            win = np.zeros(len(pending), dtype=bool)
+            win[first] = True
+            win &= vals[slots] == EMPTY
+            placed = pending[win]
+            keys[pos[placed]] = hashes[placed]
+            vals[pos[placed]] = ids[placed]
+            pending = pending[~win]
+            pos[pending] = (pos[pending] + 1) & self.mask
+
+    def save(self, folder=None):
+        """Writes the store to folder (default: its own), in the layout reopened by open()."""
+        folder = folder or self.folder
+        self.blob.flush()
+        os.makedirs(folder, exist_ok=True)
+        if self.blob.path != os.path.join(folder, 'blob.bin'):
+            if self.blob.path:
+                shutil.copyfile(self.blob.path, os.path.join(folder, 'blob.bin'))
+            else:
+                with open(os.path.join(folder, 'blob.bin'), 'wb') as f:
+                    f.write(self.blob.tail)
+        np.save(os.path.join(folder, 'offsets.npy'), self.blob.offsets[:len(self) + 1])
+        np.save(os.path.join(folder, 'keys.npy'), self.keys)
+        np.save(os.path.join(folder, 'vals.npy'), self.vals)
+        with open(os.path.join(folder, 'meta.json'), 'w') as f:
+            json.dump({'count': len(self), 'capacity': len(self.keys)}, f)
+
+    def close(self):
+        self.blob.close()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print('Usage: python interning.py export STORE OUT.txt | stats STORE')
+        sys.exit(1)
+
+    store = UriStore.open(sys.argv[2])
+    if sys.argv[1] == 'export':
+        with open(sys.argv[3], 'w', encoding='utf-8') as f:
+            for u, i in store.items():
+                f.write(f'{i} {u}\n')
+        print(f'{len(store)} strings written to {sys.argv[3]}')
+    else:
+        size = sum(os.path.getsize(os.path.join(sys.argv[2], n)) for n in os.listdir(sys.argv[2]))
+        print(f'{len(store)} strings, table capacity {len(store.keys)}, {size / 2**20:.1f} MB on disk')
+    store.close()
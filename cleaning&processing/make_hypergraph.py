@@ -1,32 +1,18 @@
 import gzip
 import os
-import json
 import sys
 import datetime
 from tqdm import tqdm
 
+import records
+from did_registry import load_users
+
 # --- CONFIGURATION ---
 BASE_DEFAULT = 'results/clean'
 OUT_DEFAULT = 'results/hypergraph.csv.gz'
+USER_REGISTRY = 'results/enc_users'   # did_registry.py; imported from results/enc_users.txt the first time
 # ---------------------
 
-def load_enc_users():
-    res = dict()
-    # WINDOWS MODIFICATION: Correct path and utf-8 encoding
-    map_file = 'results/enc_users.txt'
-    
-    if not os.path.exists(map_file):
-        print(f"Error: {map_file} not found.")
-        return res
-
-    with open(map_file, 'r', encoding='utf-8') as f:
-        while line := f.readline():
-            parts = line.rstrip().split()
-            if len(parts) >= 2:
-                i, k = parts[0], parts[1]
-                res[k] = int(i)
-    return res
-
 def gzip_iterator(BASE):
     if not os.path.exists(BASE):
         return
@@ -61,11 +47,13 @@ if __name__ == '__main__':
     
     # Load user map (Restored for fidelity)
     print("Loading user map...")
-    user_map = load_enc_users()
+    user_map = load_users(USER_REGISTRY)
     print(f"Loaded {len(user_map)} users.")
 
     print(f"Reading from {BASE} and writing to {OUT}")
     
+    decode = records.decoder(records.clean_schema(['user_id', 'thread_root', 'date']))
+
     # Line counter
     count = 0
 
@@ -75,7 +63,7 @@ if __name__ == '__main__':
             with gzip.open(path, 'rt', encoding='utf-8') as f:
                 for line in tqdm(f, desc=f"Reading {os.path.basename(path)}"):
                     try:
-                        d = json.loads(line)
+                        d = decode(line)
                     except:
                         continue
                     
@@ -0,0 +1,204 @@
+# Columnar copy of the clean posts: results/clean_parquet/day=YYYYMMDD/part-N.parquet
+#
+# clean_data.py --parquet writes it next to the JSON files (OUT + '_parquet'). Both stores
+# get the stamp of the run that wrote them (a _run file), and readers use the Parquet
+# store only when its stamp matches the JSON one. Columns are typed (nullable
+# int64 IDs, int32 counters, int64 date as YYYYMMDDHHMM), instances and langs are
+# dictionary-encoded, and the posts are partitioned by day, so a reader opens only the
+# days it needs and decodes only the columns it asks for:
+#
+#   for day, rows in clean_files(BASE, ['user_id', 'date'], days=(20240101, 20240131)):
+#       for d in rows: ...
+#
+# clean_files also reads the results/clean/*.jsonl.gz files (same rows, decoding only the
+# requested fields with records.py), so the experiments scripts work with either store. pyarrow is only needed for Parquet.
+
+import gzip
+import json
+import os
+import shutil
+
+import records
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:  # optional: only the Parquet store needs it
+    pa = None
+
+# --- CONFIGURATION ---
+FLUSH_ROWS = 500_000   # rows buffered before a staging file is written
+COMPRESSION = 'zstd'
+STAMP_FILE = '_run'   # ignored by pyarrow (leading underscore) and by the .gz listing
+# ---------------------
+
+if pa is not None:
+    _dict = pa.dictionary(pa.int32(), pa.string())
+    SCHEMA = pa.schema([
+        ('post_id', pa.int64()), ('user_id', pa.int64()), ('instance', _dict),
+        ('date', pa.int64()), ('text', pa.string()), ('langs', pa.list_(_dict)),
+        ('like_count', pa.int32()), ('reply_count', pa.int32()), ('repost_count', pa.int32()),
+        ('reply_to', pa.int64()), ('replied_author', pa.int64()),
+        ('thread_root', pa.int64()), ('thread_root_author', pa.int64()),
+        ('repost_from', pa.int64()), ('reposted_author', pa.int64()),
+        ('quotes', pa.int64()), ('quoted_author', pa.int64()),
+        ('labels', pa.list_(pa.string())),
+        ('day', pa.int32()),
+    ])
+
+
+def _labels(v):
+    # labels are a list of values in the clean JSON, but raw dumps can hold anything
+    if v is None:
+        return None
+    if not isinstance(v, list):
+        v = [v]
+    return [l if l is None or isinstance(l, str) else json.dumps(l) for l in v]
+
+
+class StagingWriter:
+    """Writes clean posts to unpartitioned Parquet files <folder>/<prefix>-<n>.parquet, FLUSH_ROWS at a time.
+
+    finish() then partitions all the staging files by day. File names sort in the order
+    the rows were written, so the final store keeps the order of the JSON files.
+    """
+
+    def __init__(self, folder, prefix=0, flush_rows=FLUSH_ROWS):
+        os.makedirs(folder, exist_ok=True)
+        self.folder = folder
+        self.prefix = prefix
+        self.flush_rows = flush_rows
+        self.n = 0
+        self.columns = {f: [] for f in SCHEMA.names}
+
+    def add(self, clean_obj):
+        for f in SCHEMA.names[:-2]:
+            self.columns[f].append(clean_obj[f])
+        self.columns['labels'].append(_labels(clean_obj['labels']))
+        self.columns['day'].append(clean_obj['date'] // 10000)
+        if len(self.columns['day']) >= self.flush_rows:
+            self.flush()
+
+    def flush(self):
+        if not self.columns['day']:
+            return
+        table = pa.Table.from_pydict(self.columns, schema=SCHEMA)
+        pq.write_table(table, os.path.join(self.folder, f'{self.prefix:05d}-{self.n:05d}.parquet'), compression='lz4')
+        self.n += 1
+        self.columns = {f: [] for f in SCHEMA.names}
+
+    def close(self):
+        self.flush()
+
+
+def finish(staging, out):
+    """Partitions the staging files by day into out (replaced), then removes them."""
+    files = sorted(os.path.join(staging, f) for f in os.listdir(staging) if f.endswith('.parquet'))
+    if os.path.exists(out):
+        shutil.rmtree(out)
+    if files:
+        ds.write_dataset(
+            ds.dataset(files, schema=SCHEMA, format='parquet'), out, format='parquet',
+            partitioning=ds.partitioning(pa.schema([('day', pa.int32())]), flavor='hive'),
+            basename_template='part-{i}.parquet', preserve_order=True,
+            file_options=ds.ParquetFileFormat().make_write_options(compression=COMPRESSION))
+    shutil.rmtree(staging)
+
+
+def parquet_dir(json_dir):
+    """The Parquet store of a folder of clean JSON files: results/clean -> results/clean_parquet."""
+    return os.path.normpath(json_dir) + '_parquet'
+
+
+def write_stamp(folder, stamp):
+    with open(os.path.join(folder, STAMP_FILE), 'w') as f:
+        f.write(stamp + '\n')
+
+
+def read_stamp(folder):
+    try:
+        with open(os.path.join(folder, STAMP_FILE)) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+#### READING
+
+def is_parquet(base):
+    return os.path.isdir(base) and any(f.startswith('day=') for f in os.listdir(base))
+
+
+def pick_base(json_dir):
+    """The Parquet store of json_dir if it was written by the same clean_data.py run and pyarrow is installed, else json_dir.
+
+    A Parquet store given directly is returned as it is.
+    """
+    if is_parquet(json_dir):
+        return json_dir
+    pq_dir = parquet_dir(json_dir)
+    if pa is not None and is_parquet(pq_dir):
+        stamp = read_stamp(json_dir)
+        if stamp is not None and stamp == read_stamp(pq_dir):
+            return pq_dir
+        print(f'{pq_dir} was not written with {json_dir}: reading the JSON files.')
+    return json_dir
+
+
+def parse_days(arg):
+    """'20240101:20240131', '20240101:' or ':20240131' -> (first, last) day, inclusive."""
+    lo, _, hi = arg.partition(':')
+    return int(lo) if lo else 0, int(hi) if hi else 99999999
+
+
+def _parquet_rows(path, columns):
+    for batch in ds.dataset(path, format='parquet').to_batches(columns=columns):
+        yield from batch.to_pylist()
+
+
+def _json_rows(path, columns, days):
+    # only the requested columns (and the date, for the day filter) are decoded
+    columns = list(columns or records.CLEAN_FIELDS)
+    decode = records.decoder(records.clean_schema(dict.fromkeys(columns + ['date'])))
+    with gzip.open(path, 'rb') as f:
+        for line in f:
+            try:
+                d = decode(line)
+            except Exception:
+                continue
+            if days and not days[0] <= (d.get('date') or 0) // 10000 <= days[1]:
+                continue
+            yield {c: d.get(c) for c in columns}
+
+
+def clean_files(base, columns=None, days=None):
+    """Yields (name, rows) for each file of the clean posts in base; rows yields dicts.
+
+    base is a Parquet store (one item per day partition, named by the day) or a folder of
+    clean .jsonl.gz files (named by file number). columns limits the fields of each row,
+    days = (first, last) the days read: with Parquet, only those partitions are opened.
+    """
+    if not os.path.exists(base):
+        print(f"Error: Directory {base} not found.")
+        return
+
+    if is_parquet(base):
+        if pa is None:
+            print(f"Error: {base} is a Parquet store and pyarrow is not installed.")
+            return
+        parts = sorted(int(f.split('=')[1]) for f in os.listdir(base) if f.startswith('day='))
+        for day in parts:
+            if days and not days[0] <= day <= days[1]:
+                continue
+            path = os.path.join(base, f'day={day}')
+            print(f'processing {path}...')
+            yield str(day), _parquet_rows(path, columns)
+        return
+
+    files = sorted([f for f in os.listdir(base) if f.endswith('.gz')],
+                   key=lambda x: int(x.split('.')[0]) if x[0].isdigit() else x)
+    for f in files:
+        path = os.path.join(base, f)
+        print(f'processing {path}...')
+        yield f.split('.')[0], _json_rows(path, columns, days)
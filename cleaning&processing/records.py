@@ -0,0 +1,234 @@
+# Shared decoding of the JSON lines read by the cleaning and experiments scripts.
+#
+# Each kind of line has a declared schema: RAW (timeline items written by the crawlers and
+# the stream, read by clean_data.py), CLEAN (the results/clean posts) and FEED (feed
+# generators and feed likes). decoder(schema) returns a function bytes/str -> record:
+#   - with msgspec installed, lines are decoded straight into the schema structs, and every
+#     field that is not declared (viewer states, profile details, images, ...) is skipped
+#     without building it;
+#   - otherwise with orjson, otherwise with the json module, as whole dicts.
+# Records answer the dict operations the scripts use (d.get(k, default), k in d, d[k]) with
+# the JSON key names, so the same code runs on structs and on dicts, and like an empty dict
+# a record with none of its fields present is false. A line that does not
+# fit its schema (an unexpected type somewhere) is decoded again as a dict, so nothing is
+# lost; malformed JSON raises, as with json.loads.
+#
+# BSKY_JSON_BACKEND=msgspec|orjson|json forces a backend.
+#
+# Usage:
+#   python records.py bench FILE.jsonl.gz [raw|clean|feed]   (records/s of each backend on a chunk file)
+
+import gzip
+import json
+import os
+import sys
+import time
+from typing import Any, Union
+
+try:
+    import msgspec
+    from msgspec import UNSET, UnsetType
+except ImportError:  # optional: the dict backends need nothing
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# --- CONFIGURATION ---
+BACKEND = os.environ.get('BSKY_JSON_BACKEND') or ('msgspec' if msgspec else 'orjson' if orjson else 'json')
+# ---------------------
+
+CLEAN_FIELDS = ['post_id', 'user_id', 'instance', 'date', 'text', 'langs', 'like_count', 'reply_count',
+                'repost_count', 'reply_to', 'replied_author', 'thread_root', 'thread_root_author',
+                'repost_from', 'reposted_author', 'quotes', 'quoted_author', 'labels']
+
+RAW, CLEAN, FEED = 'raw', 'clean', 'feed'
+
+if msgspec is not None:
+    # JSON keys that are not valid attribute names
+    _RENAMED = {'$type': 'type'}
+
+    class Record(msgspec.Struct, kw_only=True):
+        """Base of the schema structs: dict-style read access by JSON key, absent keys give the default."""
+
+        def get(self, key, default=None):
+            v = getattr(self, _RENAMED.get(key, key), UNSET)
+            return default if v is UNSET else v
+
+        def __contains__(self, key):
+            return getattr(self, _RENAMED.get(key, key), UNSET) is not UNSET
+
+        def __getitem__(self, key):
+            v = getattr(self, _RENAMED.get(key, key), UNSET)
+            if v is UNSET:
+                raise KeyError(key)
+            return v
+
+        def __bool__(self):
+            # as a dict: false when empty, so 'if not record: record = d.get(...)' falls back alike
+            return any(getattr(self, f) is not UNSET for f in self.__struct_fields__)
+
+    def Opt(t):
+        """A field that may be absent (UNSET) or null."""
+        return Union[t, None, UnsetType]
+
+    # --- RAW: timeline items (API JSON or atproto model dumps) and stream records ---
+
+    class Author(Record):
+        did: Opt(str) = UNSET
+
+    class Ref(Record):
+        # strongRef of a record, or the post view of a feed item 'reply'
+        uri: Opt(str) = UNSET
+        author: Opt(Author) = UNSET
+
+    class ReplyRef(Record):
+        parent: Opt(Ref) = UNSET
+        root: Opt(Ref) = UNSET
+
+    class ByteSlice(Record):
+        byteStart: Any = UNSET
+        byteEnd: Any = UNSET
+        byte_start: Any = UNSET
+        byte_end: Any = UNSET
+
+    class Feature(Record):
+        type: Opt(str) = msgspec.field(default=UNSET, name='$type')
+        py_type: Opt(str) = UNSET
+        did: Any = UNSET
+
+    class Facet(Record):
+        index: Opt(ByteSlice) = UNSET
+        features: Opt(list[Feature]) = UNSET
+
+    class PostRecord(Record):
+        createdAt: Any = UNSET
+        created_at: Any = UNSET
+        text: Any = UNSET
+        langs: Any = UNSET
+        facets: Opt(list[Facet]) = UNSET
+        reply: Opt(ReplyRef) = UNSET
+
+    class EmbedRef(Record):
+        # embed.record: the quoted post, or {record: quoted post} for recordWithMedia
+        uri: Opt(str) = UNSET
+        author: Opt(Author) = UNSET
+        record: Opt('EmbedRef') = UNSET
+
+    class Embed(Record):
+        record: Opt(EmbedRef) = UNSET
+
+    class RawPost(Record):
+        uri: Opt(str) = UNSET
+        author: Opt(Author) = UNSET
+        record: Opt(PostRecord) = UNSET
+        embed: Opt(Embed) = UNSET
+        labels: Any = UNSET
+        like_count: Any = UNSET
+        reply_count: Any = UNSET
+        repost_count: Any = UNSET
+        # feed items: {post, reply}; user is the account whose timeline was crawled
+        post: Opt('RawPost') = UNSET
+        reply: Opt(ReplyRef) = UNSET
+        user: Opt(str) = UNSET
+
+    # --- FEED: feed generator views and feed likes ---
+
+    class Subject(Record):
+        uri: Opt(str) = UNSET
+
+    class FeedRecord(Record):
+        displayName: Any = UNSET
+        description: Any = UNSET
+        descriptionFacets: Any = UNSET
+        avatar: Any = UNSET
+        createdAt: Any = UNSET
+        subject: Opt(Subject) = UNSET
+
+    class FeedPost(Record):
+        record: Opt(FeedRecord) = UNSET
+
+    class FeedItem(Record):
+        uri: Opt(str) = UNSET
+        cid: Any = UNSET
+        creator: Opt(Author) = UNSET
+        author: Opt(Author) = UNSET
+        record: Opt(FeedRecord) = UNSET
+        value: Opt(FeedRecord) = UNSET
+        post: Opt(FeedPost) = UNSET
+        likeCount: Any = UNSET
+        viewer: Any = UNSET
+        indexedAt: Any = UNSET
+        createdAt: Any = UNSET
+        user: Any = UNSET
+
+    _STRUCTS = {RAW: RawPost, FEED: FeedItem}
+
+
+def clean_schema(columns=None):
+    """Schema of the clean posts restricted to columns (all the fields by default)."""
+    return (CLEAN, tuple(columns or CLEAN_FIELDS))
+
+
+def _struct(schema):
+    if isinstance(schema, tuple):
+        name = 'Clean_' + '_'.join(schema[1])
+        return msgspec.defstruct(name, [(c, Any, UNSET) for c in schema[1]], bases=(Record,), kw_only=True)
+    return _STRUCTS[schema]
+
+
+def _dict_loads(backend):
+    if backend == 'orjson':
+        return orjson.loads
+    return json.loads
+
+
+def decoder(schema=RAW, backend=None):
+    """bytes or str -> record of the schema (RAW, FEED, or clean_schema(columns))."""
+    backend = backend or BACKEND
+    if schema == CLEAN:
+        schema = clean_schema()
+    if backend != 'msgspec':
+        return _dict_loads(backend)
+
+    decode = msgspec.json.Decoder(_struct(schema)).decode
+    fallback = _dict_loads('orjson' if orjson else 'json')
+
+    def decode_line(line):
+        try:
+            return decode(line)
+        except msgspec.ValidationError:
+            return fallback(line)
+    return decode_line
+
+
+#### BENCHMARK
+
+def bench(path, schema=RAW):
+    """Records/s of each available backend on the lines of a (gzipped) JSONL file."""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rb') as f:
+        lines = f.readlines()
+    print(f'{len(lines)} lines, {sum(map(len, lines)) / 2**20:.1f} MB from {path} (schema: {schema})')
+
+    backends = ['json'] + (['orjson'] if orjson else []) + (['msgspec'] if msgspec else [])
+    for backend in backends:
+        decode = decoder(clean_schema() if schema == CLEAN else schema, backend)
+        start = time.perf_counter()
+        bad = 0
+        for line in lines:
+            try:
+                decode(line)
+            except Exception:
+                bad += 1
+        elapsed = time.perf_counter() - start
+        print(f'   {backend:8} {len(lines) / elapsed:12,.0f} records/s' + (f'   ({bad} bad lines)' if bad else ''))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] != 'bench':
+        print('Usage: python records.py bench FILE.jsonl.gz [raw|clean|feed]')
+        sys.exit(1)
+    bench(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else RAW)
@@ -0,0 +1,137 @@
+# Benchmarks the crawlers against the local mock AppView (mock_appview.py).
+#
+# Every run starts from an empty folder with N synthetic users, runs the real script as
+# a subprocess pointed to the mock (BSKY_BASE_URL) with its own session, rate limit state,
+# queue and profile cache, and reports wall time, users completed and requests served (and 429s).
+# Results are comparable between runs and machines, and do not touch the real API.
+#
+# Usage:
+#   python bench_crawlers.py [RUN ...] [--users 200] [--latency 80] [--limit 3000] [--window 300] [--timeout 120] [--keep]
+#
+# A RUN is a name, optionally followed by ':' and extra arguments for the script:
+#   timelines  timelines:--async 16  timelines:--raw  followers  follows  census  census_hybrid
+# Default: timelines, 'timelines:--async 16', followers.
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import mock_appview
+
+# --- CONFIGURATION ---
+N_USERS = 200
+TIMEOUT = 120               # seconds per run
+LATENCY_MS = 80
+DEFAULT_RUNS = ['timelines', 'timelines:--async 16', 'followers']
+# ---------------------
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+EXPERIMENTS = os.path.join(HERE, '..', 'experiments')
+
+# name -> (script, arguments, file counting the completed work)
+SCRIPTS = {
+    'timelines': (os.path.join(HERE, 'crawl_timelines.py'), ['0'], 'processedT_0.txt'),
+    'followers': (os.path.join(HERE, 'crawl_followers.py'), ['0'], 'processedfollowers_0.txt'),
+    'follows': (os.path.join(HERE, 'crawl_follows.py'), ['0'], 'processedfollows_0.txt'),
+    'census': (os.path.join(EXPERIMENTS, 'make_feed_census.py'), [], 'results/feed_stats/bluesky_feed_census.csv'),
+    'census_hybrid': (os.path.join(EXPERIMENTS, 'make_feed_census_hybrid.py'), [],
+                      'results/feed_stats/bluesky_feed_census_hybrid.csv'),
+}
+
+
+def _count_lines(path):
+    if not os.path.exists(path):
+        return 0
+    with open(path, encoding='utf-8', errors='replace') as f:
+        n = sum(1 for l in f if l.strip())
+    # the census CSVs have a header
+    return n - 1 if path.endswith('.csv') and n else n
+
+
+def run_one(spec, workdir, base_url, state, n_users, timeout):
+    name, _, extra = spec.partition(':')
+    script, args, done_file = SCRIPTS[name]
+    folder = os.path.join(workdir, spec.replace(':', '_').replace(' ', '_').replace('-', ''))
+    os.makedirs(folder)
+
+    users = [mock_appview._did('bench-user', i) for i in range(n_users)]
+    for fname in ('0.txt', 'batch_0.txt'):
+        with open(os.path.join(folder, fname), 'w') as f:
+            f.write('\n'.join(users) + '\n')
+
+    env = dict(os.environ,
+               BSKY_BASE_URL=base_url,
+               BSKY_SESSION_FILE=os.path.join(folder, 'session.txt'),
+               BSKY_RATE_STATE=os.path.join(folder, 'rate_limit.json'),
+               BSKY_QUEUE_DB=os.path.join(folder, 'crawl_queue.db'),
+               BSKY_PROFILE_DB=os.path.join(folder, 'profiles.db'),
+               USERNAME='bench.bsky.social', PASSWORD='bench',
+               PYTHONUNBUFFERED='1')
+    cmd = [sys.executable, script] + args + extra.split()
+
+    requests_before, limited_before = state.total_requests(), state.rate_limited
+    start = time.time()
+    with open(os.path.join(folder, 'output.log'), 'w') as log:
+        proc = subprocess.Popen(cmd, cwd=folder, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            proc.wait(timeout=timeout)
+            timed_out = False
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+            timed_out = True
+    elapsed = time.time() - start
+
+    return {'run': spec, 'seconds': elapsed, 'done': _count_lines(os.path.join(folder, done_file)),
+            'requests': state.total_requests() - requests_before, 'rate_limited': state.rate_limited - limited_before,
+            'exit': 'timeout' if timed_out else proc.returncode, 'log': os.path.join(folder, 'output.log')}
+
+
+def report(results):
+    print(f'\n{"run":<28} {"exit":>7} {"seconds":>8} {"done":>7} {"done/s":>7} {"requests":>9} {"req/s":>7} {"429":>6}')
+    for r in results:
+        s = max(r['seconds'], 1e-9)
+        print(f'{r["run"]:<28} {str(r["exit"]):>7} {r["seconds"]:>8.1f} {r["done"]:>7} {r["done"] / s:>7.2f} '
+              f'{r["requests"]:>9} {r["requests"] / s:>7.1f} {r["rate_limited"]:>6}')
+
+
+if __name__ == '__main__':
+    runs, n_users, timeout, keep = [], N_USERS, TIMEOUT, False
+    server_kwargs = {'latency_ms': LATENCY_MS}
+    i = 1
+    while i < len(sys.argv):
+        a = sys.argv[i]
+        if a == '--users': n_users = int(sys.argv[i+1]); i += 1
+        elif a == '--latency': server_kwargs['latency_ms'] = float(sys.argv[i+1]); i += 1
+        elif a == '--limit': server_kwargs['limit'] = int(sys.argv[i+1]); i += 1
+        elif a == '--window': server_kwargs['window'] = int(sys.argv[i+1]); i += 1
+        elif a == '--timeout': timeout = float(sys.argv[i+1]); i += 1
+        elif a == '--keep': keep = True
+        else: runs.append(a)
+        i += 1
+    runs = runs or DEFAULT_RUNS
+    for spec in runs:
+        if spec.partition(':')[0] not in SCRIPTS:
+            print(f'Unknown run {spec}: choose among {", ".join(SCRIPTS)}')
+            sys.exit(1)
+
+    server, state = mock_appview.start_server(0, **server_kwargs)
+    base_url = f'http://127.0.0.1:{server.server_port}'
+    workdir = tempfile.mkdtemp(prefix='bench_crawlers_')
+    print(f'Mock AppView on {base_url}, {n_users} users per run, work folder {workdir}')
+
+    results = []
+    try:
+        for spec in runs:
+            print(f'-> {spec}')
+            results.append(run_one(spec, workdir, base_url, state, n_users, timeout))
+    finally:
+        server.shutdown()
+        report(results)
+        if keep:
+            print(f'\nLogs and outputs kept in {workdir}')
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,264 @@
+# Block-compressed JSONL: a gzip file made of independent members (BGZF-style), each holding
+# whole lines, with a block index.
+#
+# The file is still a valid .gz (zcat, gzip.open and the old scripts read it as before), but
+# each member can be decompressed on its own: readers decompress several blocks in parallel
+# (zlib releases the GIL) and block ranges can be handed to different worker processes.
+#
+#   <file>.jsonl.gz       members of ~BLOCK_BYTES uncompressed; the gzip header of each one has
+#                         an extra subfield 'BL' = (member size, lines), as BGZF's 'BC'
+#   <file>.jsonl.gz.idx   'offset\tsize\tlines\tbytes' per block, written on close
+#
+# The index is a cache: without it (or if it does not match the file) it is rebuilt by
+# walking the member headers. Plain single-stream .gz files are read as one block.
+#
+# Usage:
+#   python blockgz.py convert PATH [PATH ...]   (rewrites .jsonl.gz files, or all those under a folder)
+#   python blockgz.py index FILE                (rebuilds the .idx of a file)
+#   python blockgz.py stats FILE
+
+import gzip
+import io
+import os
+import struct
+import sys
+import zlib
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+# --- CONFIGURATION ---
+BLOCK_BYTES = 1024 * 1024   # uncompressed bytes per block
+LEVEL = 6
+THREADS = min(4, os.cpu_count() or 1)   # decompression threads of a reader
+# ---------------------
+
+Block = namedtuple('Block', 'offset size lines bytes')
+
+# gzip header: magic, deflate, FEXTRA flag, mtime 0, xfl 0, OS unknown; then XLEN and the subfield
+_HEADER = b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff'
+_EXTRA = struct.pack('<H2sH', 12, b'BL', 8)
+_HEAD_SIZE = len(_HEADER) + len(_EXTRA) + 8
+
+
+def _member(data, lines, level):
+    c = zlib.compressobj(level, zlib.DEFLATED, -15)
+    body = c.compress(data) + c.flush()
+    size = _HEAD_SIZE + len(body) + 8
+    return b''.join((_HEADER, _EXTRA, struct.pack('<II', size, lines), body,
+                     struct.pack('<II', zlib.crc32(data), len(data) & 0xffffffff)))
+
+
+class BlockWriter:
+    """Writes whole lines (bytes) to a block-compressed file.
+
+    A block ends when it reaches block_bytes, and at every flush(): the lines written
+    before a flush are complete on disk even if the process dies afterwards.
+    """
+
+    def __init__(self, path, block_bytes=BLOCK_BYTES, level=LEVEL, index_path=None):
+        self.path = path
+        self.index_path = index_path or path + '.idx'
+        self.block_bytes = block_bytes
+        self.level = level
+        self.blocks = []
+        self._f = open(path, 'wb')
+        self._offset = 0
+        self._buf = []
+        self._size = 0
+        self._lines = 0
+
+    def write(self, data):
+        """Appends data, which must end with a newline."""
+        self._buf.append(data)
+        self._size += len(data)
+        self._lines += data.count(b'\n')
+        if self._size >= self.block_bytes:
+            self.end_block()
+
+    def end_block(self):
+        if not self._size:
+            return
+        data = b''.join(self._buf)
+        member = _member(data, self._lines, self.level)
+        self._f.write(member)
+        self.blocks.append(Block(self._offset, len(member), self._lines, len(data)))
+        self._offset += len(member)
+        self._buf, self._size, self._lines = [], 0, 0
+
+    def flush(self):
+        self.end_block()
+        self._f.flush()
+
+    def fileno(self):
+        return self._f.fileno()
+
+    def close(self):
+        self.end_block()
+        self._f.close()
+        write_index(self.index_path, self.blocks)
+
+
+#### INDEX
+
+def write_index(path, blocks):
+    with open(path + '.tmp', 'w') as f:
+        for b in blocks:
+            f.write(f'{b.offset}\t{b.size}\t{b.lines}\t{b.bytes}\n')
+    os.replace(path + '.tmp', path)
+
+
+def scan_blocks(path):
+    """Blocks of a file read from its member headers (a truncated last member is left out).
+
+    Returns None if the file is not block-compressed.
+    """
+    blocks = []
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        offset = 0
+        while offset < size:
+            f.seek(offset)
+            head = f.read(_HEAD_SIZE)
+            if len(head) < _HEAD_SIZE or head[:4] != _HEADER[:4] or head[12:14] != b'BL':
+                return None if offset == 0 else blocks
+            member, lines = struct.unpack('<II', head[16:24])
+            if offset + member > size:
+                break
+            f.seek(offset + member - 4)
+            blocks.append(Block(offset, member, lines, struct.unpack('<I', f.read(4))[0]))
+            offset += member
+    return blocks
+
+
+def read_index(path):
+    """Blocks of a file, from its .idx if it matches the file, else from the headers. None for plain gzip files."""
+    idx = path + '.idx'
+    if os.path.exists(idx):
+        with open(idx) as f:
+            blocks = [Block(*map(int, line.split('\t'))) for line in f if line.strip()]
+        if blocks and blocks[-1].offset + blocks[-1].size == os.path.getsize(path):
+            return blocks
+    return scan_blocks(path)
+
+
+def is_blocked(path):
+    return read_index(path) is not None
+
+
+#### READING
+
+def read_block(path, block):
+    with open(path, 'rb') as f:
+        f.seek(block.offset)
+        return zlib.decompress(f.read(block.size), 31)
+
+
+def split(path, parts):
+    """Cuts the blocks of a file into at most `parts` ranges (start, end) of similar compressed size.
+
+    Plain gzip files give [None]: the whole file, in one piece.
+    """
+    blocks = read_index(path)
+    if not blocks:
+        return [None]
+    total = sum(b.size for b in blocks)
+    ranges, start, acc = [], 0, 0
+    for i, b in enumerate(blocks):
+        acc += b.size
+        if acc >= total * (len(ranges) + 1) / parts and i + 1 < len(blocks):
+            ranges.append((start, i + 1))
+            start = i + 1
+    ranges.append((start, len(blocks)))
+    return ranges
+
+
+def iter_blocks(path, rng=None, threads=THREADS):
+    """Decompressed blocks of a file (or of the block range rng = (start, end)), in order.
+
+    Up to `threads` blocks are decompressed at the same time, ahead of the consumer.
+    """
+    blocks = read_index(path)
+    if blocks is None:
+        with gzip.open(path, 'rb') as f:
+            yield f.read()
+        return
+    blocks = blocks[slice(*rng)] if rng else blocks
+    if threads <= 1:
+        for b in blocks:
+            yield read_block(path, b)
+        return
+    with ThreadPoolExecutor(threads) as pool:
+        pending = []
+        for b in blocks:
+            pending.append(pool.submit(read_block, path, b))
+            if len(pending) > 2 * threads:
+                yield pending.pop(0).result()
+        for p in pending:
+            yield p.result()
+
+
+def iter_lines(path, rng=None, threads=THREADS):
+    """Lines (bytes, with their newline) of a block-compressed or plain gzip file, like iterating gzip.open(path)."""
+    if rng is None and read_index(path) is None:
+        # plain gzip: stream it instead of holding the whole file
+        with gzip.open(path, 'rb') as f:
+            yield from f
+        return
+    for data in iter_blocks(path, rng, threads):
+        yield from io.BytesIO(data)
+
+
+#### CONVERSION
+
+def convert(path, block_bytes=BLOCK_BYTES, level=LEVEL):
+    """Rewrites a gzip JSONL file in block format (in place). Returns its blocks, or None if it already was."""
+    if is_blocked(path):
+        return None
+    tmp = path + '.tmp'
+    w = BlockWriter(tmp, block_bytes, level, index_path=path + '.idx')
+    with gzip.open(path, 'rb') as f:
+        while chunk := f.readlines(block_bytes):
+            w.write(b''.join(chunk))
+    w.close()
+    os.replace(tmp, path)
+    return w.blocks
+
+
+def _jsonl_files(paths):
+    for p in paths:
+        if os.path.isdir(p):
+            for root, _, files in os.walk(p):
+                for name in sorted(files):
+                    if name.endswith('.jsonl.gz'):
+                        yield os.path.join(root, name)
+        else:
+            yield p
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3 or sys.argv[1] not in ('convert', 'index', 'stats'):
+        print('Usage: python blockgz.py convert PATH [PATH ...] | index FILE | stats FILE')
+        sys.exit(1)
+
+    command = sys.argv[1]
+    if command == 'convert':
+        for path in _jsonl_files(sys.argv[2:]):
+            if path.endswith('.part'):
+                continue
+            before = os.path.getsize(path)
+            blocks = convert(path)
+            if blocks is None:
+                print(f'{path}: already block-compressed')
+            else:
+                print(f'{path}: {len(blocks)} blocks, {sum(b.lines for b in blocks)} lines, '
+                      f'{before / 2**20:.1f} -> {os.path.getsize(path) / 2**20:.1f} MB')
+    else:
+        path = sys.argv[2]
+        blocks = scan_blocks(path) if command == 'index' else read_index(path)
+        if blocks is None:
+            print(f'{path} is a plain gzip file (python blockgz.py convert {path})')
+            sys.exit(1)
+        if command == 'index':
+            write_index(path + '.idx', blocks)
+        print(f'{path}: {len(blocks)} blocks, {sum(b.lines for b in blocks)} lines, '
+              f'{sum(b.bytes for b in blocks) / 2**20:.1f} MB uncompressed, {os.path.getsize(path) / 2**20:.1f} MB on disk')
@@ -0,0 +1,194 @@
+# Shared Bluesky client factory for every script (data_collection and experiments).
+#
+# - session: reuses session.txt (from the working directory or from this folder) and
+#   saves it again when atproto refreshes it; USERNAME/PASSWORD env variables are the fallback
+# - transport: one pooled httpx client per atproto client, with keep-alive connections,
+#   gzip responses and explicit timeouts (httpx defaults to 5 s, too short for big pages)
+# - rate limit: the clients are the governed ones of rate_limit.py
+# - metrics: requests, errors, latency and bytes per endpoint (NSID), printed at exit
+#
+# BSKY_BASE_URL points every client to another AppView/PDS (e.g. mock_appview.py), and
+# BSKY_SESSION_FILE to another session file.
+
+import atexit
+import os
+import threading
+import time
+
+import httpx
+from atproto_client import SessionEvent
+from atproto_client.request import AsyncRequest, Request
+
+from rate_limit import AsyncGovernedClient, GovernedClient
+
+# --- CONFIGURATION ---
+BASE_URL = os.environ.get('BSKY_BASE_URL')  # None = atproto default (https://bsky.social/xrpc)
+SESSION_PATHS = ['session.txt', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'session.txt')]
+if os.environ.get('BSKY_SESSION_FILE'):
+    SESSION_PATHS = [os.environ['BSKY_SESSION_FILE']]
+TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+LIMITS = httpx.Limits(max_connections=64, max_keepalive_connections=32, keepalive_expiry=60)
+PRINT_STATS_AT_EXIT = True
+# ---------------------
+
+
+class EndpointMetrics:
+    """Per-NSID counters filled by the httpx event hooks (thread safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints = {}
+
+    def record(self, nsid, seconds, status, wire_bytes, body_bytes):
+        with self._lock:
+            m = self.endpoints.get(nsid)
+            if m is None:
+                m = self.endpoints[nsid] = {'requests': 0, 'errors': 0, 'seconds': 0.0, 'max_seconds': 0.0,
+                                            'wire_bytes': 0, 'body_bytes': 0}
+            m['requests'] += 1
+            m['errors'] += status >= 400
+            m['seconds'] += seconds
+            m['max_seconds'] = max(m['max_seconds'], seconds)
+            m['wire_bytes'] += wire_bytes
+            m['body_bytes'] += body_bytes
+
+    def report(self):
+        with self._lock:
+            rows = sorted(self.endpoints.items(), key=lambda x: -x[1]['requests'])
+        lines = [f'{"endpoint":<42} {"req":>8} {"err":>6} {"avg ms":>8} {"max ms":>8} {"MB wire":>9} {"MB body":>9}']
+        for nsid, m in rows:
+            lines.append(f'{nsid:<42} {m["requests"]:>8} {m["errors"]:>6} {1000 * m["seconds"] / m["requests"]:>8.0f} '
+                         f'{1000 * m["max_seconds"]:>8.0f} {m["wire_bytes"] / 2**20:>9.1f} {m["body_bytes"] / 2**20:>9.1f}')
+        return '\n'.join(lines)
+
+
+metrics = EndpointMetrics()
+
+
+def _nsid(request):
+    return request.url.path.rsplit('/', 1)[-1]
+
+
+def _on_request(request):
+    request.extensions['started'] = time.perf_counter()
+
+
+def _on_response(response):
+    # atproto reads the whole body anyway: reading it here lets us time the full transfer
+    response.read()
+    _record(response)
+
+
+async def _on_response_async(response):
+    await response.aread()
+    _record(response)
+
+
+async def _on_request_async(request):
+    _on_request(request)
+
+
+def _record(response):
+    request = response.request
+    started = request.extensions.get('started', time.perf_counter())
+    metrics.record(_nsid(request), time.perf_counter() - started, response.status_code,
+                   response.num_bytes_downloaded, len(response.content))
+
+
+def _http_kwargs(is_async=False):
+    hooks = {'request': [_on_request_async if is_async else _on_request],
+             'response': [_on_response_async if is_async else _on_response]}
+    return {
+        'timeout': TIMEOUT,
+        'limits': LIMITS,
+        'headers': {'Accept-Encoding': 'gzip'},
+        'event_hooks': hooks,
+    }
+
+
+def new_client():
+    """Governed Client on the shared transport, not logged in."""
+    return GovernedClient(BASE_URL, request=Request(**_http_kwargs()))
+
+
+def new_async_client():
+    return AsyncGovernedClient(BASE_URL, request=AsyncRequest(**_http_kwargs(is_async=True)))
+
+
+def _keep_base_url(client):
+    # login() moves the client to the PDS named in the session: an explicit BSKY_BASE_URL wins
+    if BASE_URL:
+        client.update_base_url(BASE_URL)
+
+
+#### SESSION
+
+def _session_path():
+    for p in SESSION_PATHS:
+        if os.path.exists(p):
+            return p
+    return SESSION_PATHS[0]
+
+
+def get_session():
+    """Reads the session string saved by create_session.py (or by a previous login)."""
+    try:
+        with open(_session_path()) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def save_session(session_string):
+    with open(_session_path(), 'w') as f:
+        f.write(session_string)
+
+
+def on_session_change(event, session):
+    if event in (SessionEvent.CREATE, SessionEvent.REFRESH):
+        print('Saving changed session')
+        save_session(session.export())
+
+
+def _credentials(username, password):
+    username = username or os.environ.get('USERNAME')
+    password = password or os.environ.get('PASSWORD')
+    if not (username and password):
+        raise Exception("Session file not found. Run create_session.py first.")
+    return username, password
+
+
+def init_client(username=None, password=None):
+    """Logged-in governed Client, reusing the saved session when there is one."""
+    client = new_client()
+    client.on_session_change(on_session_change)
+    session_string = get_session()
+    if session_string:
+        print('Reusing session')
+        client.login(session_string=session_string)
+    else:
+        print('Creating new session')
+        client.login(*_credentials(username, password))
+    _keep_base_url(client)
+    return client
+
+
+async def init_async_client(username=None, password=None):
+    client = new_async_client()
+    client.on_session_change(on_session_change)
+    session_string = get_session()
+    if session_string:
+        print('Reusing session')
+        await client.login(session_string=session_string)
+    else:
+        print('Creating new session')
+        await client.login(*_credentials(username, password))
+    _keep_base_url(client)
+    return client
+
+
+@atexit.register
+def _print_metrics():
+    if PRINT_STATS_AT_EXIT and metrics.endpoints:
+        print('\nHTTP requests by endpoint:')
+        print(metrics.report())
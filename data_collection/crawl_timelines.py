@@ -4,15 +4,20 @@
 # This file has been modified to capture activity only from the last 30 days.
 # It also includes a final timer to estimate performance.
 
-from atproto_client import Client, SessionEvent
+from atproto import models
 from atproto.exceptions import RequestException, BadRequestError
 from dateutil import parser
+from bsky_client import init_async_client, init_client
+from segment_writer import SegmentWriter
+from work_queue import WorkQueue
 from datetime import datetime, timezone, timedelta
 
 import datetime, time
-import gzip
+import asyncio
+import json
 import os
 import sys
+import types
 
 import logging.handlers
 log = logging.getLogger("bot")
@@ -21,48 +26,30 @@ log.addHandler(logging.StreamHandler())
 
 USERNAME = os.environ.get('USERNAME')
 PASSWORD = os.environ.get('PASSWORD')
-USERS_PER_FILE = 50000
-SAVE_EVERY_N_USERS = 100
+SAVE_EVERY_N_USERS = 100 # users per group commit of the output segment + processed log
+DEFAULT_CONCURRENCY = 16 # users in flight with --async
 
 
 count_user_errors = 0
 MAX_USER_ERRORS = 10
 
-#### SESSION
-
-def get_session():
-    try:
-        with open('session.txt') as f:
-            return f.read()
-    except FileNotFoundError:
-        return None
-
-
-def save_session(session_string):
-    with open('session.txt', 'w') as f:
-        f.write(session_string)
-
-
-def on_session_change(event, session):
-    print('Session changed:', event, repr(session))
-    if event in (SessionEvent.CREATE, SessionEvent.REFRESH):
-        print('Saving changed session')
-        save_session(session.export())
+# Newest post already archived for each user (high-water mark), shared by all chunks.
+# With --incremental, collect_timeline stops as soon as it reaches it.
+HWM_FILE = 'timeline_hwm.tsv'
+hwm = {}          # did -> (uri, created_at)
+new_marks = {}    # marks of the users crawled since the last commit
 
+queue = None      # WorkQueue with --queue: users are leased from it instead of read from {CHUNK}.txt
 
-def init_client(USERNAME, PASSWORD):
-    client = Client()
-    client.on_session_change(on_session_change)
-
-    session_string = get_session()
-    if session_string:
-        print('Reusing session')
-        client.login(session_string=session_string)
-    else:
-        print('Creating new session')
-        client.login(USERNAME, PASSWORD)
-
-    return client
+# With --raw the author feed is requested with invoke_query and the JSON items are written
+# as they are, skipping the pydantic models. Top-level keys renamed to match model_dump_json:
+RAW_RENAMES = {
+    'likeCount': 'like_count',
+    'replyCount': 'reply_count',
+    'repostCount': 'repost_count',
+    'quoteCount': 'quote_count',
+    'indexedAt': 'indexed_at',
+}
 
 #### EXCP HANDLING
 
@@ -91,18 +78,78 @@ def _handle_requests_exceptions(e):
 
 #### IO
 
-def _save(posts, processed_users, i, file_id):
+def _open_writer():
+    """Segment writer for data/chunk_{CHUNK}: posts are streamed to disk as each user completes."""
+    return SegmentWriter(f'data/chunk_{CHUNK}', PROCESSED_FILE,
+                         commit_every=SAVE_EVERY_N_USERS, on_commit=_on_commit)
 
-    with gzip.open(f'data/chunk_{CHUNK}/timelines-{file_id}.jsonl.gz', 'a') as f:
-        for post in posts:
-            row = f"{post.model_dump_json()}\n"
-            f.write(row.encode('utf8'))
 
-    with open(f'processedT_{CHUNK}.txt', 'a') as f:
-        for u in processed_users:
-            f.write(f'{u}\t{i}\n')
-    print(f'{datetime.datetime.now()} SAVED {i+1}')
-            
+def _on_commit(users):
+    _write_marks(users)
+    if queue is not None:
+        queue.complete(users)
+
+
+def _post_json(post, user):
+    if isinstance(post, dict):
+        # --raw: the post as returned by the API, with the counters renamed to the names
+        # model_dump_json uses (the ones clean_data.py reads)
+        row = {RAW_RENAMES.get(k, k): v for k, v in post.items()}
+        row['user'] = user
+        return json.dumps(row)
+    post.user = user
+    return post.model_dump_json()
+
+
+def _save_user(writer, user, posts, i):
+    writer.write_user(user, [_post_json(post, user) for post in posts], i)
+
+
+def _finish_user(writer, user, posts, status, i):
+    """Writes the posts of a crawled user (with --queue, an interrupted crawl goes back to the queue instead)."""
+    if queue is not None:
+        queue.renew()   # keeps the leased users (and the uncommitted ones) ours
+        if not status.get('complete'):
+            queue.fail(user, 'too many errors')
+            return
+    _record_mark(user, status)
+    _save_user(writer, user, posts, i)
+
+
+def _write_marks(users):
+    # Marks are written only once the posts they point to are on disk
+    with open(HWM_FILE, 'a') as f:
+        for u in users:
+            if u in new_marks:
+                uri, created_at = new_marks.pop(u)
+                f.write(f'{u}\t{uri}\t{created_at.isoformat()}\n')
+
+
+def _load_hwm(path):
+    """Reads the high-water marks file (later lines win)."""
+    res = {}
+    if not os.path.exists(path):
+        return res
+    with open(path) as f:
+        for l in f:
+            parts = l.rstrip('\n').split('\t')
+            if len(parts) != 3:
+                continue
+            try:
+                res[parts[0]] = (parts[1], parser.parse(parts[2]))
+            except (ValueError, OverflowError):
+                continue
+    return res
+
+
+def _record_mark(user, status):
+    """Remembers the newest post of a user, but only if the crawl reached the end of the window.
+
+    A crawl interrupted by errors has the newest pages but not the older ones: moving the mark
+    forward would hide that gap from the next incremental run.
+    """
+    if status.get('newest') is not None and status.get('complete'):
+        new_marks[user] = status['newest']
 
 
 def _read_list(path):
@@ -115,15 +162,108 @@ def _read_list(path):
     return res
 
 
-def collect_timeline(client, handle, cursor=None, posts=None):
+def _get_author_feed(client, handle, cursor, raw=False):
+    if raw:
+        params = models.AppBskyFeedGetAuthorFeed.Params(actor=handle, limit=100, cursor=cursor)
+        return _raw_page(client.invoke_query('app.bsky.feed.getAuthorFeed', params=params).content)
+    return client.get_author_feed(handle, limit=100, cursor=cursor)
+
+
+async def _get_author_feed_async(client, handle, cursor, raw=False):
+    if raw:
+        params = models.AppBskyFeedGetAuthorFeed.Params(actor=handle, limit=100, cursor=cursor)
+        return _raw_page((await client.invoke_query('app.bsky.feed.getAuthorFeed', params=params)).content)
+    return await client.get_author_feed(handle, limit=100, cursor=cursor)
+
+
+def _raw_page(content):
+    """getAuthorFeed JSON -> object with the .feed and .cursor of the model response (items stay dicts)."""
+    return types.SimpleNamespace(feed=content.get('feed') or [], cursor=content.get('cursor'))
+
+
+def _view_fields(post_view):
+    """(post, uri, createdAt string) of a feed item, either a model or a raw dict."""
+    if isinstance(post_view, dict):
+        post = post_view['post']
+        return post, post.get('uri'), post.get('record', {}).get('createdAt')
+    return post_view.post, post_view.post.uri, post_view.post.record.created_at
+
+
+def _parse_date(s):
+    """fromisoformat covers the dates written by Bluesky clients; dateutil handles the odd ones."""
+    try:
+        post_date = datetime.datetime.fromisoformat(s)
+    except ValueError:
+        post_date = parser.parse(s)
+    # Normalize timezone to UTC to avoid comparison errors
+    if post_date.tzinfo is None:
+        post_date = post_date.replace(tzinfo=datetime.timezone.utc)
+    return post_date
+
+
+def _filter_page(feed, time_limit, mark=None):
+    """Returns the posts of a fetched page newer than time_limit (and than the high-water mark),
+    whether the limit was crossed, and the newest (uri, date) of the page."""
+    posts = []
+    stop_download = False
+    newest = None
+    for post_view in feed:
+        # Extract post date
+        post, uri, post_date_str = _view_fields(post_view)
+
+        # Safe date parsing
+        try:
+            post_date = _parse_date(post_date_str)
+        except:
+            continue # Skip post if date is unreadable
+
+        # If post is older than the limit...
+        if post_date < time_limit:
+            stop_download = True
+            continue # Skip to next (which will trigger the break)
+
+        # ...or was already archived by a previous run
+        if mark is not None and (uri == mark[0] or post_date < mark[1]):
+            stop_download = True
+            continue
+
+        # Otherwise add post to list
+        posts.append(post) # Note: we save .post, not the whole view
+        if newest is None or post_date > newest[1]:
+            newest = (uri, post_date)
+    return posts, stop_download, newest
+
+
+def _newer(a, b):
+    if a is None or (b is not None and b[1] > a[1]):
+        return b
+    return a
+
+
+def _time_limit():
+    # Using datetime.datetime and datetime.timedelta to avoid import errors
+    # Download only posts from the last 30 days
+    return datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=30)
+
+
+def collect_timeline(client, handle, cursor=None, posts=None, mark=None, status=None, raw=False):
+    """Downloads the last 30 days of posts of handle, stopping early at the high-water mark if given.
+
+    With raw=True the posts are returned as the JSON dicts of the API response.
+
+    If status is a dict, status['complete'] tells whether the whole window was read and
+    status['newest'] holds the newest (uri, date) collected.
+    """
+    if status is None:
+        status = {}
+    status['complete'] = False
+    status['newest'] = None
     count_user_errors = 0 
     cursor = None
     old_cursor = None
     
     # --- TIME CONFIGURATION ---
-    # Using datetime.datetime and datetime.timedelta to avoid import errors
-    # Download only posts from the last 30 days
-    TIME_LIMIT = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(days=30)
+    TIME_LIMIT = _time_limit()
     stop_download = False
     # ----------------------------
 
@@ -139,30 +279,12 @@ def collect_timeline(client, handle, cursor=None, posts=None):
             break
 
         try:
-            fetched = client.get_author_feed(handle, limit=100, cursor=cursor)
+            fetched = _get_author_feed(client, handle, cursor, raw)
             
             # Check dates in the fetched block
-            for post_view in fetched.feed:
-                # Extract post date
-                post_date_str = post_view.post.record.created_at
-                
-                # Safe date parsing
-                try:
-                    post_date = parser.parse(post_date_str)
-                except:
-                    continue # Skip post if date is unreadable
-
-                # Normalize timezone to UTC to avoid comparison errors
-                if post_date.tzinfo is None:
-                     post_date = post_date.replace(tzinfo=datetime.timezone.utc)
-
-                # If post is older than the limit...
-                if post_date < TIME_LIMIT:
-                    stop_download = True 
-                    continue # Skip to next (which will trigger the break)
-                
-                # Otherwise add post to list
-                posts.append(post_view.post) # Note: we save .post, not the whole view
+            page, stop_download, newest = _filter_page(fetched.feed, TIME_LIMIT, mark)
+            posts.extend(page)
+            status['newest'] = _newer(status['newest'], newest)
 
         except RequestException as e:
             count_user_errors +=1
@@ -170,6 +292,7 @@ def collect_timeline(client, handle, cursor=None, posts=None):
             cursor = old_cursor
             continue
         except BadRequestError:
+            status['complete'] = True
             return []
         except Exception as e:
             count_user_errors +=1
@@ -183,26 +306,155 @@ def collect_timeline(client, handle, cursor=None, posts=None):
         old_cursor = cursor
         cursor = fetched.cursor
     
+    status['complete'] = True
     return posts
 
 
+#### ASYNC MODE
+
+def _last_post_is_old(feed, time_limit, mark=None):
+    """Cheap look at the last item of a page: if it is already past the limit there is no next page to prefetch."""
+    if not feed:
+        return True
+    try:
+        post_date = _parse_date(_view_fields(feed[-1])[2])
+    except:
+        return False
+    if mark is not None and post_date < mark[1]:
+        return True
+    return post_date < time_limit
+
+
+async def _handle_requests_exceptions_async(e):
+    """Same policy as _handle_requests_exceptions, without blocking the event loop."""
+    status = e.response.status_code
+    print(f"{datetime.datetime.now()}. error {status} {e.response.content.message}")
+    if status == 429:  # too many
+        when = int(e.response.headers['RateLimit-Reset'])
+        await asyncio.sleep(max(0, when - time.time()))
+    elif status in {409, 413, 502}:  # net error
+        await asyncio.sleep(50)
+
+
+async def collect_timeline_async(client, handle, mark=None, status=None, raw=False):
+    """Async version of collect_timeline.
+
+    While a page is being parsed the request for the next one is already in flight,
+    so each user costs roughly one round trip per page instead of round trip + parsing.
+    """
+    if status is None:
+        status = {}
+    status['complete'] = False
+    status['newest'] = None
+    count_user_errors = 0
+    TIME_LIMIT = _time_limit()
+    posts = []
+    cursor = None
+    pending = asyncio.ensure_future(_get_author_feed_async(client, handle, cursor, raw))
+
+    while True:
+        try:
+            fetched = await pending
+        except BadRequestError:
+            status['complete'] = True
+            return []
+        except RequestException as e:
+            count_user_errors += 1
+            if count_user_errors > MAX_USER_ERRORS:
+                return posts
+            await _handle_requests_exceptions_async(e)
+            pending = asyncio.ensure_future(_get_author_feed_async(client, handle, cursor, raw))
+            continue
+        except Exception as e:
+            count_user_errors += 1
+            if count_user_errors > MAX_USER_ERRORS:
+                return posts
+            print(f"{datetime.datetime.now()} {e}")
+            pending = asyncio.ensure_future(_get_author_feed_async(client, handle, cursor, raw))
+            continue
+
+        # Prefetch the next page before parsing this one
+        next_cursor = fetched.cursor
+        pending = None
+        if next_cursor and not _last_post_is_old(fetched.feed, TIME_LIMIT, mark):
+            pending = asyncio.ensure_future(_get_author_feed_async(client, handle, next_cursor, raw))
+
+        page, stop_download, newest = _filter_page(fetched.feed, TIME_LIMIT, mark)
+        posts.extend(page)
+        status['newest'] = _newer(status['newest'], newest)
+
+        if stop_download or pending is None:
+            if pending is not None:
+                pending.cancel()
+            break
+        cursor = next_cursor
+
+    status['complete'] = True
+    return posts
+
+
+async def crawl_async(user_list, n_processed, writer, concurrency, raw=False):
+    """Crawls user_list keeping `concurrency` users in flight.
+
+    Users are written and checkpointed in completion order, with the same
+    processedT_{CHUNK}.txt format as the sequential loop, so a run can be resumed
+    by either mode.
+    """
+    client = await init_async_client(USERNAME, PASSWORD)
+    users = iter(user_list)
+    state = {'done': 0}
+
+    async def worker():
+        for user in users:
+            status = {}
+            posts = await collect_timeline_async(client, user, hwm.get(user), status, raw)
+            state['done'] += 1
+            _finish_user(writer, user, posts, status, n_processed + state['done'])
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
 if __name__ == '__main__':
     # START TIMER
     start_run_time = time.time()
     
     if len(sys.argv) < 2:
         print("Error: please specify the chunk number (e.g., python crawl_timelines.py 1)")
+        print("       add '--async N' to crawl N users concurrently")
+        print("       add '--incremental' to download only the posts newer than the previous run")
+        print("       add '--raw' to write the API JSON directly, without building atproto models")
+        print("       add '--queue' to lease users from the shared work queue (work_queue.py) instead of {CHUNK}.txt")
         sys.exit(1)
 
     CHUNK = int(sys.argv[1])
 
+    CONCURRENCY = None
+    INCREMENTAL = False
+    RAW = False
+    for i in range(len(sys.argv)):
+        if sys.argv[i] == '--async':
+            CONCURRENCY = DEFAULT_CONCURRENCY
+            if i + 1 < len(sys.argv) and sys.argv[i+1].isdigit():
+                CONCURRENCY = int(sys.argv[i+1])
+        if sys.argv[i] == '--incremental':
+            INCREMENTAL = True
+        if sys.argv[i] == '--raw':
+            RAW = True
+        if sys.argv[i] == '--queue':
+            queue = WorkQueue('timelines')
+
+    PROCESSED_FILE = f'processedT_{CHUNK}.txt'
+    if INCREMENTAL:
+        # A refresh visits every user of the chunk again, once per day: it gets its own resume log
+        PROCESSED_FILE = f'processedT_{CHUNK}_{datetime.datetime.now().strftime("%Y%m%d")}.txt'
+        hwm = _load_hwm(HWM_FILE)
+        print(f'Incremental mode: {len(hwm)} high-water marks loaded, resume log {PROCESSED_FILE}')
+
     if not os.path.exists(f'data/chunk_{CHUNK}'):
         os.makedirs(f'data/chunk_{CHUNK}')
     
-    client = init_client(USERNAME, PASSWORD)
-    user_list = _read_list(f'{CHUNK}.txt')
-    all_posts = []
-    processed = _read_list(f'processedT_{CHUNK}.txt')
+    user_list = _read_list(f'{CHUNK}.txt') if queue is None else []
+    processed = _read_list(PROCESSED_FILE)
     processed_set_loaded = set()
     
     # Load processed users into a set for faster lookup
@@ -219,45 +471,34 @@ if __name__ == '__main__':
         user_list = [u for u in user_list if u not in processed_set_loaded]
         print(f'Resuming: {original_count} total users found, {len(user_list)} remaining to process.')
     
-    processed = [] # Reset for current batch
-    
     # Total number of users to process in this run
     users_to_process_count = len(user_list)
-    
-    # cfid is USERS_PER_FILE if first file, else k*USERS_PER_FILE
-    current_file_id = USERS_PER_FILE + int(n_processed/USERS_PER_FILE) * USERS_PER_FILE
-    
-    last_idx = 0 
+
+    if queue is not None:
+        print(f'Queue mode: {queue.stats()}')
+        user_list = queue.iter_users()
+
+    writer = _open_writer()
 
     try:
-        for i, user in enumerate(user_list):
-            last_idx = i
-            
-            posts = collect_timeline(client, user)
-            for post in posts:
-                post.user = user
-            all_posts.extend(posts)
-            processed.append(user)
-
-            # Use total count (previously processed + current) for saving checkpoints
-            total_count = n_processed + i + 1
-
-            if total_count % (USERS_PER_FILE+SAVE_EVERY_N_USERS) == 0:
-                current_file_id += USERS_PER_FILE
-                _save(all_posts, processed, total_count,  current_file_id)
-                all_posts = []
-                processed = []
-            elif total_count % SAVE_EVERY_N_USERS == 0: 
-                _save(all_posts, processed, total_count,  current_file_id)
-                all_posts = []
-                processed = []
-            
-        if len(all_posts) > 0:
-            total_count = n_processed + last_idx + 1
-            _save(all_posts, processed, total_count,  current_file_id)
+        if CONCURRENCY:
+            print(f'Async mode: {CONCURRENCY} users in flight')
+            asyncio.run(crawl_async(user_list, n_processed, writer, CONCURRENCY, RAW))
+        else:
+            client = init_client(USERNAME, PASSWORD)
+
+            for i, user in enumerate(user_list):
+                status = {}
+                posts = collect_timeline(client, user, mark=hwm.get(user), status=status, raw=RAW)
+                _finish_user(writer, user, posts, status, n_processed + i + 1)
 
     except KeyboardInterrupt:
         print("\nInterrupted by user.")
+    finally:
+        # Commits the users completed since the last checkpoint and closes the segment
+        writer.close()
+        if queue is not None:
+            users_to_process_count = writer.users_done
     
     # END TIMER & SUMMARY
     end_run_time = time.time()
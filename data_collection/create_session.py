@@ -1,10 +1,11 @@
-from atproto import Client
 import getpass
 import os
 
+from bsky_client import new_client
+
 def main():
     print("Starting session creation...")
-    client = Client()
+    client = new_client()
     
     # Prompt for credentials
     username = input("USERNAME (e.g. name.bsky.social): ")
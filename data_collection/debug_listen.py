@@ -1,5 +1,6 @@
 import cbor2
 from atproto import FirehoseSubscribeReposClient
+from firehose_decode import decode_commit
 
 def main():
     print("--- DIAGNOSTICA DATI ---")
@@ -23,6 +24,10 @@ def main():
                 print(f"✅ TROVATO 'repo': {data['repo']}")
             else:
                 print("❌ 'repo' NON TROVATO in questo messaggio.")
+
+            # Record contenuti nei blocchi CAR del commit
+            for kind, row in decode_commit(message):
+                print(f"📦 {kind}: {row['uri']} -> {str(row['record'])[:200]}")
                 
             client.stop()
             
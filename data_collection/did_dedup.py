@@ -0,0 +1,263 @@
+# Compact DID sets for long firehose captures.
+#
+# A Python set of full DID strings costs ~100 bytes per DID. Two replacements:
+#   HashedDIDSet  exact mode: 64-bit blake2b digests of the DIDs in a numpy
+#                 open-addressing table (8 bytes per slot, load factor <= 0.7).
+#                 Two DIDs would have to share a 64-bit digest to be confused:
+#                 with 100M DIDs the chance that this happens even once is ~3e-4.
+#   BloomDIDSet   Bloom filter sized for an expected number of DIDs and a target
+#                 false positive rate (~1.2 bytes per DID at 1e-3). A false positive
+#                 makes a new DID look already seen.
+# Both persist to a binary file (fixed header + numpy array) that is opened with
+# mmap, so a restart does not rebuild the set from 1.txt.
+
+import hashlib
+import math
+import os
+import struct
+
+import numpy as np
+
+# --- CONFIGURATION ---
+DEFAULT_CAPACITY = 1 << 20
+MAX_LOAD = 0.7
+DEFAULT_EXPECTED = 50_000_000
+DEFAULT_FP_RATE = 0.001
+# ---------------------
+
+MAGIC = b'DIDSET01'
+KIND_EXACT = 1
+KIND_BLOOM = 2
+# magic, kind, size of the array, number of DIDs, number of hash functions, fp rate,
+# bytes of the source text file already loaded
+_HEADER = struct.Struct('<8sB7xQQQdQ')
+_HEADER_SIZE = 64
+
+
+def did_digest(did):
+    """64-bit digest of a DID; 0 is reserved for empty slots."""
+    h = int.from_bytes(hashlib.blake2b(did.encode('utf-8'), digest_size=8).digest(), 'little')
+    return h or 1
+
+
+def _write(path, kind, array, count, n_hashes, fp_rate, synced_bytes):
+    tmp = path + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(_HEADER.pack(MAGIC, kind, len(array), count, n_hashes, fp_rate, synced_bytes).ljust(_HEADER_SIZE, b'\0'))
+        f.write(np.ascontiguousarray(array).tobytes())
+    os.replace(tmp, path)
+
+
+def _read_header(path):
+    with open(path, 'rb') as f:
+        magic, kind, size, count, n_hashes, fp_rate, synced_bytes = _HEADER.unpack(f.read(_HEADER.size))
+    if magic != MAGIC:
+        raise ValueError(f'{path} is not a DID set file')
+    return kind, size, count, n_hashes, fp_rate, synced_bytes
+
+
+class HashedDIDSet:
+    """Exact DID set: 64-bit digests in a linear-probing numpy table."""
+
+    kind = KIND_EXACT
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, table=None):
+        if table is None:
+            capacity = 1 << max(4, (capacity - 1).bit_length())
+            table = np.zeros(capacity, dtype=np.uint64)
+        self.table = table
+        self.mask = len(table) - 1
+        self.count = int(np.count_nonzero(table))
+        self.synced_bytes = 0
+
+    def __len__(self):
+        return self.count
+
+    def _slot(self, h):
+        table = self.table
+        i = h & self.mask
+        while True:
+            v = table[i]
+            if v == 0 or v == h:
+                return i, v
+            i = (i + 1) & self.mask
+
+    def __contains__(self, did):
+        h = did_digest(did)
+        return self._slot(h)[1] == h
+
+    def add(self, did):
+        """Adds a DID. Returns True if it was not in the set."""
+        h = did_digest(did)
+        i, v = self._slot(h)
+        if v == h:
+            return False
+        self.table[i] = h
+        self.count += 1
+        if self.count > MAX_LOAD * len(self.table):
+            self._resize(len(self.table) * 2)
+        return True
+
+    def _resize(self, capacity):
+        old = self.table[self.table != 0]
+        self.table = np.zeros(capacity, dtype=np.uint64)
+        self.mask = capacity - 1
+        self.count = 0
+        self._insert_digests(old)
+
+    def _insert_digests(self, h):
+        """Vectorized insert of unique non-zero digests; returns how many were new."""
+        mask = np.uint64(self.mask)
+        pos = h & mask
+        inserted = 0
+        while len(h):
+            slot = self.table[pos]
+            empty = slot == 0
+            done = slot == h
+            # Several digests may want the same empty slot: the first one wins,
+            # the others find it taken at the next round and move on.
+            cand = np.flatnonzero(empty)
+            _, first = np.unique(pos[cand], return_index=True)
+            winners = cand[first]
+            self.table[pos[winners]] = h[winners]
+            done[winners] = True
+            inserted += len(winners)
+
+            keep = ~done
+            h, pos, empty = h[keep], pos[keep], empty[keep]
+            pos = np.where(empty, pos, (pos + np.uint64(1)) & mask)
+        self.count += inserted
+        return inserted
+
+    def add_many(self, dids):
+        """Bulk add (used to import an existing DID list). Returns how many were new."""
+        h = np.fromiter((did_digest(d) for d in dids), dtype=np.uint64)
+        h = np.unique(h)
+        needed = self.count + len(h)
+        if needed > MAX_LOAD * len(self.table):
+            capacity = len(self.table)
+            while needed > MAX_LOAD * capacity:
+                capacity *= 2
+            self._resize(capacity)
+        return self._insert_digests(h)
+
+    def save(self, path):
+        _write(path, self.kind, self.table, self.count, 0, 0.0, self.synced_bytes)
+
+    @classmethod
+    def load(cls, path):
+        _, size, _, _, _, synced_bytes = _read_header(path)
+        table = np.memmap(path, dtype=np.uint64, mode='c', offset=_HEADER_SIZE, shape=(size,))
+        res = cls(table=table)
+        res.synced_bytes = synced_bytes
+        return res
+
+
+class BloomDIDSet:
+    """Bloom filter over DIDs, sized for `expected` DIDs at false positive rate `fp_rate`."""
+
+    kind = KIND_BLOOM
+
+    def __init__(self, expected=DEFAULT_EXPECTED, fp_rate=DEFAULT_FP_RATE, bits=None, n_hashes=None):
+        if bits is None:
+            n_bits = int(math.ceil(-expected * math.log(fp_rate) / (math.log(2) ** 2)))
+            bits = np.zeros((n_bits + 7) // 8, dtype=np.uint8)
+            n_hashes = max(1, round(n_bits / expected * math.log(2)))
+        self.bits = bits
+        self.n_bits = len(bits) * 8
+        self.n_hashes = n_hashes
+        self.fp_rate = fp_rate
+        self.count = 0
+        self.synced_bytes = 0
+
+    def __len__(self):
+        return self.count
+
+    def _positions(self, did):
+        d = hashlib.blake2b(did.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(d[:8], 'little')
+        h2 = int.from_bytes(d[8:], 'little') | 1
+        return [(h1 + i * h2) % self.n_bits for i in range(self.n_hashes)]
+
+    def __contains__(self, did):
+        bits = self.bits
+        return all(bits[p >> 3] & (1 << (p & 7)) for p in self._positions(did))
+
+    def add(self, did):
+        """Adds a DID. Returns True if it was (probably) not in the set."""
+        bits = self.bits
+        new = False
+        for p in self._positions(did):
+            byte, bit = p >> 3, 1 << (p & 7)
+            if not bits[byte] & bit:
+                bits[byte] |= bit
+                new = True
+        if new:
+            self.count += 1
+        return new
+
+    def add_many(self, dids):
+        return sum(self.add(d) for d in dids)
+
+    def save(self, path):
+        _write(path, self.kind, self.bits, self.count, self.n_hashes, self.fp_rate, self.synced_bytes)
+
+    @classmethod
+    def load(cls, path):
+        _, size, count, n_hashes, fp_rate, synced_bytes = _read_header(path)
+        bits = np.memmap(path, dtype=np.uint8, mode='c', offset=_HEADER_SIZE, shape=(size,))
+        res = cls(bits=bits, n_hashes=n_hashes, fp_rate=fp_rate)
+        res.count = count
+        res.synced_bytes = synced_bytes
+        return res
+
+
+def load(path):
+    kind = _read_header(path)[0]
+    if kind == KIND_EXACT:
+        return HashedDIDSet.load(path)
+    if kind == KIND_BLOOM:
+        return BloomDIDSet.load(path)
+    raise ValueError(f'Unknown DID set kind {kind} in {path}')
+
+
+def open_dedup(mode, path, source=None, expected=DEFAULT_EXPECTED, fp_rate=DEFAULT_FP_RATE):
+    """Opens the DID set saved at `path` (or a new one) and catches up with the `source` text file.
+
+    mode is 'exact', 'bloom' or 'set' (plain Python set, the old behaviour).
+    Only the part of `source` appended after the last save is read.
+    """
+    if mode == 'set':
+        res = set()
+        if source and os.path.exists(source):
+            with open(source, 'r') as f:
+                for line in f:
+                    res.add(line.strip())
+        return res
+
+    kind = KIND_EXACT if mode == 'exact' else KIND_BLOOM
+    res = None
+    if os.path.exists(path) and _read_header(path)[0] == kind:
+        res = load(path)
+        if source and os.path.exists(source) and os.path.getsize(source) < res.synced_bytes:
+            # the source was rewritten: its removed DIDs must not stay seen, so start over
+            res = None
+    if res is None:
+        res = HashedDIDSet() if mode == 'exact' else BloomDIDSet(expected, fp_rate)
+
+    if source and os.path.exists(source):
+        with open(source, 'rb') as f:
+            f.seek(res.synced_bytes)
+            dids = [l.strip().decode('utf-8') for l in f.read().splitlines() if l.strip()]
+            res.synced_bytes = f.tell()
+        res.add_many(dids)
+    return res
+
+
+def save_dedup(dedup, path, source=None):
+    """Saves a DID set opened with open_dedup, remembering how much of `source` it contains."""
+    if isinstance(dedup, set):
+        return
+    if source and os.path.exists(source):
+        dedup.synced_bytes = os.path.getsize(source)
+    dedup.save(path)
@@ -0,0 +1,369 @@
+# Shared engine of crawl_feed_post_likes.py and crawl_feed_bookmarks.py.
+#
+# The likes of several feeds (otherfile.myfeeduris) are downloaded at the same time,
+# each page is written to disk as soon as it arrives instead of being kept in memory,
+# and after every page the cursor of the feed is appended to a checkpoint, so an
+# interrupted crawl resumes in the middle of each feed. 429s wait for the rate limit
+# reset, other errors are retried.
+#
+# Outputs (either or both):
+#   <jsonl_dir>/<feed name>.jsonl   one like per line (crawl_feed_post_likes.py, read by bsky_plots.py)
+#   <csv_path>                      'feed_name,user_handle,liked_at' (crawl_feed_bookmarks.py)
+# Checkpoint: '<feed uri>\t<cursor>\t<pages>\t<likes>' after every page, with an empty cursor
+# once the feed is complete. Complete feeds are skipped: --restart starts a new crawl.
+#
+# A crash between a page write and its checkpoint line can repeat that page (at most
+# one per feed) on resume.
+#
+# Delta crawls (--delta): the newest like of every feed (actor DID and created_at) is kept
+# in a marks file, '<feed uri>\t<actor did>\t<created_at>\t<pending|done>'. A delta run
+# pages each feed from the top only until it reaches that like, and appends the new likes
+# to the existing outputs; its checkpoint gets the date (e.g. cursors_20240501.tsv), so a
+# daily snapshot resumes within the day and starts over the next one. The newest like
+# seen by a run is 'pending' until the feed is complete, then it becomes the new mark.
+# Marks of old jsonl files are read from their first line; the CSV holds handles, not DIDs,
+# so a CSV-only delta run refuses feeds already in the CSV without a mark (a full run first).
+
+import asyncio
+import datetime
+import json
+import os
+import sys
+import time
+
+from atproto import models
+from atproto.exceptions import BadRequestError, RequestException
+from bsky_client import init_async_client
+
+# --- CONFIGURATION ---
+CONCURRENCY = 8          # feeds in flight
+MAX_FEED_ERRORS = 10     # consecutive errors before leaving a feed for a later run
+MIN_DATE = datetime.date(2023, 2, 17)  # crawl_feed_bookmarks.py keeps only the likes after this date
+# ---------------------
+
+
+def safe_name(name):
+    """Feed display name usable as a file name."""
+    return "".join([c for c in name if c.isalnum() or c in (' ', '-', '_')]).strip()
+
+
+def valid_time(t):
+    # ORIGINAL LOGIC MODIFIED:
+    # The original code filtered dates between 2023 and March 2024.
+    # The upper limit was removed so it works for TODAY'S data.
+    try:
+        # Check if string or datetime object
+        if isinstance(t, str):
+            T = datetime.datetime.fromisoformat(t.replace('Z', '+00:00'))
+        else:
+            T = t
+        return T.date() >= MIN_DATE
+    except ValueError: # invalid time
+        return False
+    except Exception as e:
+        print(f"Time error: {e}")
+        return None
+
+
+def _date(t):
+    return datetime.datetime.fromisoformat(t.replace('Z', '+00:00')) if isinstance(t, str) else t
+
+
+def delta_checkpoint(path):
+    """Checkpoint of today's delta run: cursors.tsv -> cursors_YYYYMMDD.tsv."""
+    root, ext = os.path.splitext(path)
+    return f'{root}_{datetime.datetime.now().strftime("%Y%m%d")}{ext}'
+
+
+def load_marks(path):
+    """(marks, pending): uri -> (actor_did, created_at), later lines win."""
+    marks, pending = {}, {}
+    if not path or not os.path.exists(path):
+        return marks, pending
+    with open(path, encoding='utf-8') as f:
+        for l in f:
+            parts = l.rstrip('\n').split('\t')
+            if len(parts) != 4:
+                continue
+            if parts[3] == 'done':
+                marks[parts[0]] = (parts[1], parts[2])
+                pending.pop(parts[0], None)
+            else:
+                pending[parts[0]] = (parts[1], parts[2])
+    return marks, pending
+
+
+def new_likes(likes, mark):
+    """Likes of a page (newest first) that come before the mark. Returns (likes, mark reached)."""
+    did, created_at = mark
+    limit = _date(created_at)
+    for i, like in enumerate(likes):
+        if (like.actor.did == did and like.created_at == created_at) or _date(like.created_at) < limit:
+            return likes[:i], True
+    return likes, False
+
+
+def load_checkpoint(path):
+    """uri -> (cursor, pages, likes) from the last line of each feed; cursor None = complete."""
+    res = {}
+    if not os.path.exists(path):
+        return res
+    with open(path, encoding='utf-8') as f:
+        for l in f:
+            parts = l.rstrip('\n').split('\t')
+            if len(parts) != 4:
+                continue
+            res[parts[0]] = (parts[1] or None, int(parts[2]), int(parts[3]))
+    return res
+
+
+async def _handle_requests_exceptions_async(e):
+    status = e.response.status_code if e.response is not None else None
+    print(f"   {datetime.datetime.now().strftime('%H:%M:%S')} error {status}")
+    if status == 429:  # too many
+        when = int(e.response.headers.get('RateLimit-Reset', time.time() + 60))
+        await asyncio.sleep(max(0, when - time.time()))
+    elif status in {409, 413, 502, 503, 504, None}:  # net error
+        await asyncio.sleep(50)
+    else:
+        await asyncio.sleep(5)
+
+
+class FeedLikesCrawl:
+    """Streams the likes of a dict {feed name: feed uri} to disk, CONCURRENCY feeds at a time."""
+
+    def __init__(self, feeds, checkpoint, jsonl_dir=None, csv_path=None, concurrency=CONCURRENCY,
+                 marks_path=None, delta=False):
+        self.feeds = feeds
+        self.checkpoint = checkpoint
+        self.jsonl_dir = jsonl_dir
+        self.csv_path = csv_path
+        self.concurrency = concurrency
+        self.delta = delta
+        self.state = load_checkpoint(checkpoint)
+        self.marks, self.pending = load_marks(marks_path)
+        self.total_likes = 0
+        self.n_requests = 0
+
+        if jsonl_dir:
+            os.makedirs(jsonl_dir, exist_ok=True)
+            if delta:
+                self._marks_from_files()
+        self._marks_log = open(marks_path, 'a', encoding='utf-8') if marks_path else None
+        self._csv = None
+        if csv_path:
+            # Without a checkpoint this is a new crawl: the old file is replaced (a delta run appends)
+            fresh = not os.path.exists(csv_path) or not (self.state or delta)
+            self._csv = open(csv_path, 'w' if fresh else 'a', encoding='utf-8')
+            if fresh:
+                self._csv.write("feed_name,user_handle,liked_at\n")
+        self._log = open(checkpoint, 'a', encoding='utf-8')
+
+    def _marks_from_files(self):
+        # Files written before the marks existed: their first line is the newest like
+        for name, uri in self.feeds.items():
+            path = os.path.join(self.jsonl_dir, f"{safe_name(name)}.jsonl")
+            if uri in self.marks or not os.path.exists(path):
+                continue
+            with open(path, encoding='utf-8') as f:
+                line = f.readline()
+            if line.strip():
+                like = json.loads(line)
+                self.marks[uri] = (like['actor_did'], like['created_at'])
+
+    def unmarked_csv_feeds(self):
+        """Names of the feeds a CSV-only delta run cannot append to: already in the CSV, but without a mark.
+
+        Their whole history would be downloaded again and appended next to the old likes.
+        """
+        if not self.delta or self.jsonl_dir or not self.csv_path or not os.path.exists(self.csv_path):
+            return []
+        # feeds in today's checkpoint were started by this delta run and are resumed as such
+        unmarked = {name for name, uri in self.feeds.items() if uri not in self.marks and uri not in self.state}
+        if not unmarked:
+            return []
+        found = set()
+        with open(self.csv_path, encoding='utf-8') as f:
+            next(f, None)
+            for line in f:
+                name = line.rsplit(',', 2)[0]
+                if name in unmarked:
+                    found.add(name)
+        return sorted(found)
+
+    def _save_mark(self, uri, mark, status):
+        if self._marks_log is None or mark is None:
+            return
+        self._marks_log.write(f'{uri}\t{mark[0]}\t{mark[1]}\t{status}\n')
+        self._marks_log.flush()
+
+    def _promote_mark(self, uri):
+        """The feed is complete: its newest like becomes the mark for the next delta run."""
+        mark = self.pending.pop(uri, None)
+        if mark is not None:
+            self.marks[uri] = mark
+            self._save_mark(uri, mark, 'done')
+
+    def pending_feeds(self):
+        """(name, uri) of the feeds not complete yet."""
+        return [(name, uri) for name, uri in self.feeds.items()
+                if uri not in self.state or self.state[uri][0] is not None]
+
+    def _write_page(self, name, uri, likes, jsonl):
+        if jsonl is not None:
+            jsonl.write(''.join(json.dumps({
+                'created_at': like.created_at,
+                'indexed_at': like.indexed_at,
+                'actor_did': like.actor.did,
+                'actor_handle': like.actor.handle,
+                'feed_uri': uri,
+                'feed_name': name,
+            }) + '\n' for like in likes))
+            jsonl.flush()
+        if self._csv is not None:
+            self._csv.write(''.join(f"{name},{like.actor.handle},{like.created_at}\n"
+                                    for like in likes if valid_time(like.created_at)))
+            self._csv.flush()
+
+    def _save_cursor(self, uri, cursor, pages, n_likes):
+        self.state[uri] = (cursor, pages, n_likes)
+        self._log.write(f'{uri}\t{cursor or ""}\t{pages}\t{n_likes}\n')
+        self._log.flush()
+
+    async def crawl_feed(self, client, name, uri):
+        """Downloads the likes of one feed from its saved cursor. Returns True if complete."""
+        cursor, pages, n_likes = self.state.get(uri, (None, 0, 0))
+        resume = uri in self.state
+        if resume:
+            print(f"   resuming {name} at page {pages} ({n_likes} likes)")
+        mark = self.marks.get(uri) if self.delta else None
+        if self.delta and mark is None:
+            print(f"   {name}: no previous like known, downloading the whole feed")
+
+        jsonl = None
+        if self.jsonl_dir:
+            mode = 'a' if resume or self.delta else 'w'
+            jsonl = open(os.path.join(self.jsonl_dir, f"{safe_name(name)}.jsonl"), mode, encoding='utf-8')
+        errors = 0
+        try:
+            while True:
+                try:
+                    self.n_requests += 1
+                    fetched = await client.app.bsky.feed.get_likes(
+                        models.AppBskyFeedGetLikes.Params(uri=uri, cursor=cursor, limit=100))
+                except BadRequestError:
+                    # deleted feed: nothing more to download
+                    self._save_cursor(uri, None, pages, n_likes)
+                    self._promote_mark(uri)
+                    return True
+                except RequestException as e:
+                    errors += 1
+                    if errors > MAX_FEED_ERRORS:
+                        return False
+                    await _handle_requests_exceptions_async(e)
+                    continue
+                except Exception as e:
+                    errors += 1
+                    if errors > MAX_FEED_ERRORS:
+                        return False
+                    print(f"   {datetime.datetime.now().strftime('%H:%M:%S')} {name}: {e}")
+                    await asyncio.sleep(5)
+                    continue
+                errors = 0
+
+                likes, reached = fetched.likes, False
+                if pages == 0 and likes:
+                    # Newest like of this run: the mark of the next one, once the feed is complete
+                    self.pending[uri] = (likes[0].actor.did, likes[0].created_at)
+                    self._save_mark(uri, self.pending[uri], 'pending')
+                if mark is not None:
+                    likes, reached = new_likes(likes, mark)
+
+                self._write_page(name, uri, likes, jsonl)
+                pages += 1
+                n_likes += len(likes)
+                self.total_likes += len(likes)
+
+                # The page is on disk: a restart continues from the next one
+                cursor = fetched.cursor if fetched.likes and not reached else None
+                self._save_cursor(uri, cursor, pages, n_likes)
+                if not cursor:
+                    self._promote_mark(uri)
+                    return True
+        finally:
+            if jsonl is not None:
+                jsonl.close()
+
+    async def run(self, client=None):
+        """Crawls the pending feeds. Returns (complete, left for a later run)."""
+        client = client or await init_async_client()
+        feeds = iter(self.pending_feeds())
+        counts = {True: 0, False: 0}
+
+        async def worker():
+            for name, uri in feeds:
+                print(f"{datetime.datetime.now().strftime('%H:%M:%S')} Processing feed: {name}...")
+                ok = await self.crawl_feed(client, name, uri)
+                counts[ok] += 1
+                n_likes = self.state.get(uri, (None, 0, 0))[2]
+                print(f"   -> {name}: {n_likes} likes{'' if ok else ' (incomplete, too many errors)'}")
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        finally:
+            self.close()
+        return counts[True], counts[False]
+
+    def close(self):
+        if self._csv is not None:
+            self._csv.close()
+            self._csv = None
+        if self._marks_log is not None:
+            self._marks_log.close()
+            self._marks_log = None
+        self._log.close()
+
+
+def main(checkpoint, marks_path, jsonl_dir=None, csv_path=None, script='crawl_feed_post_likes.py'):
+    """Command line of the two wrappers: [--concurrency N] [--restart] [--delta]."""
+    try:
+        from otherfile import myfeeduris
+    except ImportError:
+        print("Error: 'otherfile.py' not found. Did you run 'get_top_feeds.py'?")
+        sys.exit(1)
+
+    concurrency = CONCURRENCY
+    for i in range(len(sys.argv)):
+        if sys.argv[i] == '--concurrency':
+            concurrency = int(sys.argv[i+1])
+        if sys.argv[i] in ('-h', '--help'):
+            print(f"Usage: python {script} [--concurrency N] [--restart] [--delta]")
+            print("       --restart forgets the checkpoint and downloads every feed again")
+            print("       --delta downloads only the likes newer than the previous run and appends them")
+            return
+    delta = '--delta' in sys.argv
+    if delta:
+        checkpoint = delta_checkpoint(checkpoint)
+    if '--restart' in sys.argv and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+    start = time.time()
+    crawl = FeedLikesCrawl(myfeeduris, checkpoint, jsonl_dir, csv_path, concurrency, marks_path, delta)
+    unmarked = crawl.unmarked_csv_feeds()
+    if unmarked:
+        crawl.close()
+        print(f"Error: {len(unmarked)} feeds of {csv_path} have no mark (e.g. {unmarked[0]}), so --delta would append their "
+              f"whole history again. Run python {script} --restart once: it rewrites {csv_path} and saves the marks.")
+        sys.exit(1)
+    pending = crawl.pending_feeds()
+    print(f"Found {len(myfeeduris)} feeds in otherfile.py, {len(pending)} to download ({concurrency} at a time)"
+          f"{', only the new likes' if delta else ''}")
+    if not pending:
+        crawl.close()
+        print("All feeds are complete: use --restart for a new crawl" + (" (today's delta is done)." if delta else ", --delta for the new likes."))
+        return
+
+    done, left = asyncio.run(crawl.run())
+    elapsed = time.time() - start
+    print(f"Done! {done} feeds complete, {left} left for a later run: "
+          f"{crawl.total_likes} likes, {crawl.n_requests} requests in {elapsed:.1f} s")
@@ -0,0 +1,223 @@
+# Raw firehose archive: every frame received from the relay is written, untouched,
+# to size-rotated gzip segments, so a day of network activity can be reprocessed
+# offline without reconnecting.
+#
+# Layout of an archive folder:
+#   seg-<first seq>.frames.gz   frames as [8 byte seq][4 byte length][raw frame bytes]
+#   index.tsv                   one line per segment: name, first seq, last seq, frames, bytes
+#   cursor.txt                  last seq safely flushed to disk (resubscribe from here)
+#
+# Usage:
+#   python listen.py --archive [FOLDER]       (capture)
+#   python firehose_archive.py [FOLDER]       (summary of an existing archive)
+
+import gzip
+import os
+import struct
+import sys
+import time
+
+from atproto import FirehoseSubscribeReposClient, firehose_models
+
+# --- CONFIGURATION ---
+ARCHIVE_DIR = 'firehose_archive'
+MAX_SEGMENT_BYTES = 256 * 1024 * 1024  # uncompressed bytes per segment
+FLUSH_EVERY_FRAMES = 5000
+FLUSH_EVERY_SECONDS = 10
+# ---------------------
+
+_RECORD_HEADER = struct.Struct('>qI')
+
+
+class RawFirehoseClient(FirehoseSubscribeReposClient):
+    """Firehose client whose callback receives the raw frame bytes instead of a decoded frame."""
+
+    def _decode_frame(self, raw_frame):
+        if isinstance(raw_frame, str):
+            return None
+        return raw_frame
+
+
+def decode_frame(data):
+    """Raw frame bytes -> firehose MessageFrame (None for error frames)."""
+    frame = firehose_models.Frame.from_bytes(data)
+    if isinstance(frame, firehose_models.MessageFrame):
+        return frame
+    return None
+
+
+def frame_seq(data):
+    frame = decode_frame(data)
+    if frame is None or not isinstance(frame.body, dict):
+        return None
+    return frame.body.get('seq')
+
+
+def read_cursor(directory=ARCHIVE_DIR):
+    path = os.path.join(directory, 'cursor.txt')
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        content = f.read().strip()
+    return int(content) if content else None
+
+
+def _write_cursor(directory, seq):
+    path = os.path.join(directory, 'cursor.txt')
+    with open(path + '.tmp', 'w') as f:
+        f.write(f'{seq}\n')
+    os.replace(path + '.tmp', path)
+
+
+def read_index(directory=ARCHIVE_DIR):
+    """Returns [(name, first_seq, last_seq, n_frames, n_bytes)] in seq order."""
+    path = os.path.join(directory, 'index.tsv')
+    res = []
+    if not os.path.exists(path):
+        return res
+    with open(path) as f:
+        for line in f:
+            parts = line.rstrip().split('\t')
+            if len(parts) == 5:
+                res.append((parts[0], int(parts[1]), int(parts[2]), int(parts[3]), int(parts[4])))
+    return sorted(res, key=lambda x: x[1])
+
+
+def _iter_segment(path):
+    """Frames of one segment. A segment cut short by a crash is read up to its last flush."""
+    with gzip.open(path, 'rb') as f:
+        while True:
+            try:
+                header = f.read(_RECORD_HEADER.size)
+                if len(header) < _RECORD_HEADER.size:
+                    return
+                seq, length = _RECORD_HEADER.unpack(header)
+                data = f.read(length)
+                if len(data) < length:
+                    return
+            except (EOFError, OSError):
+                return
+            yield seq, data
+
+
+def iter_frames(directory=ARCHIVE_DIR, start_seq=None):
+    """Yields (seq, raw frame bytes) for the whole archive, optionally starting at start_seq.
+
+    After a restart the relay replays from the saved cursor, so the same seq can be
+    stored twice: only the first copy is returned.
+    """
+    last = start_seq - 1 if start_seq is not None else None
+    for name, first_seq, last_seq, _, _ in read_index(directory):
+        if last is not None and last_seq <= last:
+            continue
+        for seq, data in _iter_segment(os.path.join(directory, name)):
+            if last is None or seq > last:
+                last = seq
+                yield seq, data
+
+
+class ArchiveWriter:
+    """Appends raw frames to rotating gzip segments and persists the cursor after each flush."""
+
+    def __init__(self, directory=ARCHIVE_DIR, max_segment_bytes=MAX_SEGMENT_BYTES):
+        self.directory = directory
+        self.max_segment_bytes = max_segment_bytes
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+
+        self._f = None
+        self._name = None
+        self._first_seq = None
+        self._last_seq = None
+        self._frames = 0
+        self._bytes = 0
+        self._unflushed = 0
+        self._last_flush = time.time()
+        self.total_frames = 0
+
+    def _recover(self):
+        """Indexes the segments left open by a crashed run."""
+        indexed = {row[0] for row in read_index(self.directory)}
+        for name in sorted(os.listdir(self.directory)):
+            if not name.startswith('seg-') or name in indexed:
+                continue
+            first_seq, last_seq, frames, n_bytes = None, None, 0, 0
+            for seq, data in _iter_segment(os.path.join(self.directory, name)):
+                if first_seq is None:
+                    first_seq = seq
+                last_seq = seq
+                frames += 1
+                n_bytes += len(data)
+            if frames > 0:
+                self._append_index(name, first_seq, last_seq, frames, n_bytes)
+                print(f'Recovered segment {name}: {frames} frames')
+
+    def _append_index(self, name, first_seq, last_seq, frames, n_bytes):
+        with open(os.path.join(self.directory, 'index.tsv'), 'a') as f:
+            f.write(f'{name}\t{first_seq}\t{last_seq}\t{frames}\t{n_bytes}\n')
+
+    def _open_segment(self, seq):
+        self._name = f'seg-{seq:012d}.frames.gz'
+        n = 1
+        while os.path.exists(os.path.join(self.directory, self._name)):
+            self._name = f'seg-{seq:012d}-{n}.frames.gz'
+            n += 1
+        self._f = gzip.open(os.path.join(self.directory, self._name), 'wb')
+        self._first_seq = seq
+        self._frames = 0
+        self._bytes = 0
+
+    def _close_segment(self):
+        if self._f is None:
+            return
+        self.flush()
+        self._f.close()
+        self._append_index(self._name, self._first_seq, self._last_seq, self._frames, self._bytes)
+        self._f = None
+
+    def write(self, seq, data):
+        if self._f is None:
+            self._open_segment(seq)
+        self._f.write(_RECORD_HEADER.pack(seq, len(data)))
+        self._f.write(data)
+        self._last_seq = seq
+        self._frames += 1
+        self._bytes += len(data)
+        self._unflushed += 1
+        self.total_frames += 1
+
+        if self._bytes >= self.max_segment_bytes:
+            self._close_segment()
+        elif self._unflushed >= FLUSH_EVERY_FRAMES or time.time() - self._last_flush > FLUSH_EVERY_SECONDS:
+            self.flush()
+
+    def flush(self):
+        """Makes everything written so far readable from disk, then moves the cursor."""
+        if self._f is None or self._unflushed == 0:
+            return
+        self._f.flush()
+        os.fsync(self._f.fileobj.fileno())
+        _write_cursor(self.directory, self._last_seq)
+        self._unflushed = 0
+        self._last_flush = time.time()
+
+    @property
+    def last_seq(self):
+        return self._last_seq
+
+    def close(self):
+        self._close_segment()
+
+
+if __name__ == '__main__':
+    directory = sys.argv[1] if len(sys.argv) > 1 else ARCHIVE_DIR
+    index = read_index(directory)
+    if not index:
+        print(f'No segments found in {directory}')
+        sys.exit(0)
+
+    print(f'{"segment":<30} {"first seq":>14} {"last seq":>14} {"frames":>10} {"MB":>8}')
+    for name, first_seq, last_seq, frames, n_bytes in index:
+        print(f'{name:<30} {first_seq:>14} {last_seq:>14} {frames:>10} {n_bytes / 2**20:>8.1f}')
+    print(f'\nTotal frames: {sum(r[3] for r in index)}')
+    print(f'Resume cursor: {read_cursor(directory)}')
@@ -0,0 +1,157 @@
+# Streaming decoder for firehose commits.
+#
+# The interesting content of a commit is not in the top-level CBOR map but in its
+# CAR 'blocks', addressed by the CIDs listed in 'ops'. This module turns every
+# created record into a typed row (post, like, repost, follow) and writes them as
+# JSON lines:
+#   posts   -> data/chunk_stream/stream-<start>.jsonl.gz  (same layout clean_data.py reads:
+#              'uri', 'author.did', 'user', 'record' with createdAt/text/langs/reply, 'embed')
+#   others  -> data/stream/<kind>s-<start>.jsonl.gz      ('uri', 'user', 'record' with subject/createdAt)
+# Only posts go in a 'chunk' folder, so clean_data.py does not mistake likes for posts.
+# Files are block-compressed (blockgz.py), with a .idx written on close.
+#
+# Usage:
+#   python listen.py --records [BASE]               (live)
+#   python firehose_decode.py ARCHIVE_DIR [BASE]    (replay a firehose archive offline)
+
+import datetime
+import json
+import os
+import sys
+
+from atproto import CAR, CID, models, parse_subscribe_repos_message
+
+from blockgz import BlockWriter
+
+# --- CONFIGURATION ---
+BASE_DEFAULT = 'data'
+FLUSH_EVERY_N_RECORDS = 1000
+# ---------------------
+
+COLLECTIONS = {
+    'app.bsky.feed.post': 'post',
+    'app.bsky.feed.like': 'like',
+    'app.bsky.feed.repost': 'repost',
+    'app.bsky.graph.follow': 'follow',
+}
+
+
+def _json_default(o):
+    # CID links (blob refs, ...) come out of the CAR as raw CID bytes
+    if isinstance(o, (bytes, bytearray)):
+        try:
+            return CID.from_decoded_bytes(bytes(o)).encode()
+        except Exception:
+            return bytes(o).hex()
+    return str(o)
+
+
+def to_json(row):
+    return json.dumps(row, default=_json_default)
+
+
+def decode_commit(frame, users=None):
+    """Firehose MessageFrame -> list of (kind, row) for the records created by the commit.
+
+    If users is given (a set of DIDs, or anything supporting 'in'), commits of other repos are skipped
+    before their blocks are decoded.
+    """
+    commit = parse_subscribe_repos_message(frame)
+    if not isinstance(commit, models.ComAtprotoSyncSubscribeRepos.Commit) or not commit.blocks:
+        return []
+    if users is not None and commit.repo not in users:
+        return []
+
+    wanted = [op for op in commit.ops
+              if op.action == 'create' and op.cid and op.path.split('/')[0] in COLLECTIONS]
+    if not wanted:
+        return []
+
+    car = CAR.from_bytes(commit.blocks)
+    rows = []
+    for op in wanted:
+        record = car.blocks.get(op.cid)
+        if not record:
+            continue
+        kind = COLLECTIONS[op.path.split('/')[0]]
+        row = {
+            'uri': f'at://{commit.repo}/{op.path}',
+            'cid': str(op.cid),
+            'user': commit.repo,
+            'record': record,
+            'indexed_at': commit.time,
+        }
+        if kind == 'post':
+            row['author'] = {'did': commit.repo}
+            row['embed'] = record.get('embed')
+        rows.append((kind, row))
+    return rows
+
+
+class StreamRecordWriter:
+    """One block-compressed JSONL file per record kind, opened lazily; every FLUSH_EVERY_N_RECORDS rows end a block."""
+
+    def __init__(self, base=BASE_DEFAULT):
+        self.base = base
+        self.stamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+        self.files = {}
+        self.counts = {kind: 0 for kind in COLLECTIONS.values()}
+
+    def _path(self, kind):
+        if kind == 'post':
+            folder = os.path.join(self.base, 'chunk_stream')
+            name = f'stream-{self.stamp}.jsonl.gz'
+        else:
+            folder = os.path.join(self.base, 'stream')
+            name = f'{kind}s-{self.stamp}.jsonl.gz'
+        os.makedirs(folder, exist_ok=True)
+        return os.path.join(folder, name)
+
+    def write(self, kind, row):
+        f = self.files.get(kind)
+        if f is None:
+            f = self.files[kind] = BlockWriter(self._path(kind))
+        f.write((to_json(row) + '\n').encode('utf-8'))
+        self.counts[kind] += 1
+        if self.counts[kind] % FLUSH_EVERY_N_RECORDS == 0:
+            f.flush()
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+
+
+if __name__ == '__main__':
+    from firehose_archive import decode_frame, iter_frames
+
+    if len(sys.argv) < 2:
+        print("Usage: python firehose_decode.py ARCHIVE_DIR [BASE]")
+        sys.exit(1)
+
+    archive_dir = sys.argv[1]
+    base = sys.argv[2] if len(sys.argv) > 2 else BASE_DEFAULT
+
+    writer = StreamRecordWriter(base)
+    n_frames = 0
+    bad_frames = 0
+    try:
+        for seq, data in iter_frames(archive_dir):
+            n_frames += 1
+            try:
+                frame = decode_frame(data)
+                if frame is None:
+                    continue
+                for kind, row in decode_commit(frame):
+                    writer.write(kind, row)
+            except Exception:
+                bad_frames += 1
+            if n_frames % 10000 == 0:
+                sys.stdout.write(f"\rFrames: {n_frames}  {writer.counts}")
+                sys.stdout.flush()
+    finally:
+        writer.close()
+
+    print(f"\nFrames read: {n_frames} (undecodable: {bad_frames})")
+    for kind, n in writer.counts.items():
+        print(f"{kind}s: {n}")
@@ -0,0 +1,183 @@
+# Receive/decode pipeline for the firehose listener.
+#
+# The websocket callback must return quickly, otherwise the relay drops slow
+# consumers. Here the callback only pushes the raw frame into a bounded ring
+# buffer; a pool of decoder workers (threads or processes) empties it, and a single
+# sink thread consumes the results (dedup, file writes), so no locking is needed
+# in the sink. When the buffer is full the oldest frame is dropped and counted.
+#
+#   websocket thread --submit()--> ring buffer --> decoders --> results queue --> sink thread
+
+import collections
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from firehose_archive import decode_frame
+
+# --- CONFIGURATION ---
+BUFFER_SIZE = 100000     # raw frames waiting to be decoded
+BATCH_SIZE = 256         # frames handed to a decoder at once
+DEFAULT_WORKERS = 4
+# ---------------------
+
+_STOP = object()
+
+
+def frame_repo(data):
+    """Raw frame -> DID of the repo it is about (None for frames without one)."""
+    frame = decode_frame(data)
+    if frame is None or not isinstance(frame.body, dict):
+        return None
+    return frame.body.get('repo')
+
+
+def _decode_batch(decode, batch):
+    """Runs in the decoder (thread or process): returns (results, n_errors)."""
+    results = []
+    errors = 0
+    for data in batch:
+        try:
+            results.append(decode(data))
+        except Exception:
+            errors += 1
+    return results, errors
+
+
+class FramePipeline:
+    """Bounded ring buffer between the websocket callback and a pool of decoders.
+
+    decode(data) runs on the workers and must be a top-level function when
+    use_processes is True; sink(result) runs on one thread, in arrival order.
+    """
+
+    def __init__(self, decode, sink, workers=DEFAULT_WORKERS, buffer_size=BUFFER_SIZE,
+                 use_processes=False, batch_size=BATCH_SIZE):
+        self.decode = decode
+        self.sink = sink
+        self.workers = workers
+        self.buffer_size = buffer_size
+        self.use_processes = use_processes
+        self.batch_size = batch_size
+
+        self._buf = collections.deque()
+        self._cond = threading.Condition()
+        self._results = queue.Queue(maxsize=workers * 4)
+        self._stopping = False
+        self._threads = []
+        self._pool = None
+
+        # --- METRICS ---
+        self.received = 0
+        self.dropped = 0
+        self.decoded = 0
+        self.decode_errors = 0
+        self.sink_errors = 0
+        self.max_depth = 0
+        self.started_at = None
+
+    # --- RECEIVE SIDE (websocket thread) ---
+
+    def submit(self, data):
+        """Never blocks: if the buffer is full the oldest frame is discarded."""
+        with self._cond:
+            if len(self._buf) >= self.buffer_size:
+                self._buf.popleft()
+                self.dropped += 1
+            self._buf.append(data)
+            self.received += 1
+            if len(self._buf) > self.max_depth:
+                self.max_depth = len(self._buf)
+            self._cond.notify()
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._buf:
+                if self._stopping:
+                    return None
+                self._cond.wait(0.5)
+            n = min(self.batch_size, len(self._buf))
+            return [self._buf.popleft() for _ in range(n)]
+
+    # --- DECODERS ---
+
+    def _thread_worker(self):
+        while (batch := self._next_batch()) is not None:
+            self._results.put(_decode_batch(self.decode, batch))
+
+    def _process_dispatcher(self):
+        # Bounds the batches in flight so the results queue, not memory, takes the backpressure
+        in_flight = threading.Semaphore(self.workers * 2)
+
+        def done(future):
+            in_flight.release()
+            try:
+                self._results.put(future.result())
+            except Exception:
+                self._results.put(([], 1))
+
+        while (batch := self._next_batch()) is not None:
+            in_flight.acquire()
+            self._pool.submit(_decode_batch, self.decode, batch).add_done_callback(done)
+
+    # --- SINK ---
+
+    def _sink_worker(self):
+        while (item := self._results.get()) is not _STOP:
+            results, errors = item
+            self.decoded += len(results)
+            self.decode_errors += errors
+            for result in results:
+                try:
+                    self.sink(result)
+                except Exception:
+                    self.sink_errors += 1
+
+    # --- LIFECYCLE ---
+
+    def start(self):
+        self.started_at = time.time()
+        if self.use_processes:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+            decoders = [threading.Thread(target=self._process_dispatcher, daemon=True)]
+        else:
+            decoders = [threading.Thread(target=self._thread_worker, daemon=True) for _ in range(self.workers)]
+        self._sink_thread = threading.Thread(target=self._sink_worker, daemon=True)
+        self._threads = decoders
+        for t in decoders:
+            t.start()
+        self._sink_thread.start()
+
+    def stop(self):
+        """Decodes what is still buffered, then stops the workers and the sink."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+        self._results.put(_STOP)
+        self._sink_thread.join()
+
+    def stats(self):
+        elapsed = max(time.time() - (self.started_at or time.time()), 1e-9)
+        return {
+            'received': self.received,
+            'dropped': self.dropped,
+            'decoded': self.decoded,
+            'decode_errors': self.decode_errors,
+            'sink_errors': self.sink_errors,
+            'buffer_depth': len(self._buf),
+            'max_buffer_depth': self.max_depth,
+            'buffer_fill': len(self._buf) / self.buffer_size,
+            'results_waiting': self._results.qsize(),
+            'frames_per_sec': self.received / elapsed,
+        }
+
+    def report(self):
+        s = self.stats()
+        return (f"recv {s['received']} ({s['frames_per_sec']:.0f}/s) | decoded {s['decoded']} | "
+                f"dropped {s['dropped']} | buffer {s['buffer_depth']} ({s['buffer_fill']:.0%}, max {s['max_buffer_depth']}) | "
+                f"errors {s['decode_errors']}")
@@ -2,29 +2,12 @@
 
 import os
 import datetime
-from atproto import Client
+from bsky_client import init_client
 
 # --- CONFIGURATION ---
 OUTPUT_FILE = "otherfile.py" # The file needed by the next script
 # ---------------------
 
-def get_session():
-    try:
-        with open('session.txt', 'r') as f:
-            return f.read().strip()
-    except FileNotFoundError:
-        return None
-
-def init_client():
-    client = Client()
-    session_string = get_session()
-    if session_string:
-        print('Reusing session from session.txt')
-        client.login(session_string=session_string)
-    else:
-        raise Exception("Session file not found. Run create_session.py first.")
-    return client
-
 def main():
     print("--- GENERATE TOP FEEDS LIST ---")
 
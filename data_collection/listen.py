@@ -1,17 +1,149 @@
 import sys
 import time
-import os
-import cbor2
-from atproto import FirehoseSubscribeReposClient, models
+from atproto import FirehoseSubscribeReposClient
+from firehose_archive import ARCHIVE_DIR, ArchiveWriter, RawFirehoseClient, frame_seq, read_cursor
+from firehose_decode import BASE_DEFAULT, StreamRecordWriter, decode_commit
+from firehose_pipeline import DEFAULT_WORKERS, FramePipeline, frame_repo
+from did_dedup import DEFAULT_FP_RATE, open_dedup, save_dedup
 
 # --- CONFIGURATION ---
 # Ora definiamo DUE file di output
 FILE_TIMELINES = "1.txt"         # Per crawl_timelines.py
 FILE_NETWORK = "batch_1.txt"     # Per crawl_followers.py
 MAX_TIME_MINUTES = 30
+WORKERS = DEFAULT_WORKERS        # decoder workers (--workers N)
+USE_PROCESSES = False            # --processes: decode in worker processes instead of threads
+DEDUP_MODE = 'exact'             # --dedup exact|bloom|set: how seen DIDs are remembered
+DEDUP_FILE = FILE_TIMELINES + '.dedup'
+FP_RATE = DEFAULT_FP_RATE        # --fp-rate for the bloom mode
 # ----------------------
 
+def run_archive(directory):
+    """Archive mode: stores every raw frame until Ctrl+C, resuming from the saved cursor."""
+    print("--- BLUESKY FIREHOSE LISTENER (Archive Mode) ---")
+
+    cursor = read_cursor(directory)
+    writer = ArchiveWriter(directory)
+    params = {'cursor': cursor} if cursor is not None else None
+    client = RawFirehoseClient(params)
+
+    print(f"Archive folder: {directory}")
+    print(f"Resuming from cursor: {cursor}" if cursor is not None else "No cursor found: starting from live events")
+    print("Press Ctrl+C to stop.\n")
+
+    start_time_run = time.time()
+
+    def on_raw_frame(data) -> None:
+        seq = frame_seq(data)
+        if seq is None:
+            return
+        writer.write(seq, data)
+
+        # Keep the reconnection cursor close to what we have stored
+        if writer.total_frames % 1000 == 0:
+            client.update_params({'cursor': seq})
+            sys.stdout.write(f"\rArchived: {writer.total_frames} frames (seq {seq})")
+            sys.stdout.flush()
+
+    try:
+        client.start(on_raw_frame)
+    except KeyboardInterrupt:
+        print("\nStopping by user request...")
+        client.stop()
+    except Exception as e:
+        print(f"\nError occurred: {e}")
+        client.stop()
+    finally:
+        writer.close()
+
+    total_duration = time.time() - start_time_run
+    print("\n" + "="*40)
+    print(f"FRAMES ARCHIVED: {writer.total_frames}")
+    print(f"LAST SEQ: {writer.last_seq}")
+    print(f"TOTAL TIME: {total_duration:.2f} seconds ({total_duration/60:.2f} minutes)")
+    print("="*40 + "\n")
+
+
+def run_records(base, users_file=None):
+    """Records mode: decodes the records created by every commit and stores them as JSON lines."""
+    print("--- BLUESKY FIREHOSE LISTENER (Records Mode) ---")
+
+    users = None
+    if users_file:
+        with open(users_file, 'r') as f:
+            users = set(l.strip() for l in f if l.strip())
+        print(f"Keeping only the {len(users)} users listed in {users_file}")
+
+    writer = StreamRecordWriter(base)
+    stats = {'frames': 0, 'errors': 0}
+    start_time_run = time.time()
+    print(f"Saving posts to {base}/chunk_stream and likes/reposts/follows to {base}/stream")
+    print("Press Ctrl+C to stop.\n")
+
+    def on_message_handler(message) -> None:
+        stats['frames'] += 1
+        try:
+            for kind, row in decode_commit(message, users):
+                writer.write(kind, row)
+        except Exception:
+            stats['errors'] += 1
+
+        if stats['frames'] % 1000 == 0:
+            c = writer.counts
+            sys.stdout.write(f"\rposts: {c['post']}  likes: {c['like']}  reposts: {c['repost']}  follows: {c['follow']}")
+            sys.stdout.flush()
+
+    client = FirehoseSubscribeReposClient()
+    try:
+        client.start(on_message_handler)
+    except KeyboardInterrupt:
+        print("\nStopping by user request...")
+        client.stop()
+    except Exception as e:
+        print(f"\nError occurred: {e}")
+        client.stop()
+    finally:
+        writer.close()
+
+    total_duration = time.time() - start_time_run
+    print("\n" + "="*40)
+    print(f"FRAMES: {stats['frames']} (undecodable: {stats['errors']})")
+    for kind, n in writer.counts.items():
+        print(f"{kind.upper()}S: {n}")
+    print(f"TOTAL TIME: {total_duration:.2f} seconds ({total_duration/60:.2f} minutes)")
+    print("="*40 + "\n")
+
+
 def main():
+    # ARCHIVE MODE: python listen.py --archive [FOLDER]
+    if '--archive' in sys.argv:
+        i = sys.argv.index('--archive')
+        directory = sys.argv[i+1] if i + 1 < len(sys.argv) else ARCHIVE_DIR
+        run_archive(directory)
+        return
+
+    # RECORDS MODE: python listen.py --records [BASE] [--users FILE]
+    if '--records' in sys.argv:
+        i = sys.argv.index('--records')
+        base = BASE_DEFAULT
+        if i + 1 < len(sys.argv) and not sys.argv[i+1].startswith('--'):
+            base = sys.argv[i+1]
+        users_file = None
+        if '--users' in sys.argv:
+            users_file = sys.argv[sys.argv.index('--users') + 1]
+        run_records(base, users_file)
+        return
+
+    global WORKERS, USE_PROCESSES, DEDUP_MODE, FP_RATE
+    if '--workers' in sys.argv:
+        WORKERS = int(sys.argv[sys.argv.index('--workers') + 1])
+    if '--processes' in sys.argv:
+        USE_PROCESSES = True
+    if '--dedup' in sys.argv:
+        DEDUP_MODE = sys.argv[sys.argv.index('--dedup') + 1]
+    if '--fp-rate' in sys.argv:
+        FP_RATE = float(sys.argv[sys.argv.index('--fp-rate') + 1])
+
     print("--- BLUESKY FIREHOSE LISTENER (Dual Write Mode) ---")
     
     try:
@@ -24,13 +156,11 @@ def main():
     start_time_run = time.time()
     end_time_limit = start_time_run + (MAX_TIME_MINUTES * 60)
     
-    unique_users = set()
-    
     # Carichiamo la memoria dal file principale per non avere duplicati
-    if os.path.exists(FILE_TIMELINES):
-        with open(FILE_TIMELINES, 'r') as f:
-            for line in f:
-                unique_users.add(line.strip())
+    # (the saved DID set is mmapped; only lines added to 1.txt after its last save are read)
+    load_start = time.time()
+    unique_users = open_dedup(DEDUP_MODE, DEDUP_FILE, FILE_TIMELINES, fp_rate=FP_RATE)
+    print(f"Loaded {len(unique_users)} known users ({DEDUP_MODE} mode) in {time.time() - load_start:.2f} s")
     
     print(f"\nStarting listener...")
     print(f"Target: {TARGET_USERS} users")
@@ -42,54 +172,41 @@ def main():
     f1 = open(FILE_TIMELINES, 'a', encoding='utf-8')
     f2 = open(FILE_NETWORK, 'a', encoding='utf-8')
 
-    def custom_tag_hook(decoder, tag, shareable_index=None):
-        return tag.value
+    # The websocket callback only queues the raw frame: decoding happens on the
+    # pipeline workers, dedup and writes on its single sink thread.
+    def on_repo(user_did) -> None:
+        if not user_did or user_did in unique_users:
+            return
 
-    def on_message_handler(message) -> None:
         # STOP CHECKS
-        if len(unique_users) >= TARGET_USERS:
+        if len(unique_users) >= TARGET_USERS or time.time() > end_time_limit:
             client.stop()
             return
 
-        if len(unique_users) % 100 == 0:
-            if time.time() > end_time_limit:
-                client.stop()
-                return
+        unique_users.add(user_did)
 
-        try:
-            # UNIVERSAL DECODING
-            if isinstance(message.body, dict):
-                decoded_data = message.body
-            else:
-                decoded_data = cbor2.loads(message.body, tag_hook=custom_tag_hook)
-            
-            user_did = decoded_data.get('repo')
-            
-            if user_did:
-                if user_did not in unique_users:
-                    unique_users.add(user_did)
-                    
-                    # SCRITTURA DOPPIA
-                    # Scriviamo lo stesso dato su entrambi i file
-                    f1.write(f"{user_did}\n")
-                    f2.write(f"{user_did}\n")
-                    
-                    # Flush ogni tanto per sicurezza (salva su disco)
-                    if len(unique_users) % 10 == 0:
-                        f1.flush()
-                        f2.flush()
-                    
-                    if len(unique_users) % 50 == 0:
-                        sys.stdout.write(f"\rCollected: {len(unique_users)} / {TARGET_USERS} users")
-                        sys.stdout.flush()
+        # SCRITTURA DOPPIA
+        # Scriviamo lo stesso dato su entrambi i file
+        f1.write(f"{user_did}\n")
+        f2.write(f"{user_did}\n")
 
-        except Exception:
-            pass
+        # Flush ogni tanto per sicurezza (salva su disco)
+        if len(unique_users) % 10 == 0:
+            f1.flush()
+            f2.flush()
+
+        if len(unique_users) % 50 == 0:
+            sys.stdout.write(f"\rCollected: {len(unique_users)} / {TARGET_USERS} users | {pipeline.report()}")
+            sys.stdout.flush()
+
+    pipeline = FramePipeline(frame_repo, on_repo, workers=WORKERS, use_processes=USE_PROCESSES)
+    client = RawFirehoseClient()
+
+    print(f"Decoders: {WORKERS} {'processes' if USE_PROCESSES else 'threads'}, buffer of {pipeline.buffer_size} frames\n")
+    pipeline.start()
 
-    client = FirehoseSubscribeReposClient()
-    
     try:
-        client.start(on_message_handler)
+        client.start(pipeline.submit)
     except KeyboardInterrupt:
         print("\nStopping by user request...")
         client.stop()
@@ -97,9 +214,11 @@ def main():
         print(f"\nError occurred: {e}")
         client.stop()
     finally:
+        pipeline.stop()
         # CHIUSURA DOPPIA
         f1.close()
         f2.close()
+        save_dedup(unique_users, DEDUP_FILE, FILE_TIMELINES)
     
     # --- SUMMARY ---
     total_duration = time.time() - start_time_run
@@ -109,6 +228,7 @@ def main():
     print(f"FILES CREATED: {FILE_TIMELINES} & {FILE_NETWORK}")
     print(f"TOTAL TIME: {total_duration:.2f} seconds ({total_duration/60:.2f} minutes)")
     print(f"TOTAL USERS SAVED: {len(unique_users)}")
+    print(f"PIPELINE: {pipeline.report()}")
     print("="*40 + "\n")
     print(f"Next steps:")
     print(f"1. For Posts: Run 'python crawl_timelines.py 1'")
@@ -0,0 +1,394 @@
+# Local stand-in for the Bluesky AppView, to benchmark the crawlers offline.
+#
+# Serves the XRPC endpoints used by the crawlers and the census scripts with synthetic
+# data (deterministic: the same actor always has the same posts, followers, ...) or with
+# recorded responses, honours cursors, adds latency, and applies a rate limit with the
+# same RateLimit-* headers and 429 answers as the real service.
+#
+#   app.bsky.feed.getAuthorFeed            posts spread over the last ~60 days
+#   app.bsky.graph.getFollowers / getFollows
+#   app.bsky.feed.getLikes
+#   app.bsky.actor.getProfile / getProfiles / searchActors
+#   app.bsky.feed.searchFeedGenerators / getActorFeeds
+#   app.bsky.unspecced.getPopularFeedGenerators / searchPostsSkeleton
+#   com.atproto.server.createSession / refreshSession / getSession   (any credentials)
+#
+# Recorded fixtures (--fixtures FILE): JSON lines {"nsid": ..., "params": {...}, "response": {...}};
+# a request whose NSID and parameters match exactly gets the recorded response.
+#
+# Usage:
+#   python mock_appview.py [--port 8123] [--latency 80] [--limit 3000] [--window 300] [--error-rate 0.01] [--fixtures FILE]
+#   BSKY_BASE_URL=http://127.0.0.1:8123 python crawl_timelines.py 0
+# (bench_crawlers.py starts it by itself.)
+
+import base64
+import datetime
+import gzip
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# --- CONFIGURATION ---
+PORT = 8123
+LATENCY_MS = 80          # mean response time
+JITTER = 0.5             # latency varies uniformly by +-50%
+RATE_LIMIT = 3000        # requests per window, as Bluesky
+RATE_WINDOW = 300        # seconds
+ERROR_RATE = 0.0         # share of requests answered with a 502
+GZIP_MIN_BYTES = 1024
+# ---------------------
+
+PAGE_MAX = 100
+
+
+def _rng(*key):
+    return random.Random(hashlib.blake2b('|'.join(map(str, key)).encode(), digest_size=8).digest())
+
+
+def _did(*key):
+    h = hashlib.blake2b('|'.join(map(str, key)).encode(), digest_size=15).digest()
+    return 'did:plc:' + base64.b32encode(h).decode().lower()
+
+
+def _iso(ts):
+    return datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+
+def _jwt(did, scope, seconds):
+    def enc(d):
+        return base64.urlsafe_b64encode(json.dumps(d).encode()).rstrip(b'=').decode()
+    now = int(time.time())
+    return '.'.join([enc({'alg': 'HS256', 'typ': 'at+jwt'}),
+                     enc({'scope': scope, 'sub': did, 'iat': now, 'exp': now + seconds}),
+                     'c2lnbmF0dXJl'])
+
+
+class SyntheticData:
+    """Deterministic fake network. `now` is fixed at start so pagination stays consistent."""
+
+    def __init__(self, now=None):
+        self.now = now or time.time()
+        self._creators = None
+
+    # --- sizes ---
+
+    def n_posts(self, actor):
+        r = _rng('posts', actor).random()
+        rng = _rng('posts-n', actor)
+        if r < 0.70:
+            return rng.randint(0, 50)
+        if r < 0.95:
+            return rng.randint(50, 300)
+        return rng.randint(300, 1500)
+
+    def n_relations(self, kind, actor):
+        r = _rng(kind, actor).random()
+        rng = _rng(kind + '-n', actor)
+        if kind == 'follows':
+            return rng.randint(0, 1000)
+        if r < 0.90:
+            return rng.randint(0, 300)
+        if r < 0.99:
+            return rng.randint(300, 5000)
+        return rng.randint(5000, 50000)
+
+    # --- objects ---
+
+    def profile(self, did, detailed=False):
+        handle = f'u{did[-10:]}.bsky.social'
+        res = {'did': did, 'handle': handle, 'displayName': handle.split('.')[0],
+               'indexedAt': _iso(self.now - 86400 * 200), 'createdAt': _iso(self.now - 86400 * 300)}
+        if detailed:
+            res.update({'followersCount': self.n_relations('followers', did),
+                        'followsCount': self.n_relations('follows', did),
+                        'postsCount': self.n_posts(did), 'description': 'synthetic account'})
+        return res
+
+    def post(self, actor, k, n):
+        # Post k of n (newest first), spread over ~60 days so part of them is outside the 30 day window
+        ts = self.now - 3600 - k * (60 * 86400 / max(n, 1))
+        rng = _rng('post', actor, k)
+        mention = f'@u{actor[-10:]}.bsky.social'
+        text = f'synthetic post {k} by {mention}'
+        start = len(text.encode()) - len(mention.encode())
+        record = {'$type': 'app.bsky.feed.post', 'text': text,
+                  'facets': [{'$type': 'app.bsky.richtext.facet',
+                              'index': {'byteStart': start, 'byteEnd': start + len(mention.encode())},
+                              'features': [{'$type': 'app.bsky.richtext.facet#mention', 'did': actor}]}],
+                  'createdAt': _iso(ts), 'langs': [rng.choice(['en', 'en', 'it', 'ja', 'pt'])]}
+        if rng.random() < 0.3:
+            parent = f'at://{_did("user", rng.randint(0, 10**6))}/app.bsky.feed.post/{rng.randint(0, 10**9)}'
+            record['reply'] = {'root': {'uri': parent, 'cid': 'bafyreimock'}, 'parent': {'uri': parent, 'cid': 'bafyreimock'}}
+        return {'post': {
+            'uri': f'at://{actor}/app.bsky.feed.post/{k:010d}', 'cid': 'bafyreimock',
+            'author': self.profile(actor), 'record': record,
+            'replyCount': rng.randint(0, 5), 'repostCount': rng.randint(0, 5),
+            'likeCount': rng.randint(0, 50), 'quoteCount': 0,
+            'indexedAt': _iso(ts + 1), 'labels': [],
+        }}
+
+    def feed_generator(self, key):
+        creator = _did('creator', key % 5000)
+        rng = _rng('feed', key)
+        return {'uri': f'at://{creator}/app.bsky.feed.generator/feed{key}', 'cid': 'bafyreimock',
+                'did': 'did:web:feeds.example.com', 'creator': self.profile(creator),
+                'displayName': f'Feed {key}', 'description': 'synthetic feed',
+                'likeCount': int(rng.paretovariate(1.2)) - 1, 'indexedAt': _iso(self.now - rng.randint(0, 400) * 86400)}
+
+    # --- endpoints: (params) -> response ---
+
+    @staticmethod
+    def _page(params, total):
+        start = int(params.get('cursor') or 0)
+        limit = min(int(params.get('limit') or 50), PAGE_MAX)
+        end = min(start + limit, total)
+        return range(start, end), (str(end) if end < total else None)
+
+    def get_author_feed(self, p):
+        actor = p['actor']
+        n = self.n_posts(actor)
+        ks, cursor = self._page(p, n)
+        return {'feed': [self.post(actor, k, n) for k in ks], 'cursor': cursor}
+
+    def _relations(self, kind, p):
+        actor = p['actor']
+        ks, cursor = self._page(p, self.n_relations(kind, actor))
+        return {'subject': self.profile(actor), kind: [self.profile(_did(kind, actor, k)) for k in ks], 'cursor': cursor}
+
+    def get_followers(self, p):
+        return self._relations('followers', p)
+
+    def get_follows(self, p):
+        return self._relations('follows', p)
+
+    def get_likes(self, p):
+        uri = p['uri']
+        ks, cursor = self._page(p, _rng('likes', uri).randint(0, 5000))
+        likes = [{'actor': self.profile(_did('liker', uri, k)), 'createdAt': _iso(self.now - k * 60),
+                  'indexedAt': _iso(self.now - k * 60)} for k in ks]
+        return {'uri': uri, 'likes': likes, 'cursor': cursor}
+
+    def get_profile(self, p):
+        return self.profile(p['actor'], detailed=True)
+
+    def get_profiles(self, p):
+        return {'profiles': [self.profile(a, detailed=True) for a in p.get('actors', [])[:25]]}
+
+    def search_actors(self, p):
+        q = p.get('q', '')
+        ks, cursor = self._page(p, _rng('actors', q).randint(0, 300))
+        base = int(hashlib.md5(q.encode()).hexdigest()[:6], 16)
+        return {'actors': [self.profile(_did('creator', (base + k) % 5000)) for k in ks], 'cursor': cursor}
+
+    def search_posts_skeleton(self, p):
+        q = p.get('q', '')
+        ks, cursor = self._page(p, _rng('posts-q', q).randint(0, 300))
+        return {'posts': [{'uri': f'at://{_did("creator", (k * 7) % 5000)}/app.bsky.feed.post/{k}'} for k in ks],
+                'cursor': cursor}
+
+    def search_feed_generators(self, p):
+        q = p.get('q') or p.get('query') or ''
+        total = _rng('feeds-q', q).randint(50, 2000)
+        ks, cursor = self._page(p, total)
+        base = int(hashlib.md5(q.encode()).hexdigest()[:6], 16) % 20000
+        return {'feeds': [self.feed_generator((base + k) % 20000) for k in ks], 'cursor': cursor}
+
+    def get_popular_feed_generators(self, p):
+        if p.get('query'):
+            return self.search_feed_generators(p)
+        ks, cursor = self._page(p, 500)
+        return {'feeds': [self.feed_generator(k) for k in ks], 'cursor': cursor}
+
+    def get_actor_feeds(self, p):
+        if self._creators is None:
+            self._creators = {_did('creator', i): i for i in range(5000)}
+        i = self._creators.get(p['actor'])
+        keys = [] if i is None else [i + 5000 * j for j in range(4)]
+        return {'feeds': [self.feed_generator(k) for k in keys]}
+
+
+class MockState:
+    """Rate limit window and counters shared by the handler threads."""
+
+    def __init__(self, limit=RATE_LIMIT, window=RATE_WINDOW, latency_ms=LATENCY_MS,
+                 error_rate=ERROR_RATE, fixtures=None, use_gzip=True):
+        self.limit = limit
+        self.window = window
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.use_gzip = use_gzip
+        self.data = SyntheticData()
+        self.fixtures = fixtures or {}
+        self.lock = threading.Lock()
+        self.window_start = time.time()
+        self.used = 0
+        self.requests = {}
+        self.rate_limited = 0
+        self.errors = 0
+
+    def take(self):
+        """Counts a request in the current window. Returns (allowed, remaining, reset)."""
+        with self.lock:
+            now = time.time()
+            if now - self.window_start >= self.window:
+                self.window_start = now
+                self.used = 0
+            self.used += 1
+            reset = int(self.window_start + self.window)
+            if self.used > self.limit:
+                self.rate_limited += 1
+                return False, 0, reset
+            return True, self.limit - self.used, reset
+
+    def count(self, nsid):
+        with self.lock:
+            self.requests[nsid] = self.requests.get(nsid, 0) + 1
+
+    def total_requests(self):
+        with self.lock:
+            return sum(self.requests.values())
+
+
+def _fixture_key(nsid, params):
+    return nsid + '?' + json.dumps(params, sort_keys=True)
+
+
+def load_fixtures(path):
+    res = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                d = json.loads(line)
+                res[_fixture_key(d['nsid'], d.get('params', {}))] = d['response']
+    return res
+
+
+ROUTES = {
+    'app.bsky.feed.getAuthorFeed': 'get_author_feed',
+    'app.bsky.graph.getFollowers': 'get_followers',
+    'app.bsky.graph.getFollows': 'get_follows',
+    'app.bsky.feed.getLikes': 'get_likes',
+    'app.bsky.actor.getProfile': 'get_profile',
+    'app.bsky.actor.getProfiles': 'get_profiles',
+    'app.bsky.actor.searchActors': 'search_actors',
+    'app.bsky.feed.searchFeedGenerators': 'search_feed_generators',
+    'app.bsky.feed.getActorFeeds': 'get_actor_feeds',
+    'app.bsky.unspecced.getPopularFeedGenerators': 'get_popular_feed_generators',
+    'app.bsky.unspecced.searchPostsSkeleton': 'search_posts_skeleton',
+}
+
+MULTI_PARAMS = {'actors', 'uris'}
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real service
+    disable_nagle_algorithm = True  # headers and body go out in two writes
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        extra = dict(headers or {})
+        if self.state.use_gzip and len(data) >= GZIP_MIN_BYTES and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            data = gzip.compress(data, compresslevel=5)
+            extra['Content-Encoding'] = 'gzip'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        for k, v in extra.items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _session(self):
+        did = _did('bench-account')
+        return {'did': did, 'handle': 'bench.bsky.social', 'email': 'bench@example.com',
+                'accessJwt': _jwt(did, 'com.atproto.access', 7200),
+                'refreshJwt': _jwt(did, 'com.atproto.refresh', 86400 * 60), 'active': True}
+
+    def _handle(self, method):
+        url = urlparse(self.path)
+        nsid = url.path.rsplit('/', 1)[-1]
+        if method == 'POST':
+            length = int(self.headers.get('Content-Length') or 0)
+            if length:
+                self.rfile.read(length)
+        st = self.state
+        st.count(nsid)
+
+        allowed, remaining, reset = st.take()
+        rl_headers = {'RateLimit-Limit': str(st.limit), 'RateLimit-Remaining': str(remaining),
+                      'RateLimit-Reset': str(reset), 'RateLimit-Policy': f'{st.limit};w={st.window}'}
+        if st.latency_ms:
+            time.sleep(random.uniform(1 - JITTER, 1 + JITTER) * st.latency_ms / 1000)
+        if not allowed:
+            return self._send(429, {'error': 'RateLimitExceeded', 'message': 'Rate Limit Exceeded'}, rl_headers)
+        if st.error_rate and random.random() < st.error_rate:
+            with st.lock:
+                st.errors += 1
+            return self._send(502, {'error': 'UpstreamFailure', 'message': 'Upstream Failure'}, rl_headers)
+
+        if nsid in ('com.atproto.server.createSession', 'com.atproto.server.refreshSession'):
+            return self._send(200, self._session(), rl_headers)
+        if nsid == 'com.atproto.server.getSession':
+            s = self._session()
+            return self._send(200, {k: s[k] for k in ('did', 'handle', 'email', 'active')}, rl_headers)
+
+        params = {}
+        for k, v in parse_qs(url.query).items():
+            params[k] = v if k in MULTI_PARAMS else v[-1]
+        recorded = st.fixtures.get(_fixture_key(nsid, params))
+        if recorded is not None:
+            return self._send(200, recorded, rl_headers)
+        if nsid not in ROUTES:
+            return self._send(501, {'error': 'MethodNotImplemented', 'message': f'{nsid} is not served by the mock'}, rl_headers)
+        try:
+            body = getattr(st.data, ROUTES[nsid])(params)
+        except (KeyError, ValueError) as e:
+            return self._send(400, {'error': 'InvalidRequest', 'message': f'bad parameters: {e}'}, rl_headers)
+        return self._send(200, body, rl_headers)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+
+def start_server(port=0, **state_kwargs):
+    """Starts the mock in a background thread. Returns (server, state); server.server_port is the port."""
+    state = MockState(**state_kwargs)
+    handler = type('BoundHandler', (Handler,), {'state': state})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state
+
+
+if __name__ == '__main__':
+    port, kwargs = PORT, {}
+    for i in range(len(sys.argv)):
+        if sys.argv[i] == '--port': port = int(sys.argv[i+1])
+        if sys.argv[i] == '--latency': kwargs['latency_ms'] = float(sys.argv[i+1])
+        if sys.argv[i] == '--limit': kwargs['limit'] = int(sys.argv[i+1])
+        if sys.argv[i] == '--window': kwargs['window'] = int(sys.argv[i+1])
+        if sys.argv[i] == '--error-rate': kwargs['error_rate'] = float(sys.argv[i+1])
+        if sys.argv[i] == '--fixtures': kwargs['fixtures'] = load_fixtures(sys.argv[i+1])
+        if sys.argv[i] == '--no-gzip': kwargs['use_gzip'] = False
+
+    server, state = start_server(port, **kwargs)
+    print(f'Mock AppView on http://127.0.0.1:{server.server_port} (BSKY_BASE_URL for the crawlers)')
+    try:
+        while True:
+            time.sleep(10)
+            print(f'{datetime.datetime.now().strftime("%H:%M:%S")} requests {state.total_requests()} | '
+                  f'429 {state.rate_limited} | 502 {state.errors}')
+    except KeyboardInterrupt:
+        server.shutdown()
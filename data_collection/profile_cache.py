@@ -0,0 +1,211 @@
+# Profile hydration with a persistent cache.
+#
+# hydrate(dids) returns DID -> profile (handle, followers, follows, posts, created_at)
+# for any number of DIDs: profiles already in the cache and younger than TTL_DAYS are
+# read from SQLite, the others are fetched with getProfiles (25 DIDs per request, many
+# requests in flight) and stored. Accounts that getProfiles does not return (deleted,
+# suspended) are cached as missing, so they are not asked again before the TTL either.
+#
+# Usage:
+#   python profile_cache.py hydrate FILE [FILE ...]   (DIDs, one per line; e.g. results/enc_users.txt)
+#   python profile_cache.py export OUT.tsv           (user attribute table of the cached profiles)
+#   python profile_cache.py stats | purge            (purge drops the expired entries)
+
+import asyncio
+import datetime
+import os
+import sqlite3
+import sys
+import time
+
+from atproto import models
+from atproto.exceptions import BadRequestError, RequestException
+from bsky_client import init_async_client
+
+# --- CONFIGURATION ---
+PROFILE_DB = os.environ.get('BSKY_PROFILE_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles.db'))
+TTL_DAYS = 7
+BATCH = 25               # getProfiles limit
+CONCURRENCY = 8          # requests in flight
+MAX_BATCH_ERRORS = 5     # errors before a batch is left uncached
+# ---------------------
+
+FIELDS = ['handle', 'followers', 'follows', 'posts', 'created_at']
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+    did        TEXT PRIMARY KEY,
+    found      INTEGER NOT NULL,   -- 0 = not returned by getProfiles
+    handle     TEXT,
+    followers  INTEGER,
+    follows    INTEGER,
+    posts      INTEGER,
+    created_at TEXT,
+    fetched    REAL NOT NULL
+);
+"""
+
+
+class ProfileCache:
+    """DID -> profile counters, with a time to live."""
+
+    def __init__(self, path=PROFILE_DB, ttl_days=TTL_DAYS):
+        self.path = path
+        self.ttl = ttl_days * 86400
+        self.db = sqlite3.connect(path, timeout=60)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(_SCHEMA)
+
+    def get_many(self, dids):
+        """Fresh cache entries of dids: did -> dict, or None for accounts known to be missing."""
+        res = {}
+        limit = time.time() - self.ttl
+        dids = list(dids)
+        # SQLite limits the number of parameters of a query
+        for i in range(0, len(dids), 500):
+            chunk = dids[i:i + 500]
+            rows = self.db.execute(
+                f'SELECT did, found, {", ".join(FIELDS)} FROM profiles WHERE fetched >= ? AND did IN ({",".join("?" * len(chunk))})',
+                [limit] + chunk)
+            for row in rows:
+                res[row[0]] = dict(zip(FIELDS, row[2:])) if row[1] else None
+        return res
+
+    def put_many(self, profiles, missing=()):
+        """Stores fetched profiles (did -> dict) and the DIDs that were not returned."""
+        now = time.time()
+        with self.db:
+            self.db.executemany(
+                f'INSERT OR REPLACE INTO profiles (did, found, {", ".join(FIELDS)}, fetched) VALUES (?, 1, ?, ?, ?, ?, ?, ?)',
+                [(did, *(p[f] for f in FIELDS), now) for did, p in profiles.items()])
+            self.db.executemany(
+                'INSERT OR REPLACE INTO profiles (did, found, fetched) VALUES (?, 0, ?)', [(did, now) for did in missing])
+
+    def purge(self):
+        with self.db:
+            return self.db.execute('DELETE FROM profiles WHERE fetched < ?', (time.time() - self.ttl,)).rowcount
+
+    def stats(self):
+        limit = time.time() - self.ttl
+        total, found, fresh = self.db.execute(
+            'SELECT COUNT(*), COALESCE(SUM(found), 0), COALESCE(SUM(fetched >= ?), 0) FROM profiles', (limit,)).fetchone()
+        return {'profiles': total, 'found': found, 'missing': total - found, 'fresh': fresh, 'expired': total - fresh}
+
+    def export(self, out):
+        """Writes 'did, handle, followers, follows, posts, created_at' for the accounts found. Returns the rows."""
+        n = 0
+        with open(out, 'w', encoding='utf-8') as f:
+            f.write('did\t' + '\t'.join(FIELDS) + '\n')
+            for row in self.db.execute(f'SELECT did, {", ".join(FIELDS)} FROM profiles WHERE found = 1'):
+                f.write('\t'.join('' if v is None else str(v) for v in row) + '\n')
+                n += 1
+        return n
+
+    def close(self):
+        self.db.close()
+
+
+def _profile(p):
+    return {'handle': p.handle, 'followers': p.followers_count or 0, 'follows': p.follows_count or 0,
+            'posts': p.posts_count or 0, 'created_at': p.created_at}
+
+
+async def _fetch_batch(client, batch):
+    """getProfiles for up to 25 DIDs. Returns (profiles, missing), or None if the batch kept failing."""
+    errors = 0
+    while True:
+        try:
+            res = await client.app.bsky.actor.get_profiles(models.AppBskyActorGetProfiles.Params(actors=batch))
+            break
+        except BadRequestError:
+            # an invalid DID fails the whole batch: fall back to smaller ones
+            if len(batch) == 1:
+                return {}, batch
+            half = len(batch) // 2
+            a, b = await _fetch_batch(client, batch[:half]), await _fetch_batch(client, batch[half:])
+            if a is None or b is None:
+                return None
+            return {**a[0], **b[0]}, a[1] + b[1]
+        except Exception as e:
+            errors += 1
+            if errors > MAX_BATCH_ERRORS:
+                print(f"   {datetime.datetime.now().strftime('%H:%M:%S')} batch left uncached: {e}")
+                return None
+            # after a 429 the governor already waits for the reset
+            if not isinstance(e, RequestException) or e.response is None or e.response.status_code != 429:
+                await asyncio.sleep(min(60, 2 ** errors))
+    profiles = {p.did: _profile(p) for p in res.profiles}
+    return profiles, [d for d in batch if d not in profiles]
+
+
+async def hydrate_async(dids, client=None, cache=None, concurrency=CONCURRENCY, progress=True):
+    """DID -> profile dict (None for missing accounts) for every DID, fetching only what the cache lacks."""
+    own_cache = cache is None
+    cache = cache or ProfileCache()
+    dids = list(dict.fromkeys(dids))
+    res = cache.get_many(dids)
+    todo = [d for d in dids if d not in res]
+    if progress:
+        print(f"Profiles: {len(res)} from the cache, {len(todo)} to fetch")
+    if todo:
+        client = client or await init_async_client()
+        batches = iter([todo[i:i + BATCH] for i in range(0, len(todo), BATCH)])
+        state = {'done': 0, 'last': time.time()}
+
+        async def worker():
+            for batch in batches:
+                fetched = await _fetch_batch(client, batch)
+                if fetched is None:
+                    continue
+                profiles, missing = fetched
+                cache.put_many(profiles, missing)
+                res.update(profiles)
+                res.update((d, None) for d in missing)
+                state['done'] += len(batch)
+                if progress and time.time() - state['last'] > 10:
+                    state['last'] = time.time()
+                    print(f"   {datetime.datetime.now().strftime('%H:%M:%S')} fetched {state['done']}/{len(todo)}")
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    if own_cache:
+        cache.close()
+    return res
+
+
+def hydrate(dids, cache=None, concurrency=CONCURRENCY, progress=True):
+    """Synchronous hydrate_async, for scripts that do not run an event loop."""
+    return asyncio.run(hydrate_async(dids, cache=cache, concurrency=concurrency, progress=progress))
+
+
+def _read_dids(path):
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            # plain DID lists, processed logs ('did\tn') and enc_users.txt ('n did')
+            for token in line.split():
+                if token.startswith('did:'):
+                    yield token
+                    break
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('Usage: python profile_cache.py hydrate FILE [FILE ...] | export OUT.tsv | stats | purge')
+        sys.exit(1)
+
+    command = sys.argv[1]
+    cache = ProfileCache()
+    if command == 'hydrate':
+        start = time.time()
+        dids = [d for path in sys.argv[2:] for d in _read_dids(path)]
+        res = hydrate(dids, cache=cache)
+        print(f'{len(res)} of {len(set(dids))} DIDs hydrated in {time.time() - start:.1f} s')
+    elif command == 'export':
+        print(f'{cache.export(sys.argv[2])} profiles written to {sys.argv[2]}')
+    elif command == 'purge':
+        print(f'{cache.purge()} expired profiles removed')
+    elif command != 'stats':
+        print(f'Unknown command {command}')
+        sys.exit(1)
+
+    print(' | '.join(f'{k}: {v}' for k, v in cache.stats().items()))
+    cache.close()
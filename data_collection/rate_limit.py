@@ -0,0 +1,197 @@
+# Host-wide rate limit governor shared by all the crawler processes.
+#
+# Every crawler (timelines, followers, follows, feed likes, census) logs in with
+# the same account, so they all draw from the same Bluesky rate limit. Instead of
+# each process finding out with a 429 and then stalling until 'RateLimit-Reset',
+# they all take a token from one bucket stored in a small file before each request.
+# The bucket is kept in sync with the 'RateLimit-*' headers of every response.
+
+import json
+import os
+import tempfile
+import time
+import asyncio
+
+from atproto import AsyncClient, Client
+from atproto.exceptions import RequestException
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# --- CONFIGURATION ---
+STATE_FILE = os.environ.get('BSKY_RATE_STATE', os.path.join(tempfile.gettempdir(), 'bsky_rate_limit.json'))
+DEFAULT_LIMIT = 3000   # requests per window (Bluesky default: 3000 every 5 minutes)
+DEFAULT_WINDOW = 300   # seconds
+MAX_SLEEP = 5          # re-check the bucket at least this often while waiting
+# ---------------------
+
+
+def _lock(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+
+
+def _unlock(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _parse_policy(policy):
+    """'3000;w=300' -> (3000, 300)"""
+    try:
+        parts = policy.split(';')
+        limit = int(parts[0])
+        window = DEFAULT_WINDOW
+        for p in parts[1:]:
+            if p.strip().startswith('w='):
+                window = int(p.strip()[2:])
+        return limit, window
+    except (ValueError, AttributeError):
+        return None, None
+
+
+class RateLimitGovernor:
+    """Token bucket kept in STATE_FILE and shared by every process on the host."""
+
+    def __init__(self, path=STATE_FILE, limit=DEFAULT_LIMIT, window=DEFAULT_WINDOW):
+        self.path = path
+        self.default_limit = limit
+        self.default_window = window
+
+    def _update(self, fn):
+        """Runs fn(state, now) under the file lock and writes the state back."""
+        with open(self.path, 'a+', encoding='utf-8') as f:
+            _lock(f)
+            try:
+                f.seek(0)
+                try:
+                    state = json.loads(f.read())
+                except ValueError:
+                    state = {}
+                now = time.time()
+                self._refill(state, now)
+                result = fn(state, now)
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(state))
+                f.flush()
+            finally:
+                _unlock(f)
+        return result
+
+    def _refill(self, state, now):
+        limit = state.setdefault('limit', self.default_limit)
+        window = state.setdefault('window', self.default_window)
+        tokens = state.get('tokens', limit)
+        last = state.get('updated', now)
+        tokens = min(limit, tokens + (now - last) * limit / window)
+        state['tokens'] = tokens
+        state['updated'] = now
+        state.setdefault('blocked_until', 0)
+
+    def _reserve(self, state, now):
+        # The token is taken right away, possibly going below zero: the caller then
+        # waits for its own place in line instead of everybody polling at once.
+        state['tokens'] -= 1
+        wait = max(0, state['blocked_until'] - now)
+        if state['tokens'] < 0:
+            wait = max(wait, -state['tokens'] * state['window'] / state['limit'])
+        return wait
+
+    def _blocked_until(self):
+        return self._update(lambda st, now: st['blocked_until'])
+
+    def acquire(self):
+        """Blocks until this process is allowed to send one request."""
+        deadline = time.time() + self._update(self._reserve)
+        while True:
+            now = time.time()
+            if now >= deadline:
+                # A 429 seen by another process may have pushed the reset further away
+                deadline = self._blocked_until()
+                if deadline <= now:
+                    return
+            time.sleep(min(deadline - now, MAX_SLEEP))
+
+    async def acquire_async(self):
+        deadline = time.time() + self._update(self._reserve)
+        while True:
+            now = time.time()
+            if now >= deadline:
+                deadline = self._blocked_until()
+                if deadline <= now:
+                    return
+            await asyncio.sleep(min(deadline - now, MAX_SLEEP))
+
+    def observe(self, headers, status=None):
+        """Seeds the bucket with the RateLimit-* headers of a response."""
+        if not headers:
+            return
+        headers = {k.lower(): v for k, v in headers.items()}
+        if 'ratelimit-remaining' not in headers and status != 429:
+            return
+
+        def apply(state, now):
+            limit, window = _parse_policy(headers.get('ratelimit-policy'))
+            if limit is None and 'ratelimit-limit' in headers:
+                limit, window = int(headers['ratelimit-limit']), state['window']
+            if limit:
+                state['limit'], state['window'] = limit, window
+            try:
+                remaining = int(headers.get('ratelimit-remaining', 0))
+                reset = int(headers.get('ratelimit-reset', 0))
+            except ValueError:
+                return
+            # Never trust our own bucket more than the server's count
+            state['tokens'] = min(state['tokens'], remaining)
+            if remaining <= 0 or status == 429:
+                state['tokens'] = min(state['tokens'], 0)
+                state['blocked_until'] = max(state['blocked_until'], reset)
+
+        self._update(apply)
+
+
+governor = RateLimitGovernor()
+
+
+def _observe_error(e):
+    response = getattr(e, 'response', None)
+    if response is not None:
+        governor.observe(response.headers, response.status_code)
+
+
+class GovernedClient(Client):
+    """atproto Client that asks the shared governor before every request."""
+
+    def _invoke(self, invoke_type, **kwargs):
+        governor.acquire()
+        try:
+            response = super()._invoke(invoke_type, **kwargs)
+        except RequestException as e:
+            _observe_error(e)
+            raise
+        governor.observe(response.headers)
+        return response
+
+
+class AsyncGovernedClient(AsyncClient):
+    """AsyncClient counterpart of GovernedClient."""
+
+    async def _invoke(self, invoke_type, **kwargs):
+        await governor.acquire_async()
+        try:
+            response = await super()._invoke(invoke_type, **kwargs)
+        except RequestException as e:
+            _observe_error(e)
+            raise
+        governor.observe(response.headers)
+        return response
@@ -0,0 +1,259 @@
+# Shared engine of crawl_followers.py and crawl_follows.py.
+#
+# Follower/follow lists are written to disk page by page instead of being kept in
+# memory, and after every page the cursor of the user is appended to a log, so a crawl
+# that crashed or was rate limited resumes in the middle of the list. Errors are
+# retried (429s wait for the reset) instead of silently truncating the list.
+#
+# Accounts with more than LARGE_AFTER_PAGES pages are moved to a separate 'large'
+# lane, run by its own process with --large, so they do not hold back the small ones.
+#
+# Files (KIND is 'followers' or 'follows'):
+#   KIND_<CHUNK>.txt                 '<user>\t<did> <did> ...', one line per page (join_follower_graph.py merges them)
+#   KIND_large_<CHUNK>.txt           same, written by the large lane
+#   processedKIND[_large]_<CHUNK>.txt  users whose list is complete
+#   largeKIND_<CHUNK>.txt            users handed over to the large lane
+#   cursors_KIND.tsv                 '<user>\t<cursor>\t<pages>' after every page (shared by all chunks and lanes)
+
+import datetime
+import os
+import sys
+import time
+
+from atproto.exceptions import BadRequestError, RequestException
+from bsky_client import init_client
+from work_queue import WorkQueue
+
+# --- CONFIGURATION ---
+SAVE_EVERY_N_USERS = 100     # users per queue commit
+MAX_USER_ERRORS = 10         # consecutive errors before leaving a user for a later run
+LARGE_AFTER_PAGES = 50       # pages of 100 before an account goes to the large lane
+# ----------------------
+
+# kind -> (client method, response field, description)
+RELATIONS = {
+    'followers': ('get_followers', 'followers', 'users that follow the account (Inbound edges)'),
+    'follows': ('get_follows', 'follows', "users the account follows (Outbound edges)"),
+}
+
+DONE, LARGE, ERROR = 'done', 'large', 'error'
+
+
+def _handle_requests_exceptions(e):
+    status = e.response.status_code if e.response is not None else None
+    print(f"   {datetime.datetime.now().strftime('%H:%M:%S')} error {status}")
+    if status == 429:  # too many
+        when = int(e.response.headers.get('RateLimit-Reset', time.time() + 60))
+        time.sleep(max(0, when - time.time()))
+    elif status in {409, 413, 502, 503, 504, None}:  # net error
+        time.sleep(50)
+    else:
+        time.sleep(5)
+
+
+def _read_set(path):
+    if not os.path.exists(path):
+        return set()
+    with open(path, encoding='utf-8') as f:
+        return set(l.strip() for l in f if l.strip())
+
+
+def load_cursors(kind):
+    """Last cursor saved for every user (later lines win)."""
+    res = {}
+    path = f'cursors_{kind}.tsv'
+    if not os.path.exists(path):
+        return res
+    with open(path, encoding='utf-8') as f:
+        for l in f:
+            parts = l.rstrip('\n').split('\t')
+            if len(parts) != 3:
+                continue
+            if parts[1]:
+                res[parts[0]] = (parts[1], int(parts[2]))
+            else:  # list completed: a later crawl starts from the top
+                res.pop(parts[0], None)
+    return res
+
+
+class RelationCrawl:
+    """Streams the follower or follow lists of a list of users to disk."""
+
+    def __init__(self, kind, chunk, large=False, queue=None):
+        self.kind = kind
+        self.method, self.field, _ = RELATIONS[kind]
+        self.chunk = chunk
+        self.large = large
+        self.queue = queue
+        lane = '_large' if large else ''
+        self.out_path = f'{kind}{lane}_{chunk}.txt'
+        self.processed_path = f'processed{kind}{lane}_{chunk}.txt'
+        self.routed_path = f'large{kind}_{chunk}.txt'
+        self.cursor_path = f'cursors_{kind}.tsv'
+        self.cursors = load_cursors(kind)
+
+        self._out = open(self.out_path, 'a', encoding='utf-8')
+        self._cursor_log = open(self.cursor_path, 'a', encoding='utf-8')
+        self._done_batch = []
+        self._large_queue = None
+
+    def pending_users(self, user_list):
+        """Users of user_list not completed yet by this lane (nor, for the normal lane, handed to the large one)."""
+        skip = _read_set(self.processed_path)
+        if not self.large:
+            skip |= _read_set(self.routed_path)
+        return [u for u in user_list if u not in skip]
+
+    def crawl_user(self, client, user):
+        """Downloads the list of `user` from its saved cursor. Returns DONE, LARGE or ERROR."""
+        cursor, pages = self.cursors.get(user, (None, 0))
+        if cursor is not None:
+            print(f'   resuming {user} at page {pages}')
+        errors = 0
+
+        while True:
+            if not self.large and pages >= LARGE_AFTER_PAGES:
+                return LARGE
+            try:
+                fetched = getattr(client, self.method)(actor=user, limit=100, cursor=cursor)
+            except BadRequestError:
+                # deleted / suspended account: nothing more to download
+                return DONE
+            except RequestException as e:
+                errors += 1
+                if errors > MAX_USER_ERRORS:
+                    return ERROR
+                _handle_requests_exceptions(e)
+                continue
+            except Exception as e:
+                errors += 1
+                if errors > MAX_USER_ERRORS:
+                    return ERROR
+                print(f"   {datetime.datetime.now().strftime('%H:%M:%S')} {e}")
+                time.sleep(5)
+                continue
+            errors = 0
+
+            dids = [u.did for u in getattr(fetched, self.field)]  # Always use DID for scientific consistency
+            if dids:
+                self._out.write(f"{user}\t{' '.join(dids)}\n")
+                self._out.flush()
+            pages += 1
+
+            if not fetched.cursor:
+                return DONE
+            # The page is on disk: a restart continues from the next one
+            cursor = fetched.cursor
+            self.cursors[user] = (cursor, pages)
+            self._cursor_log.write(f'{user}\t{cursor}\t{pages}\n')
+            self._cursor_log.flush()
+            if self.queue is not None:
+                self.queue.renew()   # a large account can take longer than a lease
+
+    def _mark(self, user, result):
+        if result == DONE:
+            with open(self.processed_path, 'a', encoding='utf-8') as f:
+                f.write(f'{user}\n')
+            if self.cursors.pop(user, None) is not None:
+                self._cursor_log.write(f'{user}\t\t0\n')
+                self._cursor_log.flush()
+        elif result == LARGE:
+            with open(self.routed_path, 'a', encoding='utf-8') as f:
+                f.write(f'{user}\n')
+            if self.queue is not None:
+                if self._large_queue is None:
+                    self._large_queue = WorkQueue(f'{self.kind}_large', self.queue.path)
+                self._large_queue.enqueue([user])
+
+        if self.queue is not None:
+            self.queue.renew()
+            if result == ERROR:
+                self.queue.fail(user, 'too many errors')
+            else:
+                self._done_batch.append(user)
+                if len(self._done_batch) >= SAVE_EVERY_N_USERS:
+                    self._commit()
+
+    def _commit(self):
+        if self.queue is not None and self._done_batch:
+            self.queue.complete(self._done_batch)
+            print(f'   [SAVED checkpoint at {datetime.datetime.now().strftime("%H:%M:%S")}]')
+        self._done_batch = []
+
+    def run(self, client, users, total='?'):
+        """Crawls users (a list, or an iterator leased from the queue). Returns a count per result."""
+        counts = {DONE: 0, LARGE: 0, ERROR: 0}
+        try:
+            for i, user in enumerate(users):
+                # CLEAN OUTPUT: User X/Total
+                print(f"User {i+1}/{total}")
+                result = self.crawl_user(client, user)
+                self._mark(user, result)
+                counts[result] += 1
+                if result == LARGE:
+                    print(f'   {user} has more than {LARGE_AFTER_PAGES} pages: moved to the large lane')
+                elif result == ERROR:
+                    print(f'   {user} left for a later run (too many errors)')
+        finally:
+            self._commit()
+            self._out.close()
+            self._cursor_log.close()
+        return counts
+
+
+def main(kind):
+    # START TIMER
+    start_run_time = time.time()
+
+    if len(sys.argv) < 2:
+        print(f"Usage: python crawl_{kind}.py <CHUNK_NUMBER> [--queue] [--large]")
+        print(f"       downloads the {RELATIONS[kind][2]}")
+        print("       --queue leases users from the shared work queue (work_queue.py) instead of batch_<CHUNK>.txt")
+        print(f"       --large crawls the accounts handed over to the large lane (large{kind}_<CHUNK>.txt)")
+        return
+
+    CHUNK = sys.argv[1]
+    large = '--large' in sys.argv
+    queue = None
+    if '--queue' in sys.argv:
+        queue = WorkQueue(f'{kind}_large' if large else kind)
+
+    crawl = RelationCrawl(kind, CHUNK, large, queue)
+
+    if queue is not None:
+        user_list = queue.iter_users()
+        total_users = '?'  # unknown: other workers lease from the same queue
+        print(f'Queue mode: {queue.stats()}')
+    else:
+        # Input file is expected to be batch_X.txt (generated by listen.py), or the large lane list
+        input_file = crawl.routed_path if large else f'batch_{CHUNK}.txt'
+        if not os.path.exists(input_file):
+            print(f"Error: Input file '{input_file}' not found.")
+            return
+        with open(input_file, 'r') as f:
+            user_list = [l.strip() for l in f.readlines() if l.strip()]
+        user_list = crawl.pending_users(user_list)
+        total_users = len(user_list)
+
+    client = init_client()
+
+    print(f"Processing {total_users} users for '{kind}'{' (large lane)' if large else ''} collection...")
+    print("-" * 30)
+
+    counts = crawl.run(client, user_list, total_users)
+    n_users = sum(counts.values())
+
+    # STOP TIMER & REPORT
+    end_run_time = time.time()
+    total_duration = end_run_time - start_run_time
+    minutes = total_duration / 60
+
+    print("\n" + "="*50)
+    print(f"                 FINAL REPORT for {kind}")
+    print("="*50)
+    print(f"USERS PROCESSED:      {n_users} (complete {counts[DONE]}, to large lane {counts[LARGE]}, errors {counts[ERROR]})")
+    print(f"TOTAL TIME:           {total_duration:.2f} seconds ({minutes:.2f} minutes)")
+    if n_users > 0:
+        avg = total_duration / n_users
+        print(f"AVERAGE PER USER:     {avg:.2f} seconds")
+    print("="*50 + "\n")
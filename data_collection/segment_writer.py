@@ -0,0 +1,176 @@
+# Long-lived writer for the crawlers' gzip JSONL output.
+#
+# The old loop kept the posts of 100 users in memory and reopened the output file in
+# append mode at every checkpoint, leaving thousands of tiny gzip members. Here one
+# gzip stream stays open and rows are written as soon as a user is done; every
+# COMMIT_EVERY_USERS users the stream is flushed to disk and only then are those users
+# appended to the processed log (group commit). Segments rotate by size or record count.
+#
+#   <folder>/<prefix>-<start>-0001.jsonl.gz.part   segment being written (ignored by clean_data.py)
+#   <folder>/<prefix>-<start>-0001.jsonl.gz        closed segment
+#   <folder>/<prefix>-<start>-0001.jsonl.gz.idx    its block index
+#   <checkpoint>                                   '<user>\t<n>' lines, as before
+#   <folder>/segments.txt                          '<segment>\t<committed records>' after every commit
+#
+# After a crash, the .part files are cut back to their last committed record and closed,
+# so a user is either complete on disk and in the processed log, or in neither.
+#
+# Segments are block-compressed (blockgz.py): every commit ends a block, and a closed
+# segment has a block index (<segment>.idx), so readers can decompress and split it in parallel.
+
+import datetime
+import os
+import zlib
+
+from blockgz import BlockWriter
+
+# --- CONFIGURATION ---
+MAX_SEGMENT_BYTES = 512 * 1024 * 1024   # uncompressed
+MAX_SEGMENT_RECORDS = 1_000_000
+COMMIT_EVERY_USERS = 100
+# ---------------------
+
+PART = '.part'
+
+
+def _read_committed(path):
+    res = {}
+    if not os.path.exists(path):
+        return res
+    with open(path) as f:
+        for line in f:
+            parts = line.rstrip('\n').split('\t')
+            if len(parts) == 2 and parts[1].isdigit():
+                res[parts[0]] = int(parts[1])
+    return res
+
+
+def _read_partial(path):
+    """Decompresses what can be read of an unfinished gzip file (one or more members) and returns its complete lines."""
+    with open(path, 'rb') as f:
+        rest = f.read()
+    data = []
+    while rest:
+        d = zlib.decompressobj(wbits=31)
+        try:
+            data.append(d.decompress(rest))
+        except zlib.error:
+            break
+        if not d.eof:
+            break
+        rest = d.unused_data
+    return b''.join(data).split(b'\n')[:-1]
+
+
+def recover_segments(folder):
+    """Closes the .part segments left by a crashed run, keeping only their committed records."""
+    committed = _read_committed(os.path.join(folder, 'segments.txt'))
+    for name in sorted(os.listdir(folder)):
+        if not name.endswith(PART):
+            continue
+        path = os.path.join(folder, name)
+        final = name[:-len(PART)]
+        n = committed.get(final, 0)
+        if n == 0:
+            os.remove(path)
+            print(f'Removed uncommitted segment {name}')
+            continue
+        lines = _read_partial(path)[:n]
+        f = BlockWriter(os.path.join(folder, final) + '.tmp', index_path=os.path.join(folder, final) + '.idx')
+        for line in lines:
+            f.write(line + b'\n')
+        f.close()
+        os.replace(os.path.join(folder, final) + '.tmp', os.path.join(folder, final))
+        os.remove(path)
+        print(f'Recovered segment {final}: {len(lines)} records')
+
+
+class SegmentWriter:
+    """Streams rows to rotating gzip segments and group-commits the processed log.
+
+    on_commit(users), if given, runs right after the users are written to the processed
+    log (crawl_timelines uses it to write the high-water marks).
+    """
+
+    def __init__(self, folder, checkpoint, prefix='timelines', max_bytes=MAX_SEGMENT_BYTES,
+                 max_records=MAX_SEGMENT_RECORDS, commit_every=COMMIT_EVERY_USERS, on_commit=None):
+        self.folder = folder
+        self.checkpoint = checkpoint
+        self.prefix = prefix
+        self.max_bytes = max_bytes
+        self.max_records = max_records
+        self.commit_every = commit_every
+        self.on_commit = on_commit
+        os.makedirs(folder, exist_ok=True)
+        recover_segments(folder)
+
+        self.stamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+        self.n_segments = 0
+        self._f = None
+        self._name = None
+        self._bytes = 0
+        self._records = 0
+        self._pending = []    # users written but not committed yet
+        self.users_done = 0
+        self.total_records = 0
+
+    def _open(self):
+        self.n_segments += 1
+        self._name = f'{self.prefix}-{self.stamp}-{self.n_segments:04d}.jsonl.gz'
+        self._f = BlockWriter(os.path.join(self.folder, self._name + PART),
+                              index_path=os.path.join(self.folder, self._name + '.idx'))
+        self._bytes = 0
+        self._records = 0
+
+    def write_user(self, user, rows, index=None):
+        """Writes the rows (JSON strings) of one user; the user is committed with the next group.
+
+        index is the number written next to the user in the processed log.
+        """
+        if self._f is None:
+            self._open()
+        # One write per user, so an interrupted run never leaves half a user in the segment
+        lines = [row.encode('utf8') + b'\n' for row in rows]
+        data = b''.join(lines)
+        self._f.write(data)
+        self._bytes += len(data)
+        self._records += len(lines)
+        self.total_records += len(lines)
+        self._pending.append((user, self.users_done if index is None else index))
+        self.users_done += 1
+
+        if self._bytes >= self.max_bytes or self._records >= self.max_records:
+            self.rotate()
+        elif len(self._pending) >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        """Flushes the segment to disk, then records it and the pending users as done."""
+        if self._f is not None:
+            # ends the current block: the committed users are in complete gzip members
+            self._f.flush()
+            os.fsync(self._f.fileno())
+            with open(os.path.join(self.folder, 'segments.txt'), 'a') as f:
+                f.write(f'{self._name}\t{self._records}\n')
+        if not self._pending:
+            return
+        with open(self.checkpoint, 'a') as f:
+            for u, i in self._pending:
+                f.write(f'{u}\t{i}\n')
+        users = [u for u, _ in self._pending]
+        self._pending = []
+        if self.on_commit is not None:
+            self.on_commit(users)
+        print(f'{datetime.datetime.now()} SAVED {self.users_done} ({self._name})')
+
+    def rotate(self):
+        """Commits and closes the current segment; the next write opens a new one."""
+        self.commit()
+        if self._f is None:
+            return
+        self._f.close()
+        os.replace(os.path.join(self.folder, self._name + PART), os.path.join(self.folder, self._name))
+        self._f = None
+
+    def close(self):
+        self.rotate()
@@ -0,0 +1,198 @@
+# SQLite job queue shared by the crawlers.
+#
+# Instead of splitting the users by hand into {CHUNK}.txt / batch_{CHUNK}.txt files,
+# the users are enqueued once per task ('timelines', 'followers', 'follows') and every
+# crawler process leases a few at a time. A lease expires after LEASE_SECONDS, so the
+# users of a worker that died go back to the others; a live worker renews its leases at
+# every checkpoint (renew()), however long a user takes. A user is retried up to
+# MAX_ATTEMPTS times (an expired lease counts as one) and then marked 'failed'. A user
+# enqueued twice is crawled once, and only the worker holding a lease can complete it.
+#
+# Several machines can share the queue through a shared volume: set USE_WAL = False
+# there, since WAL mode needs shared memory and does not work on network file systems.
+#
+# Usage:
+#   python work_queue.py TASK enqueue FILE [FILE ...]   (one DID per line, e.g. 1.txt)
+#   python work_queue.py TASK stats
+#   python work_queue.py TASK retry-failed               (failed -> pending)
+#   python work_queue.py TASK requeue-done               (done -> pending, for a new crawl round)
+#
+# The crawlers read from the queue with --queue, one worker number each (e.g. python crawl_timelines.py 1 --queue).
+
+import os
+import socket
+import sqlite3
+import sys
+import time
+
+# --- CONFIGURATION ---
+QUEUE_DB = os.environ.get('BSKY_QUEUE_DB', 'crawl_queue.db')
+LEASE_SECONDS = 3600
+LEASE_BATCH = 10
+RENEW_EVERY = 300          # seconds between two lease renewals of a worker
+MAX_ATTEMPTS = 3
+USE_WAL = True
+# ---------------------
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    task        TEXT NOT NULL,
+    user        TEXT NOT NULL,
+    status      TEXT NOT NULL DEFAULT 'pending',   -- pending | leased | done | failed
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    lease_until REAL,
+    worker      TEXT,
+    error       TEXT,
+    updated     REAL,
+    PRIMARY KEY (task, user)
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (task, status, lease_until);
+"""
+
+
+def default_worker():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+class WorkQueue:
+    """Users of one task, leased to crawler processes."""
+
+    def __init__(self, task, path=QUEUE_DB, lease_seconds=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS, worker=None):
+        self.task = task
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.worker = worker or default_worker()
+        self._renewed = 0.0
+        self.db = sqlite3.connect(path, timeout=60, isolation_level=None)
+        if USE_WAL:
+            self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.executescript(_SCHEMA)
+
+    def _write(self, sql, rows):
+        """Runs executemany(sql, rows) in its own immediate transaction."""
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            cur = self.db.executemany(sql, rows)
+            self.db.execute('COMMIT')
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+        return cur.rowcount
+
+    def enqueue(self, users):
+        """Adds users as pending; users already in the queue are left as they are. Returns how many were new."""
+        now = time.time()
+        return self._write('INSERT OR IGNORE INTO jobs (task, user, updated) VALUES (?, ?, ?)',
+                           ((self.task, u, now) for u in users))
+
+    def lease(self, n=LEASE_BATCH):
+        """Takes up to n pending users (or users whose lease expired) for this worker."""
+        now = time.time()
+        self.db.execute('BEGIN IMMEDIATE')
+        try:
+            # expired leases that used up their attempts are not given out again
+            self.db.execute(
+                "UPDATE jobs SET status = 'failed', lease_until = NULL, error = 'lease expired', updated = ? "
+                "WHERE task = ? AND status = 'leased' AND lease_until < ? AND attempts >= ?",
+                (now, self.task, now, self.max_attempts))
+            users = [r[0] for r in self.db.execute(
+                "SELECT user FROM jobs WHERE task = ? AND (status = 'pending' OR "
+                "(status = 'leased' AND lease_until < ? AND attempts < ?)) LIMIT ?",
+                (self.task, now, self.max_attempts, n))]
+            self.db.executemany(
+                "UPDATE jobs SET status = 'leased', attempts = attempts + 1, lease_until = ?, worker = ?, updated = ? "
+                "WHERE task = ? AND user = ?",
+                ((now + self.lease_seconds, self.worker, now, self.task, u) for u in users))
+            self.db.execute('COMMIT')
+        except BaseException:
+            self.db.execute('ROLLBACK')
+            raise
+        return users
+
+    def iter_users(self, batch=LEASE_BATCH):
+        """Yields users leasing them batch by batch, until the queue has nothing left for this worker."""
+        while True:
+            users = self.lease(batch)
+            if not users:
+                return
+            yield from users
+
+    def renew(self, force=False):
+        """Extends every lease this worker holds (done but not committed users included).
+
+        Cheap to call at each checkpoint: it writes at most once every RENEW_EVERY seconds.
+        """
+        now = time.time()
+        if not force and now - self._renewed < RENEW_EVERY:
+            return
+        self._renewed = now
+        self._write("UPDATE jobs SET lease_until = ?, updated = ? WHERE task = ? AND status = 'leased' AND worker = ?",
+                    [(now + self.lease_seconds, now, self.task, self.worker)])
+
+    def complete(self, users):
+        """Marks users done; users whose lease went to another worker are left to it."""
+        now = time.time()
+        self._write("UPDATE jobs SET status = 'done', lease_until = NULL, error = NULL, updated = ? "
+                    "WHERE task = ? AND user = ? AND status = 'leased' AND worker = ?",
+                    ((now, self.task, u, self.worker) for u in users))
+
+    def fail(self, user, error=''):
+        """Gives the user back to the queue. Returns False if it ran out of attempts and is now 'failed'."""
+        now = time.time()
+        self._write("UPDATE jobs SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                    "lease_until = NULL, error = ?, updated = ? WHERE task = ? AND user = ? AND status = 'leased' AND worker = ?",
+                    [(self.max_attempts, str(error)[:500], now, self.task, user, self.worker)])
+        row = self.db.execute('SELECT status FROM jobs WHERE task = ? AND user = ?', (self.task, user)).fetchone()
+        return row is not None and row[0] == 'pending'
+
+    def reset(self, from_status):
+        """Puts every user in from_status back to pending with no attempts. Returns how many."""
+        now = time.time()
+        return self._write("UPDATE jobs SET status = 'pending', attempts = 0, lease_until = NULL, updated = ? "
+                           "WHERE task = ? AND status = ?", [(now, self.task, from_status)])
+
+    def stats(self):
+        res = {'pending': 0, 'leased': 0, 'done': 0, 'failed': 0}
+        for status, n in self.db.execute('SELECT status, COUNT(*) FROM jobs WHERE task = ? GROUP BY status', (self.task,)):
+            res[status] = n
+        expired = self.db.execute("SELECT COUNT(*) FROM jobs WHERE task = ? AND status = 'leased' AND lease_until < ?",
+                                  (self.task, time.time())).fetchone()[0]
+        res['expired_leases'] = expired
+        return res
+
+    def close(self):
+        self.db.close()
+
+
+def _read_users(path):
+    with open(path) as f:
+        for line in f:
+            # processed/batch files may carry extra tab separated columns
+            user = line.strip().split('\t')[0]
+            if user:
+                yield user
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print('Usage: python work_queue.py TASK enqueue FILE [FILE ...] | stats | retry-failed | requeue-done')
+        sys.exit(1)
+
+    task, command = sys.argv[1], sys.argv[2]
+    q = WorkQueue(task)
+
+    if command == 'enqueue':
+        for path in sys.argv[3:]:
+            n = q.enqueue(_read_users(path))
+            print(f'{path}: {n} new users')
+    elif command == 'retry-failed':
+        print(f'{q.reset("failed")} failed users back to pending')
+    elif command == 'requeue-done':
+        print(f'{q.reset("done")} done users back to pending')
+    elif command != 'stats':
+        print(f'Unknown command {command}')
+        sys.exit(1)
+
+    print(f'[{task}] ' + ' | '.join(f'{k}: {v}' for k, v in q.stats().items()))
+    q.close()
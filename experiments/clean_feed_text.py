@@ -1,6 +1,5 @@
 import gzip
 import os
-import json
 import sys
 from tqdm import tqdm
 import time
@@ -11,6 +10,9 @@ import nltk
 from nltk.stem import WordNetLemmatizer
 from nltk.corpus import stopwords
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cleaning&processing'))
+from post_store import clean_files, parse_days, pick_base
+
 # --- CONFIGURATION ---
 # Input: Your clean posts (from cleaning&processing)
 BASE_DEFAULT = '../cleaning&processing/results/clean'
@@ -32,19 +34,6 @@ except LookupError:
 STOPWORDS = set(stopwords.words('english'))
 LEMMATIZER = WordNetLemmatizer()
 
-def gzip_iterator(BASE):
-    """Iterates through gzip files in the directory sorted numerically."""
-    if not os.path.exists(BASE): 
-        print(f"Error: Directory {BASE} not found.")
-        return
-    
-    files = sorted([f for f in os.listdir(BASE) if f.endswith('.gz')], 
-                   key=lambda x: int(x.split('.')[0]) if x[0].isdigit() else x)
-    for f in files:
-        f_path = os.path.join(BASE, f)
-        print(f'processing {f_path}...')
-        yield f_path
-
 def clean_text(text):
     """
     Performs deep cleaning on text:
@@ -95,13 +84,16 @@ if __name__ == '__main__':
     
     tick = time.time()
     BASE = BASE_DEFAULT
+    DAYS = None
     OUT = OUT_DEFAULT
 
     # Command line arguments
     for i in range(len(sys.argv)):
         if sys.argv[i] == '-b': BASE = sys.argv[i+1]
         if sys.argv[i] == '-o': OUT = sys.argv[i+1]
+        if sys.argv[i] == '--days': DAYS = parse_days(sys.argv[i+1])   # YYYYMMDD:YYYYMMDD
 
+    BASE = pick_base(BASE)   # its Parquet store, if clean_data.py --parquet wrote it in the same run
     print(f'Processing files in {BASE} -> {OUT}')
     
     if not os.path.exists(os.path.dirname(OUT)):
@@ -109,36 +101,30 @@ if __name__ == '__main__':
 
     # WINDOWS FIX: encoding='utf-8' and mode='wt'
     with gzip.open(OUT, 'wt', encoding='utf-8') as outf:
-        for path in gzip_iterator(BASE):
-            # Use filename as an ID (e.g. "0")
-            file_id = os.path.basename(path).split('.')[0]
-            
-            # WINDOWS FIX: encoding='utf-8' and mode='rt'
-            with gzip.open(path, 'rt', encoding='utf-8') as f:
-                for line in tqdm(f, desc=f"Reading {os.path.basename(path)}"):
-                    try:
-                        d = json.loads(line.strip())
-                        
-                        # 1. Filter English Only
-                        langs = d.get('langs')
-                        is_eng = False
-                        if langs and isinstance(langs, list):
-                            if 'en' in langs or 'eng' in langs:
-                                is_eng = True
-                        
-                        if not is_eng:
-                            continue
-
-                        # 2. Clean Text
-                        raw_text = d.get('text')
-                        cleaned = clean_text(raw_text)
-                        
-                        # Save format: ID, CleanedText
-                        if cleaned:
-                            outf.write(f"{file_id},{cleaned}\n")
-                            
-                    except Exception:
+        # Use the file name as an ID (e.g. "0"), or the day with the Parquet store
+        for file_id, rows in clean_files(BASE, ['langs', 'text'], DAYS):
+            for d in tqdm(rows, desc=f"Reading {file_id}"):
+                try:
+                    # 1. Filter English Only
+                    langs = d.get('langs')
+                    is_eng = False
+                    if langs and isinstance(langs, list):
+                        if 'en' in langs or 'eng' in langs:
+                            is_eng = True
+
+                    if not is_eng:
                         continue
+
+                    # 2. Clean Text
+                    raw_text = d.get('text')
+                    cleaned = clean_text(raw_text)
+
+                    # Save format: ID, CleanedText
+                    if cleaned:
+                        outf.write(f"{file_id},{cleaned}\n")
+
+                except Exception:
+                    continue
     
     tock = time.time()
     print(f'Done. {int(tock-tick)} s')
\ No newline at end of file
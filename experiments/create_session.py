@@ -1,10 +1,14 @@
-from atproto import Client
 import getpass
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data_collection'))
+
+from bsky_client import new_client
 
 def main():
     print("Starting session creation...")
-    client = Client()
+    client = new_client()
     
     # Prompt for credentials
     username = input("USERNAME (e.g. name.bsky.social): ")
@@ -9,105 +9,179 @@ Description:
     2. Feed Likes (like_count)
     3. Creator Followers (followers_count of the user who made the feed)
     
+    Characters are scanned in parallel (paced by the shared rate limit governor),
+    a character stops after STALE_PAGES pages without new feeds, and the feeds found
+    and the cursor of every character are checkpointed every CHECKPOINT_EVERY seconds:
+    an interrupted census resumes where it stopped (--restart starts a new one).
+
     Output: results/feed_stats/bluesky_feed_census.csv
 """
 
+import json
 import os
-import time
 import string
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import pandas as pd
-from atproto import Client
 from tqdm import tqdm
 
+# Shared crawler helpers live in data_collection
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data_collection'))
+from atproto import models
+from atproto.exceptions import BadRequestError, RequestException
+from bsky_client import init_client
+
 # --- CONFIGURATION ---
 OUTPUT_CSV = "results/feed_stats/bluesky_feed_census.csv"
+CHECKPOINT = "results/feed_stats/bluesky_feed_census_checkpoint.json"
 # Search characters: a-z and 0-9
 SEARCH_CHARS = list(string.ascii_lowercase) + list(string.digits)
+MAX_PAGES = 100          # max pages to scan per character
+WORKERS = 8              # characters scanned at the same time (paced by the shared rate limit governor)
+STALE_PAGES = 3          # stop a character after this many pages in a row without new feeds
+MAX_ERRORS = 10          # consecutive errors before leaving a character for a later run
+CHECKPOINT_EVERY = 30    # seconds
 # ----------------------
 
-def get_session():
-    """Retrieves session token from file."""
-    paths = ['session.txt', '../data_collection/session.txt']
-    for p in paths:
-        if os.path.exists(p):
-            with open(p, 'r') as f:
-                return f.read().strip()
-    return None
+
+class Census:
+    """Feeds found so far and the progress of every query, shared by the scanning threads."""
+
+    def __init__(self, path=CHECKPOINT):
+        self.path = path
+        self.lock = threading.Lock()
+        self.feeds = {}    # Key = URI (to handle duplicates)
+        self.queries = {}  # char -> {'cursor', 'pages', 'stale', 'done'}
+        self.last_save = time.time()
+        if os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                state = json.load(f)
+            self.feeds = state['feeds']
+            self.queries = state['queries']
+
+    def query(self, char):
+        with self.lock:
+            return dict(self.queries.get(char, {'cursor': None, 'pages': 0, 'stale': 0, 'done': False}))
+
+    def add_page(self, char, feeds, cursor, done):
+        """Adds the feeds of one page and the new cursor of its query. Returns how many feeds were new."""
+        with self.lock:
+            new = 0
+            for feed in feeds:
+                if feed.uri not in self.feeds:
+                    self.feeds[feed.uri] = extract_data(feed)
+                    new += 1
+            q = self.queries.setdefault(char, {'cursor': None, 'pages': 0, 'stale': 0, 'done': False})
+            q['pages'] += 1
+            q['stale'] = 0 if new else q['stale'] + 1
+            q['cursor'] = cursor
+            q['done'] = done or not cursor or q['pages'] >= MAX_PAGES or q['stale'] >= STALE_PAGES
+            if time.time() - self.last_save >= CHECKPOINT_EVERY:
+                self._save()
+            return new, q['done']
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'feeds': self.feeds, 'queries': self.queries}, f)
+        os.replace(tmp, self.path)
+        self.last_save = time.time()
+
+    def save(self):
+        with self.lock:
+            self._save()
+
+
+def extract_data(feed):
+    # --- DATA EXTRACTION ---
+    # We handle potential None values with 'or 0' or empty strings
+
+    # Extract creator followers safely
+    creator_followers = 0
+    if hasattr(feed, 'creator') and hasattr(feed.creator, 'followers_count'):
+        creator_followers = feed.creator.followers_count or 0
+
+    return {
+        'name': feed.display_name,
+        'creation_date': feed.indexed_at,        # Requested: Data di creazione
+        'feed_likes': feed.like_count or 0,      # Requested: Numero Like Feed
+        'creator_followers': creator_followers,  # Requested: Numero Followers Autore
+        'creator_handle': feed.creator.handle,
+        'uri': feed.uri
+    }
+
+
+def scan_char(client, census, char):
+    """Pages the feed search for one character from its saved cursor. Returns True if the query is finished."""
+    q = census.query(char)
+    cursor, done, errors = q['cursor'], q['done'], 0
+    while not done:
+        try:
+            # NOTE: API limit is max 100 per request.
+            # Feed search is the 'query' parameter of getPopularFeedGenerators
+            # (the SDK has no search_feed_generators method).
+            response = client.app.bsky.unspecced.get_popular_feed_generators(
+                models.AppBskyUnspeccedGetPopularFeedGenerators.Params(query=char, limit=100, cursor=cursor))
+        except BadRequestError:
+            return True
+        except Exception as e:
+            # Retried: the governor already paces requests and waits for the rate limit reset after a 429
+            errors += 1
+            if errors > MAX_ERRORS:
+                print(f"\n   Leaving '{char}' for a later run: {e}")
+                return False
+            if not isinstance(e, RequestException) or e.response is None or e.response.status_code != 429:
+                time.sleep(min(60, 2 ** errors))
+            continue
+        errors = 0
+        _, done = census.add_page(char, response.feeds, response.cursor, not response.feeds)
+        cursor = response.cursor
+    return True
+
 
 def main():
     print("--- BLUESKY FEED CENSUS (EXTENDED METRICS) ---")
-    
-    session = get_session()
-    if not session:
-        print("❌ Session not found. Run create_session.py first.")
-        return
 
-    client = Client()
+    if '--restart' in sys.argv and os.path.exists(CHECKPOINT):
+        os.remove(CHECKPOINT)
+
     try:
-        client.login(session_string=session)
+        client = init_client()
         print("✅ Login successful.")
     except Exception as e:
         print(f"❌ Login failed: {e}")
         return
 
-    unique_feeds = {} # Key = URI (to handle duplicates)
-    
-    print(f"Starting census on {len(SEARCH_CHARS)} characters...")
+    census = Census()
+    todo = [c for c in SEARCH_CHARS if not census.query(c)['done']]
+    if census.feeds:
+        print(f"Resuming from {CHECKPOINT}: {len(census.feeds)} feeds, {len(SEARCH_CHARS) - len(todo)} characters done.")
+
+    print(f"Starting census on {len(todo)} characters ({WORKERS} at a time)...")
     print("Extracting: Creation Date, Like Count, Creator Followers.\n")
 
-    # Progress bar loop
-    for char in tqdm(SEARCH_CHARS, desc="Scanning Alphabet"):
-        cursor = None
-        # Max pages to scan per letter 
-        max_pages = 100 
-        
-        for page in range(max_pages):
-            try:
-                # NOTE: API limit is max 100 per request. 
-                response = client.app.bsky.feed.search_feed_generators({
-                    'q': char,
-                    'limit': 100, 
-                    'cursor': cursor
-                })
-                
-                if not response.feeds:
-                    break
-                
-                for feed in response.feeds:
-                    if feed.uri not in unique_feeds:
-                        # --- DATA EXTRACTION ---
-                        # We handle potential None values with 'or 0' or empty strings
-                        
-                        # Extract creator followers safely
-                        creator_followers = 0
-                        if hasattr(feed, 'creator') and hasattr(feed.creator, 'followers_count'):
-                            creator_followers = feed.creator.followers_count or 0
-
-                        unique_feeds[feed.uri] = {
-                            'name': feed.display_name,
-                            'creation_date': feed.indexed_at,        # Requested: Data di creazione
-                            'feed_likes': feed.like_count or 0,      # Requested: Numero Like Feed
-                            'creator_followers': creator_followers,  # Requested: Numero Followers Autore
-                            'creator_handle': feed.creator.handle,
-                            'uri': feed.uri
-                        }
-                
-                cursor = response.cursor
-                if not cursor:
-                    break
-                
-                # Rate limit politeness
-                time.sleep(0.1)
-                
-            except Exception as e:
-                # Log error but continue to next char/page
-                # print(f"Error on '{char}': {e}")
-                time.sleep(1)
-                continue
+    complete = True
+    try:
+        with ThreadPoolExecutor(WORKERS) as pool:
+            futures = [pool.submit(scan_char, client, census, c) for c in todo]
+            # Progress bar loop
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Scanning Alphabet"):
+                complete &= future.result()
+    finally:
+        census.save()
+
+    unique_feeds = census.feeds
 
     # --- SAVE RESULTS ---
     total_found = len(unique_feeds)
-    print(f"\n✅ CENSUS COMPLETE.")
+    if complete:
+        print(f"\n✅ CENSUS COMPLETE.")
+    else:
+        print(f"\n⚠️ CENSUS INCOMPLETE: run again to finish the remaining characters.")
     print(f"Total Unique Feeds Found: {total_found}")
 
     if total_found > 0:
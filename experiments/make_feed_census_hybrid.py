@@ -9,19 +9,36 @@ Description:
     2. POSTS: Find users talking about feeds (Active Discovery).
     3. ACTORS (New): Find users with tech keywords in their BIO (Silent Discovery).
        (e.g. searching for users with "bot", "dev", "feed" in their profile).
-    4. ENRICHMENT: Fetch accurate follower counts for all identified creators.
+    4. EXTRACTION: Get the feeds of every candidate creator.
+    5. ENRICHMENT: Fetch accurate follower counts for all the creators with feeds.
+    
+    Steps 1-4 run as one async pipeline: the searches (producers) put the creators
+    they find on a queue, deduplicated on the fly, and EXTRACT_WORKERS workers
+    fetch their feeds while the searches are still running. Requests are paced by
+    the shared rate limit governor; per-stage counters are printed at the end.
     
     This creates the largest possible dataset for the thesis.
 """
 
+import asyncio
 import os
 import time
+import sys
 import pandas as pd
-from atproto import Client
-from tqdm import tqdm
+
+# Shared crawler helpers live in data_collection
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data_collection'))
+from atproto import models
+from atproto.exceptions import BadRequestError, RequestException
+from bsky_client import init_async_client
+from profile_cache import hydrate_async
 
 # --- CONFIGURATION ---
 OUTPUT_CSV = "results/feed_stats/bluesky_feed_census_hybrid.csv"
+SEARCH_PAGES = 3         # pages per search keyword
+EXTRACT_WORKERS = 16     # concurrent getActorFeeds
+MAX_ERRORS = 3           # retries of a request before giving up on it
+PROGRESS_EVERY = 10      # seconds
 
 # 1. EXPANDED ACTOR KEYWORDS (Bio Search)
 ACTOR_KEYWORDS = [
@@ -50,138 +67,191 @@ POST_KEYWORDS = [
 ]
 # ---------------------
 
-def get_session():
-    paths = ['session.txt', '../data_collection/session.txt']
-    for p in paths:
-        if os.path.exists(p):
-            with open(p, 'r') as f:
-                return f.read().strip()
-    return None
 
-def batch_get_profiles(client, dids):
-    """Fetches profiles in batches of 25 to get accurate follower counts."""
-    stats = {}
-    # Chunk list into batches of 25 (API limit)
-    chunks = [dids[i:i + 25] for i in range(0, len(dids), 25)]
-    
-    for batch in tqdm(chunks, desc="Enriching Creator Data"):
+class StageStats:
+    """Requests, results, errors and time spent in requests for each stage of the pipeline."""
+
+    def __init__(self):
+        self.stages = {}
+
+    def get(self, stage):
+        return self.stages.setdefault(stage, {'requests': 0, 'items': 0, 'errors': 0, 'seconds': 0.0})
+
+    def report(self, elapsed):
+        lines = [f"{'stage':<12} {'requests':>9} {'items':>8} {'errors':>7} {'req time s':>11} {'req/s':>7}"]
+        for stage, st in self.stages.items():
+            lines.append(f"{stage:<12} {st['requests']:>9} {st['items']:>8} {st['errors']:>7} "
+                         f"{st['seconds']:>11.1f} {st['requests'] / max(elapsed, 1e-9):>7.1f}")
+        return '\n'.join(lines)
+
+
+stats = StageStats()
+
+
+async def call(stage, coro_fn):
+    """Runs a request of `stage`, retrying errors. Returns None if it kept failing or the input was invalid."""
+    st = stats.get(stage)
+    for attempt in range(MAX_ERRORS + 1):
+        start = time.perf_counter()
+        st['requests'] += 1
         try:
-            res = client.app.bsky.actor.get_profiles({'actors': batch})
-            for profile in res.profiles:
-                stats[profile.did] = profile.followers_count or 0
-            time.sleep(0.1) # Rate limit politeness
-        except Exception:
-            continue
-    return stats
+            return await coro_fn()
+        except BadRequestError:
+            st['errors'] += 1
+            return None
+        except Exception as e:
+            st['errors'] += 1
+            # after a 429 the governor already waits for the reset
+            if not isinstance(e, RequestException) or e.response is None or e.response.status_code != 429:
+                await asyncio.sleep(2 ** attempt)
+        finally:
+            st['seconds'] += time.perf_counter() - start
+    return None
 
-def main():
-    print("--- BLUESKY FEED CENSUS (HYBRID STRATEGY + ENRICHMENT) ---")
-    
-    session = get_session()
-    if not session:
-        print("❌ Session not found.")
-        return
 
-    client = Client()
-    try:
-        client.login(session_string=session)
-        print("✅ Login successful.")
-    except Exception as e:
-        print(f"❌ Login failed: {e}")
-        return
+class Census:
+    def __init__(self, client):
+        self.client = client
+        self.unique_feeds = {}        # URI -> Feed Data
+        self.target_creators = set()  # DIDs of potential creators (already queued)
+        self.queue = asyncio.Queue()
 
-    unique_feeds = {}        # URI -> Feed Data
-    target_creators = set()  # DIDs of potential creators
+    def add_creator(self, stage, did):
+        if did not in self.target_creators:
+            self.target_creators.add(did)
+            stats.get(stage)['items'] += 1
+            self.queue.put_nowait(did)
 
-    # --- STEP 1: POPULAR ---
-    print("\n🚀 STEP 1: Harvesting 'Popular' seeds...")
-    try:
-        popular = client.app.bsky.unspecced.get_popular_feed_generators({'limit': 100})
-        for feed in popular.feeds:
-            unique_feeds[feed.uri] = extract_data(feed)
-            target_creators.add(feed.creator.did)
-        print(f"   Found {len(popular.feeds)} popular feeds.")
-    except Exception as e:
-        print(f"   ⚠️ Could not fetch popular: {e}")
+    def add_feeds(self, stage, feeds):
+        for feed in feeds:
+            if feed.uri not in self.unique_feeds:
+                self.unique_feeds[feed.uri] = extract_data(feed)
+                stats.get(stage)['items'] += 1
+
+    # --- PRODUCERS ---
 
-    # --- STEP 2: BIO SEARCH ---
-    print("\n🚀 STEP 2: Searching for 'Silent' Developers (Bio Search)...")
-    for query in tqdm(ACTOR_KEYWORDS, desc="Scanning User Bios"):
+    async def popular(self):
+        res = await call('popular', lambda: self.client.app.bsky.unspecced.get_popular_feed_generators(
+            models.AppBskyUnspeccedGetPopularFeedGenerators.Params(limit=100)))
+        if res is None:
+            print("   ⚠️ Could not fetch popular feeds")
+            return
+        self.add_feeds('popular', res.feeds)
+        for feed in res.feeds:
+            self.add_creator('popular', feed.creator.did)
+
+    async def bio_search(self, query):
         cursor = None
-        for _ in range(3): 
-            try:
-                res = client.app.bsky.actor.search_actors({
-                    'q': query,
-                    'limit': 100,
-                    'cursor': cursor
-                })
-                for actor in res.actors:
-                    target_creators.add(actor.did)
-                
-                cursor = res.cursor
-                if not cursor: break
-                time.sleep(0.2)
-            except Exception as e:
-                break
+        for _ in range(SEARCH_PAGES):
+            res = await call('bio_search', lambda: self.client.app.bsky.actor.search_actors(
+                models.AppBskyActorSearchActors.Params(q=query, limit=100, cursor=cursor)))
+            if res is None:
+                return
+            for actor in res.actors:
+                self.add_creator('bio_search', actor.did)
+            cursor = res.cursor
+            if not cursor:
+                return
 
-    # --- STEP 3: POST SEARCH ---
-    print("\n🚀 STEP 3: Searching for 'Active' Developers (Post Search)...")
-    for query in tqdm(POST_KEYWORDS, desc="Scanning Posts"):
+    async def post_search(self, query):
         cursor = None
-        for _ in range(3):
+        for _ in range(SEARCH_PAGES):
+            res = await call('post_search', lambda: self.client.app.bsky.unspecced.search_posts_skeleton(
+                models.AppBskyUnspeccedSearchPostsSkeleton.Params(q=query, limit=100, cursor=cursor)))
+            if res is None:
+                return
+            for post in res.posts or []:
+                if 'did:' in post.uri:
+                    self.add_creator('post_search', post.uri.split('/')[2])
+            cursor = res.cursor
+            if not cursor:
+                return
+
+    # --- CONSUMERS ---
+
+    async def extract_worker(self):
+        while True:
+            did = await self.queue.get()
             try:
-                res = client.app.bsky.unspecced.search_posts_skeleton({
-                    'q': query,
-                    'limit': 100,
-                    'cursor': cursor
-                })
-                if res.posts:
-                    for post in res.posts:
-                        if 'did:' in post.uri:
-                            did = post.uri.split('/')[2]
-                            target_creators.add(did)
-                
-                cursor = res.cursor
-                if not cursor: break
-                time.sleep(0.2)
+                cursor = None
+                while True:
+                    res = await call('extract', lambda: self.client.app.bsky.feed.get_actor_feeds(
+                        models.AppBskyFeedGetActorFeeds.Params(actor=did, limit=100, cursor=cursor)))
+                    if res is None:
+                        break
+                    self.add_feeds('extract', res.feeds)
+                    cursor = res.cursor
+                    if not cursor or not res.feeds:
+                        break
             except Exception as e:
-                break
+                # a malformed feed view: skip this creator, the worker goes on with the next one
+                stats.get('extract')['errors'] += 1
+                print(f"   ⚠️ Feeds of {did} skipped: {e!r}")
+            finally:
+                self.queue.task_done()
+
+    async def progress(self, start):
+        while True:
+            await asyncio.sleep(PROGRESS_EVERY)
+            print(f"   {time.time() - start:6.0f}s | creators {len(self.target_creators)} | "
+                  f"waiting {self.queue.qsize()} | feeds {len(self.unique_feeds)}")
+
+    async def discover(self):
+        """Steps 1-4: the searches feed the extraction workers until both are done."""
+        start = time.time()
+        workers = [asyncio.create_task(self.extract_worker()) for _ in range(EXTRACT_WORKERS)]
+        reporter = asyncio.create_task(self.progress(start))
+        await asyncio.gather(self.popular(),
+                             *(self.bio_search(q) for q in ACTOR_KEYWORDS),
+                             *(self.post_search(q) for q in POST_KEYWORDS))
+        print(f"\n📊 TARGET LIST: Identified {len(self.target_creators)} potential creators, "
+              f"{self.queue.qsize()} still waiting for feed extraction.")
+        await self.queue.join()
+        for task in workers + [reporter]:
+            task.cancel()
+
+
+async def run():
+    print("--- BLUESKY FEED CENSUS (HYBRID STRATEGY + ENRICHMENT) ---")
     
-    print(f"\n📊 TARGET LIST: Identified {len(target_creators)} potential creators.")
-    print("   Now scanning their profiles for feeds...")
+    try:
+        client = await init_async_client()
+        print("✅ Login successful.")
+    except Exception as e:
+        print(f"❌ Login failed: {e}")
+        return
+
+    start = time.time()
+    census = Census(client)
 
+    # --- STEPS 1-4: DISCOVERY PIPELINE ---
+    print(f"\n🚀 Searching {len(ACTOR_KEYWORDS)} bio keywords and {len(POST_KEYWORDS)} post keywords, "
+          f"extracting feeds with {EXTRACT_WORKERS} workers...")
+    await census.discover()
+    unique_feeds = census.unique_feeds
 
-    # --- STEP 4: ENRICHMENT (Fixing Follower Counts) ---
-    print("\n🚀 STEP 4: Enriching Data (Fetching Real Follower Counts)...")
-    # Identify creators who actually have feeds in our dataset
+    # --- STEP 5: ENRICHMENT (Fixing Follower Counts) ---
+    # After the extraction, so the creators found by the final sweep get their counts too
+    print("\n🚀 STEP 5: Enriching Data (Fetching Real Follower Counts)...")
     # (We don't need to scan creators who turned out to have 0 feeds)
     active_creators_dids = list(set(f['creator_did'] for f in unique_feeds.values()))
     print(f"   Updating stats for {len(active_creators_dids)} active creators...")
-    
-    # Get accurate map: DID -> Followers
-    follower_map = batch_get_profiles(client, active_creators_dids)
-    
+    enrich_start = time.perf_counter()
+    profiles = await hydrate_async(active_creators_dids, client=client)
+    st = stats.get('enrich')
+    st['seconds'] += time.perf_counter() - enrich_start
+    st['items'] += sum(p is not None for p in profiles.values())
+
     # Apply update to the collected feeds
     for uri, data in unique_feeds.items():
-        did = data['creator_did']
-        if did in follower_map:
-            data['creator_followers'] = follower_map[did]
-
-            
-    # --- FINAL SWEEP: EXTRACT FEEDS ---
-    creators_list = list(target_creators)
-    for i, did in enumerate(tqdm(creators_list, desc="Extracting Feeds")):
-        try:
-            actor_feeds = client.app.bsky.feed.get_actor_feeds({
-                'actor': did,
-                'limit': 100
-            })
-            for feed in actor_feeds.feeds:
-                if feed.uri not in unique_feeds:
-                    unique_feeds[feed.uri] = extract_data(feed)
-            time.sleep(0.05) 
-        except Exception as e:
-            continue
+        p = profiles.get(data['creator_did'])
+        if p is not None:
+            data['creator_followers'] = p['followers']
+
+    elapsed = time.time() - start
+    print(f"\n⏱️ Stages ({elapsed:.1f} s in total; request time overlaps between concurrent stages):")
+    print(stats.report(elapsed))
+
     # --- SAVE ---
     total = len(unique_feeds)
     print(f"\n✅ CENSUS COMPLETE.")
@@ -203,9 +273,12 @@ def main():
     else:
         print("No feeds found.")
 
+def main():
+    asyncio.run(run())
+
 def extract_data(feed):
     """Standardizes data extraction"""
-    # Initial follower count might be 0/None, fixed in Step 4
+    # Initial follower count might be 0/None, fixed in Step 5
     creator_followers = 0
     if hasattr(feed, 'creator') and hasattr(feed.creator, 'followers_count'):
         creator_followers = feed.creator.followers_count or 0
@@ -216,10 +289,10 @@ def extract_data(feed):
         'feed_likes': feed.like_count or 0,
         'creator_followers': creator_followers,
         'creator_handle': feed.creator.handle,
-        'creator_did': feed.creator.did, # Crucial for Step 4
+        'creator_did': feed.creator.did, # Crucial for Step 5
         'description': feed.description.replace('\n', ' ') if feed.description else '',
         'uri': feed.uri
     }
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
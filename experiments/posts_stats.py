@@ -1,10 +1,12 @@
 import gzip
 import os
-import json
 import sys
 from tqdm import tqdm
 import time
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cleaning&processing'))
+from post_store import clean_files, parse_days, pick_base
+
 # --- CONFIGURATION ---
 # Path to your clean data (Relative to 'experiments' folder)
 BASE_DEFAULT = '../cleaning&processing/results/clean'
@@ -12,29 +14,20 @@ BASE_DEFAULT = '../cleaning&processing/results/clean'
 OUT_DEFAULT = 'results/post_stats.txt.gz'
 # ---------------------
 
-def gzip_iterator(BASE):
-    if not os.path.exists(BASE): 
-        print(f"Error: Directory {BASE} not found.")
-        return
-    # Sort files numerically
-    files = sorted([f for f in os.listdir(BASE) if f.endswith('.gz')], 
-                   key=lambda x: int(x.split('.')[0]) if x[0].isdigit() else x)
-    for f in files:
-        f_path = os.path.join(BASE, f)
-        print(f'processing {f_path}...')
-        yield f_path
-                    
 if __name__ == '__main__':
     
     tick = time.time()
     BASE = BASE_DEFAULT
+    DAYS = None
     OUT = OUT_DEFAULT
 
     # Command line arguments override
     for i in range(len(sys.argv)):
         if sys.argv[i] == '-b': BASE = sys.argv[i+1]
         if sys.argv[i] == '-o': OUT = sys.argv[i+1]
+        if sys.argv[i] == '--days': DAYS = parse_days(sys.argv[i+1])   # YYYYMMDD:YYYYMMDD
 
+    BASE = pick_base(BASE)   # its Parquet store, if clean_data.py --parquet wrote it in the same run
     print(f'Processing files in {BASE} -> {OUT}')
     
     # Create local results folder if it doesn't exist
@@ -43,22 +36,18 @@ if __name__ == '__main__':
     
     # WINDOWS FIX: encoding='utf-8'
     with gzip.open(OUT, 'wt', encoding='utf-8') as outf:
-        for path in gzip_iterator(BASE):
-            with gzip.open(path, 'rt', encoding='utf-8') as f:
-                for line in tqdm(f, desc=f"Reading {os.path.basename(path)}"):
-                    try:
-                        d = json.loads(line.strip())
-                        post_id = d.get('post_id')
-                        user_id = d.get('user_id')
-                        
-                        # DATE FIX: Convert to string first
-                        t = str(d.get('date'))
-                        if len(t) >= 8:
-                            t_day = t[:8] # YYYYMMDD
-                            
-                            if post_id is not None and user_id is not None:
-                                outf.write(f"{t_day} {post_id} {user_id}\n")
-                    except: continue
+        for name, rows in clean_files(BASE, ['date', 'post_id', 'user_id'], DAYS):
+            for d in tqdm(rows, desc=f"Reading {name}"):
+                post_id = d.get('post_id')
+                user_id = d.get('user_id')
+
+                # DATE FIX: Convert to string first
+                t = str(d.get('date'))
+                if len(t) >= 8:
+                    t_day = t[:8] # YYYYMMDD
+
+                    if post_id is not None and user_id is not None:
+                        outf.write(f"{t_day} {post_id} {user_id}\n")
                     
     tock = time.time()
     print(f'Done. {int(tock-tick)} s')
\ No newline at end of file
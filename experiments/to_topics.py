@@ -1,11 +1,12 @@
-import gzip
 import os
-import json
 import sys
 import datetime
 from tqdm import tqdm
 import time
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cleaning&processing'))
+from post_store import clean_files, parse_days, pick_base
+
 # --- CONFIGURATION ---
 # Input: Your clean data
 BASE_DEFAULT = '../cleaning&processing/results/clean'
@@ -13,34 +14,25 @@ BASE_DEFAULT = '../cleaning&processing/results/clean'
 OUT_DEFAULT = 'results/topics'
 # ---------------------
 
-def gzip_iterator(BASE):
-    if not os.path.exists(BASE): 
-        print(f"Error: Directory {BASE} not found.")
-        return
-    # Sort files numerically
-    files = sorted([f for f in os.listdir(BASE) if f.endswith('.gz')], 
-                   key=lambda x: int(x.split('.')[0]) if x[0].isdigit() else x)
-    for f in files:
-        f_path = os.path.join(BASE, f)
-        print(f'processing {f_path}...')
-        yield f_path
-
 if __name__ == '__main__':
     
     start = time.time()
     
     BASE = BASE_DEFAULT
+    DAYS = None
     OUT = OUT_DEFAULT
 
     # Command line arguments
     for i in range(len(sys.argv)):
         if sys.argv[i] == '-b': BASE = sys.argv[i+1]
         if sys.argv[i] == '-o': OUT = sys.argv[i+1]
+        if sys.argv[i] == '--days': DAYS = parse_days(sys.argv[i+1])   # YYYYMMDD:YYYYMMDD
 
     # Create output directory
     if not os.path.exists(OUT):
         os.makedirs(OUT)
 
+    BASE = pick_base(BASE)   # its Parquet store, if clean_data.py --parquet wrote it in the same run
     print(f'Processing files in {BASE} -> {OUT}')
     
     # Output file for all English posts
@@ -52,34 +44,30 @@ if __name__ == '__main__':
     # WINDOWS FIX: encoding='utf-8'
     with open(out_file_path, 'w', encoding='utf-8') as txt_file:
         
-        for path in gzip_iterator(BASE):
-            # WINDOWS FIX: encoding='utf-8' and mode='rt'
-            with gzip.open(path, 'rt', encoding='utf-8') as f:
-                for line in tqdm(f, desc=f"Reading {os.path.basename(path)}"):
-                    try:
-                        post = json.loads(line.strip())
-                        
-                        # 1. Check Language (English only)
-                        # We use 'langs' list from clean data
-                        langs = post.get('langs')
-                        is_eng = False
-                        if langs and isinstance(langs, list):
-                            # Check for 'en' or 'eng'
-                            if 'en' in langs or 'eng' in langs:
-                                is_eng = True
-                        
-                        if is_eng:
-                            # 2. Extract Text
-                            text = post.get('text', '')
-                            if text:
-                                # Clean newlines/tabs to keep 1 post per line in the txt file
-                                text = text.replace('\n', ' ').replace('\r', ' ').replace('\t', ' ')
-                                txt_file.write(text + '\n')
-                                count += 1
-                                
-                    except Exception as e:
-                        badlines += 1
-                        continue
+        for name, rows in clean_files(BASE, ['langs', 'text'], DAYS):
+            for post in tqdm(rows, desc=f"Reading {name}"):
+                try:
+                    # 1. Check Language (English only)
+                    # We use 'langs' list from clean data
+                    langs = post.get('langs')
+                    is_eng = False
+                    if langs and isinstance(langs, list):
+                        # Check for 'en' or 'eng'
+                        if 'en' in langs or 'eng' in langs:
+                            is_eng = True
+
+                    if is_eng:
+                        # 2. Extract Text
+                        text = post.get('text', '')
+                        if text:
+                            # Clean newlines/tabs to keep 1 post per line in the txt file
+                            text = text.replace('\n', ' ').replace('\r', ' ').replace('\t', ' ')
+                            txt_file.write(text + '\n')
+                            count += 1
+
+                except Exception as e:
+                    badlines += 1
+                    continue
 
     elapsed = time.time() - start
     print(f'Done in {int(elapsed)} s')